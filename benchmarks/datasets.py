@@ -0,0 +1,139 @@
+"""
+Synthetic, Overpass-shaped datasets for the generator benchmarks.
+
+Every dataset is deterministic for a given size and seed and contains roughly *size* elements.
+"""
+import random
+from typing import Dict, List
+
+# Rough bounding box of Germany
+SOUTH, WEST, NORTH, EAST = 47.3, 5.9, 55.0, 15.0
+
+PARKING_LANE_VALUES = ["parallel", "diagonal", "perpendicular", "marked", "no_parking", "no_stopping", "no",
+                       "fire_lane", "separate", "yes"]
+PARKING_POSITIONS = ["on_street", "half_on_kerb", "on_kerb", "painted_area_only", "street_side", "lay_by", "shoulder"]
+PARKING_CONDITIONS = ["free", "ticket", "disc", "residents", "customers", "private", "no_parking", "no_stopping",
+                      "loading", "ticket;residents", "disc;residents"]
+NURSING_HOME_NAMES = ["Seniorenheim Am Park", "Altenpflegeheim St. Anna", "Pflegeheim Sonnenschein",
+                      "Seniorenresidenz Lindenhof", "Haus am See", "Senioren-Wohnpark", "Pflegezentrum Mitte"]
+
+
+def _point(rng: random.Random):
+    return rng.uniform(SOUTH, NORTH), rng.uniform(WEST, EAST)
+
+
+def _line(rng: random.Random, nodes: int) -> List[Dict]:
+    lat, lon = _point(rng)
+    points = []
+    for _ in range(nodes):
+        points.append({"lat": lat, "lon": lon})
+        lat += rng.uniform(-0.0005, 0.0005)
+        lon += rng.uniform(-0.0005, 0.0005)
+    return points
+
+
+def parking_ways(size: int, seed: int = 0) -> List[Dict]:
+    """Ways with old-style parking:lane:* tags as returned by `out geom`."""
+    rng = random.Random(seed)
+    elements = []
+    for i in range(size):
+        tags = {"highway": rng.choice(["residential", "tertiary", "secondary", "service"]), "name": f"Straße {i}"}
+        for side in rng.sample(["left", "right", "both"], rng.randint(1, 2)):
+            value = rng.choice(PARKING_LANE_VALUES)
+            tags[f"parking:lane:{side}"] = value
+            if value in ("parallel", "diagonal", "perpendicular", "marked") and rng.random() < 0.7:
+                tags[f"parking:lane:{side}:{value}"] = rng.choice(PARKING_POSITIONS)
+            if rng.random() < 0.4:
+                tags[f"parking:condition:{side}"] = rng.choice(PARKING_CONDITIONS)
+            if rng.random() < 0.2:
+                tags[f"parking:condition:{side}:maxstay"] = rng.choice(["1 h", "2 h", "30 min"])
+            if rng.random() < 0.2:
+                tags[f"parking:lane:{side}:capacity"] = str(rng.randint(1, 40))
+        elements.append({"type": "way", "id": i + 1, "tags": tags, "geometry": _line(rng, rng.randint(2, 8))})
+    return elements
+
+
+def sign_ways(size: int, seed: int = 0, sign_type: str = "give_way") -> List[Dict]:
+    """
+    highway=give_way / highway=stop nodes with the ways they are on, as returned by `way(bn); (._;>;); out body;`.
+    About every tenth element is a way, the rest are its nodes.
+    """
+    rng = random.Random(seed)
+    elements = []
+    node_id = 1
+    way_id = 1
+    while len(elements) < size:
+        length = rng.randint(3, 12)
+        points = _line(rng, length)
+        node_ids = list(range(node_id, node_id + length))
+        node_id += length
+        sign_index = rng.randint(0, length - 1)
+        for index, (osm_id, point) in enumerate(zip(node_ids, points)):
+            node = {"type": "node", "id": osm_id, "lat": point["lat"], "lon": point["lon"]}
+            if index == sign_index:
+                node["tags"] = {"highway": sign_type}
+            elements.append(node)
+        tags = {"highway": rng.choice(["residential", "unclassified", "service", "track"])}
+        if rng.random() < 0.1:
+            tags["oneway"] = "yes"
+        elements.append({"type": "way", "id": way_id, "nodes": node_ids, "tags": tags})
+        way_id += 1
+    return elements
+
+
+def nursing_homes(size: int, seed: int = 0) -> List[Dict]:
+    """amenity=nursing_home nodes and ways as returned by `out tags center`."""
+    rng = random.Random(seed)
+    elements = []
+    for i in range(size):
+        lat, lon = _point(rng)
+        tags = {"amenity": "nursing_home", "name": rng.choice(NURSING_HOME_NAMES)}
+        if rng.random() < 0.3:
+            tags["website"] = rng.choice(["https://altenpflege-beispiel.de", "https://pflege.example.org"])
+        if rng.random() < 0.5:
+            elements.append({"type": "node", "id": i + 1, "lat": lat, "lon": lon, "tags": tags})
+        else:
+            elements.append({"type": "way", "id": i + 1, "center": {"lat": lat, "lon": lon}, "tags": tags})
+    return elements
+
+
+def stop_areas(size: int, seed: int = 0) -> List[Dict]:
+    """
+    stop_area relations with nearby benches, shelters and waste baskets as returned by `out body geom`.
+    About every tenth element is a stop_area relation.
+    """
+    rng = random.Random(seed)
+    elements = []
+    relation_id = 1
+    object_id = 1
+    while len(elements) < size:
+        lat, lon = _point(rng)
+        members = [{"type": "node", "ref": 10 ** 9 + relation_id, "role": "platform", "lat": lat, "lon": lon}]
+        elements.append({
+            "type": "relation", "id": relation_id,
+            "bounds": {"minlat": lat - 0.0005, "minlon": lon - 0.0005, "maxlat": lat + 0.0005, "maxlon": lon + 0.0005},
+            "members": members,
+            "tags": {"type": "public_transport", "public_transport": "stop_area", "name": f"Haltestelle {relation_id}"},
+        })
+        relation_id += 1
+        for _ in range(9):
+            amenity = rng.choice(["bench", "shelter", "waste_basket"])
+            elements.append({
+                "type": "node", "id": object_id,
+                "lat": lat + rng.uniform(-0.001, 0.001), "lon": lon + rng.uniform(-0.001, 0.001),
+                "tags": {"amenity": amenity},
+            })
+            object_id += 1
+    return elements[:size]
+
+
+def stop_area_relations_api(elements: List[Dict]) -> List[Dict]:
+    """The stop_area relations of a stop_areas() dataset in API 0.6 JSON format, as OscBuilder fetches them."""
+    return [
+        {
+            "type": "relation", "id": e["id"], "version": 1, "changeset": 1,
+            "members": [{"type": m["type"], "ref": m["ref"], "role": m["role"]} for m in e["members"]],
+            "tags": e["tags"],
+        }
+        for e in elements if e["type"] == "relation"
+    ]
@@ -0,0 +1,109 @@
+"""
+The core logic of each challenge generator, run against a synthetic dataset without any network access.
+
+Each benchmark is (dataset factory, challenge directory, run function). The run function gets the
+dataset and the output path, writes the challenge and returns the number of tasks.
+"""
+import os
+import sys
+import json
+import importlib
+
+import datasets
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SHARED_DIR = os.path.join(REPO_ROOT, "shared")
+
+
+def _import(challenge_dir: str, module_name: str, use_shared: bool = True):
+    """Import a challenge script the way it is run: from its own directory, with shared/ on the path."""
+    sys.path.insert(0, os.path.join(REPO_ROOT, "challenges", challenge_dir))
+    if use_shared:
+        sys.path.insert(1, SHARED_DIR)
+    return importlib.import_module(module_name)
+
+
+def _writer(mrcb, output_path, elements):
+    # Benchmarks process every element, so the MapRoulette task cap does not apply
+    return mrcb.ChallengeWriter(output_path, max_tasks=len(elements) + 1)
+
+
+def run_parking(elements, output_path):
+    module = _import("parking_converter", "parking_converter")
+    # The AI stage needs network access and is not part of the benchmark
+    module.aihelper = None
+    with _writer(module.mrcb, output_path, elements) as challenge:
+        for element in elements:
+            task = module.build_task(element)
+            if task is not None:
+                challenge.addTask(task)
+    return challenge.taskCount
+
+
+def run_parking_parallel(elements, output_path):
+    module = _import("parking_converter", "parking_converter")
+    module.aihelper = None
+    with _writer(module.mrcb, output_path, elements) as challenge:
+        module.write_tasks(elements, challenge, os.cpu_count() or 1)
+    return challenge.taskCount
+
+
+def _run_signs(elements, output_path, sign_type):
+    module = _import("stopsign-directions", "directions", use_shared=False)
+    data_handler = module.OSMDataHandler(json.dumps({"elements": elements}))
+    challenge = module.mrcb.Challenge()
+    tasks = 0
+    for data in module.collect_sign_data(data_handler, sign_type):
+        module.addToChallenge(challenge, data)
+        tasks += 1
+    challenge.saveToFile(output_path)
+    return tasks
+
+
+def run_give_way(elements, output_path):
+    return _run_signs(elements, output_path, "give_way")
+
+
+def run_stop(elements, output_path):
+    return _run_signs(elements, output_path, "stop")
+
+
+def _run_per_element(challenge_dir, module_name, elements, output_path):
+    module = _import(challenge_dir, module_name)
+    with _writer(module.mrcb, output_path, elements) as challenge:
+        for element in elements:
+            challenge.addTask(module.build_task(element))
+    return challenge.taskCount
+
+
+def run_amenity_nursing_home(elements, output_path):
+    return _run_per_element("amenity_nursing_home", "amenity_nursing_home", elements, output_path)
+
+
+def run_nursing_home_for(elements, output_path):
+    return _run_per_element("nursing_home_for", "nursing_home_for", elements, output_path)
+
+
+def run_stop_area(elements, output_path):
+    module = _import("add_objects_to_stop_area", "generate")
+    candidate_objects, stop_areas = module.split_elements(elements)
+    grouped = module.group_by_nearest_stop_area(candidate_objects, stop_areas)
+    fetch_helper = module.mrcb.OscBuilder().preload(datasets.stop_area_relations_api(elements))
+    with _writer(module.mrcb, output_path, elements) as challenge:
+        for sa_id, info in grouped.items():
+            # Member geometries come from Overpass in a real run; the benchmark leaves them out
+            task = module.build_task(fetch_helper, sa_id, info, lambda relation_id: [])
+            if task is not None:
+                challenge.addTask(task)
+    return challenge.taskCount
+
+
+BENCHMARKS = {
+    "parking_converter": (datasets.parking_ways, run_parking),
+    "parking_converter_parallel": (datasets.parking_ways, run_parking_parallel),
+    "stopsign_give_way": (lambda size, seed: datasets.sign_ways(size, seed, "give_way"), run_give_way),
+    "stopsign_stop": (lambda size, seed: datasets.sign_ways(size, seed, "stop"), run_stop),
+    "amenity_nursing_home": (datasets.nursing_homes, run_amenity_nursing_home),
+    "nursing_home_for": (datasets.nursing_homes, run_nursing_home_for),
+    "add_objects_to_stop_area": (datasets.stop_areas, run_stop_area),
+}
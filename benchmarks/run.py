@@ -0,0 +1,177 @@
+"""
+End-to-end benchmark of the challenge generators on synthetic data.
+
+Every (generator, size) pair runs in its own process, so peak memory is measured per run and a
+generator that blows up does not take the others with it. No network access is needed.
+
+Usage: python benchmarks/run.py [--generators parking_converter,stopsign_stop] [--sizes 1000,10000]
+                                [--seed 0] [--timeout 1800] [--output results.json] [--baseline old.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import contextlib
+from datetime import datetime, timezone
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARK_DIR)
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+DEFAULT_TIMEOUT = 30 * 60
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MiB, or None if it cannot be measured on this platform."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports KiB, macOS bytes
+        return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / 1024 ** 2
+    except ImportError:
+        return None
+
+
+def run_child(name: str, size: int, seed: int, output_path: str) -> dict:
+    sys.path.insert(0, BENCHMARK_DIR)
+    import generators
+
+    make_dataset, run = generators.BENCHMARKS[name]
+    elements = make_dataset(size, seed)
+    dataset_rss = peak_rss_mb()
+    # Generators report their progress on stdout, which is reserved for the result
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        tasks = run(elements, output_path)
+        seconds = time.perf_counter() - start
+    result = {
+        "elements": len(elements),
+        "tasks": tasks,
+        "seconds": round(seconds, 4),
+        "elements_per_second": round(len(elements) / seconds, 1) if seconds > 0 else None,
+        "dataset_rss_mb": round(dataset_rss, 1) if dataset_rss is not None else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1) if dataset_rss is not None else None,
+        "output_bytes": os.path.getsize(output_path) if os.path.exists(output_path) else 0,
+    }
+    # Generators built on the shared modules also report where the time went
+    instrumentation = sys.modules.get("instrumentation")
+    if instrumentation is not None:
+        report = instrumentation.report()
+        result.update(stages=report["stages"], counters=report["counters"])
+    return result
+
+
+def run_benchmark(name: str, size: int, seed: int, timeout: float, work_dir: str) -> dict:
+    result = {"generator": name, "size": size}
+    output_path = os.path.join(work_dir, f"{name}_{size}.geojson")
+    command = [sys.executable, os.path.abspath(__file__), "--child", name, str(size), str(seed), output_path]
+    try:
+        process = subprocess.run(command, capture_output=True, text=True, timeout=timeout, cwd=work_dir)
+    except subprocess.TimeoutExpired:
+        result.update(status="timeout", error=f"Did not finish within {timeout} seconds")
+        return result
+    finally:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+    if process.returncode != 0:
+        error = process.stderr.strip().splitlines()
+        result.update(status="error", error=error[-1] if error else f"Exit code {process.returncode}")
+        return result
+    result.update(status="ok", **json.loads(process.stdout.strip().splitlines()[-1]))
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, cwd=REPO_ROOT,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(results, baseline=None):
+    previous = {}
+    if baseline:
+        previous = {(r["generator"], r["size"]): r for r in baseline["results"] if r.get("status") == "ok"}
+    print(f"{'generator':<26}{'size':>9}{'seconds':>10}{'elements/s':>13}{'peak MiB':>10}{'tasks':>9}  change")
+    for r in results:
+        if r["status"] != "ok":
+            print(f"{r['generator']:<26}{r['size']:>9}  {r['status']}: {r['error']}")
+            continue
+        change = ""
+        old = previous.get((r["generator"], r["size"]))
+        if old and old.get("seconds"):
+            change = f"{(r['seconds'] - old['seconds']) / old['seconds']:+.0%}"
+        rss = f"{r['peak_rss_mb']:.0f}" if r["peak_rss_mb"] is not None else "-"
+        print(f"{r['generator']:<26}{r['size']:>9}{r['seconds']:>10.2f}{r['elements_per_second'] or 0:>13.0f}"
+              f"{rss:>10}{r['tasks']:>9}  {change}")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "--child":
+        name, size, seed, output_path = argv[1:5]
+        print(json.dumps(run_child(name, int(size), int(seed), output_path)))
+        return 0
+
+    sys.path.insert(0, BENCHMARK_DIR)
+    import generators
+
+    parser = argparse.ArgumentParser(description="Benchmark the challenge generators on synthetic data")
+    parser.add_argument("--generators", default=",".join(generators.BENCHMARKS),
+                        help="comma separated generators to run (default: all)")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES),
+                        help="comma separated dataset sizes in elements")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="seconds allowed per run")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--baseline", help="earlier results file to compare the timings against")
+    args = parser.parse_args(argv)
+
+    names = [n for n in args.generators.split(",") if n]
+    unknown = [n for n in names if n not in generators.BENCHMARKS]
+    if unknown:
+        parser.error(f"Unknown generators: {', '.join(unknown)}")
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+
+    started = datetime.now(timezone.utc)
+    output = args.output or os.path.join(BENCHMARK_DIR, "results", started.strftime("%Y%m%dT%H%M%SZ") + ".json")
+    work_dir = os.path.dirname(os.path.abspath(output))
+    os.makedirs(work_dir, exist_ok=True)
+
+    results = []
+    for name in names:
+        for size in sizes:
+            print(f"Running {name} with {size} elements...", flush=True)
+            results.append(run_benchmark(name, size, args.seed, args.timeout, work_dir))
+
+    report = {
+        "started": started.isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "results": results,
+    }
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_table(results, baseline)
+    print(f"Results written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,23 @@
 import sys
 import math
+import logging
 import random
 import copy
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 from tqdm import tqdm
 
 sys.path.append("../../shared")
 import challenge_builder as mrcb  # noqa: E402
+import instrumentation  # noqa: E402
+import log_config  # noqa: E402
+import query_planner  # noqa: E402
 
+logger = logging.getLogger("add_objects_to_stop_area")
 
-# Area id for Germany to keep the query reasonably sized. Adjust if needed.
-SEARCH_AREA_ID = 3600051477
+
+# Germany is searched state by state; use query_planner.bbox_tiles() or area_tiles() for other regions
+SEARCH_TILES = query_planner.german_state_tiles()
 # Tags that should be added to stop_area relations (extend as needed)
 TARGET_TAG_SETS = [
     {"amenity": "shelter"},
@@ -68,8 +74,7 @@ def build_overpass_query():
 
     return f"""
 [out:json][timeout:180];
-area(id:{SEARCH_AREA_ID})->.searchArea;
-nwr["railway"="station"](area.searchArea)->.stations;
+nwr["railway"="station"]{query_planner.AREA_PLACEHOLDER}->.stations;
 relation["public_transport"="stop_area"](around.stations:{STOP_AREA_AROUND_STATION_RADIUS})->.stop_areas;
 (
 {object_query_block}
@@ -132,12 +137,10 @@ def find_nearest_stop_area(obj, stop_areas):
     return best, best_distance
 
 
-def build_osc_add_members(fetch_helper, relation_cache, objects: List[Dict], stop_area):
+def build_osc_add_members(fetch_helper, objects: List[Dict], stop_area):
     relation_id = stop_area["id"]
 
-    if relation_id not in relation_cache:
-        relation_cache[relation_id] = fetch_helper._fetch_current_element("relation", relation_id)
-    base_relation = relation_cache[relation_id]
+    base_relation = fetch_helper._fetch_current_element("relation", relation_id)
 
     members = list(base_relation.get("members", []))
     updated_members = list(members)
@@ -192,7 +195,7 @@ def build_relation_member_features(overpass_client, relation_id: int) -> List[mr
     try:
         elements = overpass_client.getElementsFromQuery(query)
     except Exception as exc:
-        print(f"[warn] Overpass fetch for members of relation {relation_id} failed: {exc}")
+        logger.warning("Overpass fetch for members of relation %s failed: %s", relation_id, exc)
         return []
 
     nodes = {e["id"]: e for e in elements if e.get("type") == "node"}
@@ -235,17 +238,13 @@ def build_relation_member_features(overpass_client, relation_id: int) -> List[mr
                 )
             )
         except Exception as exc:
-            print(f"[warn] Failed to build feature for {mtype}/{ref} in relation {relation_id}: {exc}")
+            logger.warning("Failed to build feature for %s/%s in relation %s: %s", mtype, ref, relation_id, exc)
             continue
     return member_features
 
 
-def main():
-    op = mrcb.Overpass()
-    print("[main] Running Overpass query...")
-    elements = op.getElementsFromQuery(build_overpass_query())
-    print(f"[main] Retrieved {len(elements)} elements")
-
+def split_elements(elements):
+    """Separate the query result into candidate objects and stop_area relations."""
     candidate_objects = []
     stop_areas = []
     for el in elements:
@@ -254,14 +253,11 @@ def main():
             stop_areas.append(el)
         elif matches_target_tags(tags):
             candidate_objects.append(el)
+    return candidate_objects, stop_areas
 
-    print(f"[main] Candidate objects: {len(candidate_objects)}, stop_area relations: {len(stop_areas)}")
-    random.shuffle(candidate_objects)
-
-    challenge = mrcb.Challenge()
-    fetch_helper = mrcb.OscBuilder()
-    relation_cache = {}
 
+def group_by_nearest_stop_area(candidate_objects, stop_areas):
+    """Map each stop_area ID to the stop_area and the candidate objects for which it is the nearest one."""
     grouped = {}
     for obj in tqdm(candidate_objects):
         nearest_sa, distance = find_nearest_stop_area(obj, stop_areas)
@@ -269,93 +265,133 @@ def main():
             continue
         grouped.setdefault(nearest_sa["id"], {"stop_area": nearest_sa, "objects": []})
         grouped[nearest_sa["id"]]["objects"].append({"element": obj, "distance": distance})
+    return grouped
 
-    for sa_id, info in tqdm(grouped.items(), total=len(grouped)):
-        stop_area = info["stop_area"]
-        objects = info["objects"]
-        try:
-            cooperative_work = build_osc_add_members(
-                fetch_helper,
-                relation_cache,
-                [o["element"] for o in objects],
-                stop_area,
-            )
-        except Exception as exc:
-            print(f"[warn] Could not build OSC for stop_area {sa_id}: {exc}")
-            continue
 
+def build_task(fetch_helper, sa_id, info, load_member_features) -> Optional[mrcb.Task]:
+    """
+    Build the task that adds info["objects"] to the stop_area relation.
+    *load_member_features* returns the member features of a relation ID and is only called once the change could be built.
+    Returns None if no task can be built.
+    """
+    stop_area = info["stop_area"]
+    objects = info["objects"]
+    try:
+        cooperative_work = build_osc_add_members(
+            fetch_helper,
+            [o["element"] for o in objects],
+            stop_area,
+        )
+    except Exception as exc:
+        logger.warning("Could not build OSC for stop_area %s: %s", sa_id, exc)
+        return None
+
+    try:
+        sa_geom = get_geometry(stop_area)
+    except Exception as exc:
+        logger.warning("Could not fetch geometry for stop_area %s: %s", sa_id, exc)
+        return None
+
+    member_features = load_member_features(sa_id)
+    relation_display_geom = member_features[0].geometry if member_features else sa_geom
+
+    object_lines = "\n".join(f"- {describe_object(o['element'])}" for o in objects)
+    task_instruction = (
+        f"Füge alle markierten Objekte (insgesamt {len(objects)}) als letzte Mitglieder "
+        f"zur Stop-Area-Relation {sa_id} hinzu:\n{object_lines}"
+    )
+
+    main_feature = mrcb.GeoFeature.withId(
+        "relation",
+        sa_id,
+        relation_display_geom,
+        properties=apply_style(
+            {
+                "public_transport": "stop_area",
+                "name": stop_area.get("tags", {}).get("name", ""),
+                "task_instruction": task_instruction,
+                "objects_count": len(objects),
+                "target_stop_area": str(sa_id),
+                "tags": stop_area.get("tags", {}),
+            },
+            STOP_AREA_STYLE,
+        ),
+    )
+
+    additional_features = list(member_features)
+    for obj_entry in objects:
+        obj = obj_entry["element"]
+        distance = obj_entry["distance"]
         try:
-            sa_geom = get_geometry(stop_area)
+            obj_geom = get_geometry(obj)
         except Exception as exc:
-            print(f"[warn] Could not fetch geometry for stop_area {sa_id}: {exc}")
+            logger.warning("Could not fetch geometry for %s/%s: %s", obj["type"], obj["id"], exc)
             continue
+        additional_features.append(
+            mrcb.GeoFeature.withId(
+                obj["type"],
+                obj["id"],
+                obj_geom,
+                properties=apply_style(
+                    {
+                        "distance_to_stop_area_m": round(distance) if distance is not None else None,
+                        "matching_tags": describe_object(obj),
+                        "tags": obj.get("tags", {}),
+                        "object_type": obj.get("type"),
+                    },
+                    OBJECT_STYLE,
+                ),
+            )
+        )
 
-        member_features = build_relation_member_features(op, sa_id)
-        relation_display_geom = member_features[0].geometry if member_features else sa_geom
+    if not additional_features:
+        return None
 
-        object_lines = "\n".join(f"- {describe_object(o['element'])}" for o in objects)
-        task_instruction = (
-            f"Füge alle markierten Objekte (insgesamt {len(objects)}) als letzte Mitglieder "
-            f"zur Stop-Area-Relation {sa_id} hinzu:\n{object_lines}"
-        )
+    return mrcb.Task(
+        mainFeature=main_feature,
+        additionalFeatures=additional_features,
+        cooperativeWork=cooperative_work,
+    )
 
-        main_feature = mrcb.GeoFeature.withId(
-            "relation",
-            sa_id,
-            relation_display_geom,
-            properties=apply_style(
-                {
-                    "public_transport": "stop_area",
-                    "name": stop_area.get("tags", {}).get("name", ""),
-                    "task_instruction": task_instruction,
-                    "objects_count": len(objects),
-                    "target_stop_area": str(sa_id),
-                    "tags": stop_area.get("tags", {}),
-                },
-                STOP_AREA_STYLE,
-            ),
-        )
 
-        additional_features = list(member_features)
-        for obj_entry in objects:
-            obj = obj_entry["element"]
-            distance = obj_entry["distance"]
-            try:
-                obj_geom = get_geometry(obj)
-            except Exception as exc:
-                print(f"[warn] Could not fetch geometry for {obj['type']}/{obj['id']}: {exc}")
-                continue
-            additional_features.append(
-                mrcb.GeoFeature.withId(
-                    obj["type"],
-                    obj["id"],
-                    obj_geom,
-                    properties=apply_style(
-                        {
-                            "distance_to_stop_area_m": round(distance) if distance is not None else None,
-                            "matching_tags": describe_object(obj),
-                            "tags": obj.get("tags", {}),
-                            "object_type": obj.get("type"),
-                        },
-                        OBJECT_STYLE,
-                    ),
-                )
-            )
+def main():
+    log_config.setup_logging()
+    op = mrcb.Overpass(cache=mrcb.OverpassCache())
+    logger.info("Running Overpass query...")
+    elements = query_planner.run_tiled_query(build_overpass_query(), SEARCH_TILES, op)
+    logger.info("Retrieved %d elements", len(elements))
 
-        if not additional_features:
-            continue
+    candidate_objects, stop_areas = split_elements(elements)
 
-        challenge.addTask(
-            mrcb.Task(
-                mainFeature=main_feature,
-                additionalFeatures=additional_features,
-                cooperativeWork=cooperative_work,
-            )
-        )
+    logger.info("Candidate objects: %d, stop_area relations: %d", len(candidate_objects), len(stop_areas))
+    random.shuffle(candidate_objects)
+
+    challenge = mrcb.ChallengeWriter(OUTPUT_FILE)
+    fetch_helper = mrcb.OscBuilder()
+
+    with instrumentation.stage("group_by_stop_area"):
+        grouped = group_by_nearest_stop_area(candidate_objects, stop_areas)
+
+    logger.info("Prefetching %d stop_area relations", len(grouped))
+    try:
+        fetch_helper.prefetch("relation", grouped.keys())
+    except ValueError as exc:
+        # The relations are then looked up one by one
+        logger.warning("Prefetching stop_area relations failed: %s", exc)
+
+    for sa_id, info in tqdm(grouped.items(), total=len(grouped)):
+        if challenge.isFull():
+            logger.info("Task limit %d reached, stopping early", challenge.max_tasks)
+            break
+        with instrumentation.stage("build_task"):
+            task = build_task(fetch_helper, sa_id, info, lambda relation_id: build_relation_member_features(op, relation_id))
+        if task is None:
+            instrumentation.count("tasks_skipped")
+            continue
+        challenge.addTask(task)
 
-    challenge.cap()
-    challenge.saveToFile(OUTPUT_FILE)
-    print(f"[main] Saved {len(challenge.tasks)} tasks to {OUTPUT_FILE}")
+    challenge.close()
+    logger.info("Saved %d tasks to %s", challenge.taskCount, OUTPUT_FILE)
 
 
 if __name__ == "__main__":
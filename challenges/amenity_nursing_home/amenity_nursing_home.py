@@ -1,6 +1,8 @@
 import sys
 sys.path.append('../../shared')
 import challenge_builder as mrcb
+import instrumentation
+import log_config
 from tqdm import tqdm
 import random
 
@@ -23,22 +25,15 @@ def checkIsAssistedLiving(tags):
     return False
 
 
-op = mrcb.Overpass()
-
-elements = op.getElementsFromQuery(
-    """
+QUERY = """
 [out:json][timeout:25];
 area(id:3600051477)->.searchArea;
 nwr["amenity"="nursing_home"](area.searchArea);
 out tags center;
-    """
-)
-
-challenge = mrcb.Challenge()
+"""
 
-random.shuffle(elements)
 
-for element in tqdm(elements):
+def build_task(element):
     isForSeniors = checkIsForSeniors(element["tags"])
     isAssistedLiving = checkIsAssistedLiving(element["tags"])
     geom = mrcb.getElementCenterPoint(element)
@@ -66,11 +61,28 @@ for element in tqdm(elements):
             element["id"],
             {"amenity":"social_facility", "social_facility":"nursing_home"}
         )
-    t = mrcb.Task(
+    return mrcb.Task(
         mainFeature,
         additionalFeatures=[],
         cooperativeWork=cooperativeWork
     )
-    challenge.addTask(t)
 
-challenge.saveToFile("amenity_nursing_home.json")
+
+def main():
+    log_config.setup_logging()
+    op = mrcb.Overpass(cache=mrcb.OverpassCache())
+    elements = op.getElementsFromQuery(QUERY)
+
+    challenge = mrcb.Challenge()
+
+    random.shuffle(elements)
+
+    with instrumentation.stage("build_tasks"):
+        for element in tqdm(elements):
+            challenge.addTask(build_task(element))
+
+    challenge.saveToFile("amenity_nursing_home.json")
+
+
+if __name__ == "__main__":
+    main()
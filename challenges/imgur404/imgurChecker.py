@@ -0,0 +1,109 @@
+import os
+import sys
+import json
+import time
+import logging
+import threading
+from typing import Dict, Iterable, Optional
+
+sys.path.append('../../shared')
+import challenge_builder as mrcb
+
+logger = logging.getLogger("imgur404.imgurChecker")
+
+# Persistent availability results, keyed by imgur ID: {"<id>": {"dead": bool, "checked": <unix time>}}
+STATUS_CACHE_FILE = 'imgur_status.json'
+# How long a result is trusted before the link is checked again
+ALIVE_TTL = 7 * 24 * 60 * 60
+DEAD_TTL = 365 * 24 * 60 * 60
+# Parallel oEmbed requests and minimum spacing between two requests to imgur
+CHECK_CONCURRENCY = 8
+CHECK_MIN_INTERVAL = 0.2
+# Persist the cache after this many new results
+SAVE_INTERVAL = 100
+OEMBED_URL = "https://api.imgur.com/oembed.json?url=https://imgur.com/{}"
+
+
+class ImgurAvailabilityChecker:
+    """
+    Checks whether imgur images are still available using the oEmbed API.
+    Results are cached on disk per imgur ID with separate TTLs for alive and dead images,
+    and many IDs can be checked up front with prefetch().
+    """
+    def __init__(self, cache_file: str = STATUS_CACHE_FILE, alive_ttl: float = ALIVE_TTL,
+                 dead_ttl: float = DEAD_TTL, http: Optional[mrcb.HttpClient] = None):
+        self.cache_file = cache_file
+        self.alive_ttl = alive_ttl
+        self.dead_ttl = dead_ttl
+        self.http = http or mrcb.HttpClient(max_concurrency=CHECK_CONCURRENCY, min_interval=CHECK_MIN_INTERVAL)
+        self._lock = threading.Lock()
+        self._unsaved = 0
+        self.cache: Dict[str, Dict] = self._load()
+
+    def _load(self) -> Dict[str, Dict]:
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def save(self):
+        with self._lock:
+            tmp_file = self.cache_file + ".tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(self.cache, f)
+            os.replace(tmp_file, self.cache_file)
+            self._unsaved = 0
+
+    def cached_status(self, imgur_id: str) -> Optional[bool]:
+        """Return True/False for a cached, still valid result and None if the ID has to be checked."""
+        entry = self.cache.get(imgur_id)
+        if entry is None:
+            return None
+        ttl = self.dead_ttl if entry["dead"] else self.alive_ttl
+        if time.time() - entry["checked"] > ttl:
+            return None
+        return entry["dead"]
+
+    def _check_remote(self, imgur_id: str) -> bool:
+        # The oEmbed API returns a 200 if the image is available and a 403 if it is not.
+        # A valid (available) image returns something like this: {"version":"1.0","type":"rich","provider_name":"Imgur",...}
+        # An invalid (unavailable) image returns something like this: {"data":{"error":"Invalid URL - forbidden","request":"\/oembed.json","method":"GET"},"success":false,"status":403}
+        response = self.http.get(OEMBED_URL.format(imgur_id))
+        if response.status_code == 200:
+            return False
+        elif response.status_code == 403:
+            return True
+        raise ValueError("Error while checking imgur id: ", imgur_id, response.status_code, response.text)
+
+    def _store(self, imgur_id: str, dead: bool):
+        with self._lock:
+            self.cache[imgur_id] = {"dead": dead, "checked": time.time()}
+            self._unsaved += 1
+            save_now = self._unsaved >= SAVE_INTERVAL
+        if save_now:
+            self.save()
+
+    def is_dead(self, imgur_id: str) -> bool:
+        dead = self.cached_status(imgur_id)
+        if dead is None:
+            dead = self._check_remote(imgur_id)
+            self._store(imgur_id, dead)
+        return dead
+
+    def prefetch(self, imgur_ids: Iterable[str]):
+        """
+        Check all given IDs that have no valid cached result, in parallel.
+        Failed checks are skipped here; is_dead() retries them and raises if they fail again.
+        """
+        pending = sorted({imgur_id for imgur_id in imgur_ids if self.cached_status(imgur_id) is None})
+        logger.info("Checking %d imgur IDs without a cached result", len(pending))
+
+        def check(imgur_id):
+            try:
+                self._store(imgur_id, self._check_remote(imgur_id))
+            except Exception as exc:
+                logger.warning("Could not check imgur id %s: %s", imgur_id, exc)
+
+        self.http.map(check, pending)
+        self.save()
@@ -3,15 +3,20 @@ from time import sleep
 import random
 import sys
 import os
+import logging
 sys.path.append('../../shared')
 import challenge_builder as mrcb
+import osm_history
+import history_store
+import instrumentation
+import log_config
 try:
     from tqdm import tqdm
 except ImportError:
     def tqdm(x, *args, **kwargs):
         return x
 
-import bs4, re
+import re
 
 import valueFinder as vf
 import json
@@ -19,35 +24,61 @@ import json
 import base64
 
 import appStrings
+import imgurChecker
+
+logger = logging.getLogger("imgur404")
+
+
+# When True, a run that crashed is continued where it stopped instead of starting over.
+# The checkpoint files are removed after a run completes, so the next run always starts fresh.
+RESUME = True
+# Rewrite user_reports.json and the per-user reports after this many checked elements
+REPORT_FLUSH_INTERVAL = 200
+CHALLENGE_FILE = "imgur404.json"
+# One "type/id" line per element that has been checked completely
+CHECKPOINT_FILE = "imgur404_checked.txt"
+# One JSON line per attributed edit; user_reports.json is rebuilt from it
+USER_EDITS_LOG = "user_edits.jsonl"
+USER_REPORTS_DIR = "user_reports"
+
+
+_checker = None
+
+
+def get_imgur_checker() -> imgurChecker.ImgurAvailabilityChecker:
+    global _checker
+    if _checker is None:
+        _checker = imgurChecker.ImgurAvailabilityChecker()
+    return _checker
 
 
 def check_imgur_404(link: str) -> bool:
-    print("Checking imgur link: ", link)
+    logger.debug("Checking imgur link: %s", link)
     # Checking a link for if the image is not available anymore
     # We can do this by using the imgur oembed API, which returns a 200 if the image is available and a 403 if it is not.
     # For that, we check https://api.imgur.com/oembed.json?url=https://imgur.com/[image_id]
     # We need to extract the image id from the link, which is the part between the last / and the .jpg, or, if there is no .jpg, after the last /
+    # Results are cached per image id (see imgurChecker), so reruns and duplicate links don't hit the API again
 
     imgur_link = extract_imgur_id_from_link(link)
     if imgur_link is None:
         raise ValueError("No imgur link found in the string")
-    # Get the api for that id
-    api_url = f"https://api.imgur.com/oembed.json?url=https://imgur.com/{imgur_link}"
-    # this url return json.
-    # A valid (available) image returns something like this: {"version":"1.0","type":"rich","provider_name":"Imgur","provider_url":"https:\/\/imgur.com","width":540,"height":500,"html":"<blockquote class=\"imgur-embed-pub\" lang=\"en\" data-id=\"O14zPtk\"><a href=\"https:\/\/imgur.com\/O14zPtk\">turnstile<\/a><\/blockquote><script async src=\"\/\/s.imgur.com\/min\/embed.js\" charset=\"utf-8\"><\/script>"}
-    # An invalid (unavailable) image returns something like this: {"data":{"error":"Invalid URL - forbidden","request":"\/oembed.json","method":"GET"},"success":false,"status":403}
-
-    response = requests.get(api_url)
-    if response.status_code == 200:
-        # The image is available
-        print("Image is available")
-        return False
-    elif response.status_code == 403:
-        # The image is not available
-        print("Image is not available")
-        return True
-    else:
-        raise ValueError("Error while checking imgur link: ", link, response.status_code, response.text)
+    dead = get_imgur_checker().is_dead(imgur_link)
+    logger.debug("Image %s is %s", imgur_link, "not available" if dead else "available")
+    return dead
+
+
+def collect_imgur_ids(elements) -> set:
+    """Collect the imgur ids of all imgur links in the tags of the elements."""
+    imgur_ids = set()
+    for element in elements:
+        for tag_value in element["tags"].values():
+            if isinstance(tag_value, str) and "i.imgur.com" in tag_value:
+                try:
+                    imgur_ids.add(extract_imgur_id_from_link(extract_imgur_link_from_string(tag_value)))
+                except ValueError:
+                    continue
+    return imgur_ids
 
 
 def extract_imgur_link_from_string(string: str) -> str:
@@ -69,7 +100,6 @@ def extract_imgur_link_from_string(string: str) -> str:
             return "https://" + match.group(0)
         else:
             # return None if no link is found
-            print("No imgur link found in string: ", string)
             raise ValueError("No imgur link found in string: ", string)
             return None
 
@@ -87,55 +117,29 @@ def extract_imgur_id_from_link(link: str) -> str:
         return link.split("/")[-1]
 
 
-def get_osm_history(osmtype: str, osmid: int) -> list:
-    """Fetch full history of an OSM element"""
-    base_url = "https://api.openstreetmap.org/api/0.6"
-    url = f"{base_url}/{osmtype}/{osmid}/history"
-    response = requests.get(url)
-    if response.status_code != 200:
-        print(f"Failed to get history for {osmtype}/{osmid}")
-        return []
-    return response.text
-
-def find_tag_setter(osmtype: str, osmid: int, key: str, value: str) -> tuple:
+def find_tag_setter(osmtype: str, osmid: int, key: str, value: str, current_version: int = None) -> tuple:
     """
-    Find who set a specific tag value and in which version.
-    Returns (username, version) or (None, None) if not found.
+    Find who set a specific tag value, in which version and when.
+    A copy in the shared history store that covers *current_version* is used if there is one. Otherwise the
+    XML history is streamed and the download stops at the version that introduced the tag, so long histories
+    are neither held in memory nor downloaded completely.
+    Returns (username, version, timestamp) or (None, None, None) if not found.
     """
-    history_xml = get_osm_history(osmtype, osmid)
-    if not history_xml:
-        return None, None
-    
-    soup = bs4.BeautifulSoup(history_xml, "xml")
-    elements = soup.find_all(osmtype)
-    
-    # Go through versions in reverse to find when the tag was set
-    for element in elements:
-        version = int(element.get("version"))
-        username = element.get("user")
-        tags = element.find_all("tag")
-        
-        # Check if this version has our tag with the value
-        for tag in tags:
-            if tag.get("k") == key and tag.get("v") == value:
-                return username, version
-                
-        # If we find a version where the tag doesn't exist or has different value,
-        # then the next newer version (which we already checked) must have set it
-        for tag in tags:
-            if tag.get("k") == key and tag.get("v") != value:
-                break
-        else:
-            # Tag not found in this version, so if we found it in a newer version,
-            # that newer version must have set it
-            continue
-            
-    return None, None
+    store = history_store.get_history_store()
+    versions = store.get_stored_history(osmtype, osmid, current_version)
+    if versions is not None:
+        setter = osm_history.find_tag_introduction(versions, key, value)
+    else:
+        setter = osm_history.fetch_tag_setter(osmtype, osmid, key, value, http=store.http)
+    if setter is None:
+        return None, None, None
+    return setter.user, setter.version, setter.timestamp
 
-def create_user_reports(user_edits):
-        # Create per-user files
-        for username, edits in user_edits.items():
-            filename = os.path.join("user_reports", f"{username}.txt")
+def create_user_reports(user_edits, usernames=None):
+        # Create per-user files (only for *usernames* if given)
+        for username in (usernames if usernames is not None else user_edits.keys()):
+            edits = user_edits[username]
+            filename = os.path.join(USER_REPORTS_DIR, f"{username}.txt")
             with open(filename, 'w', encoding='utf-8') as f:
                 f.write(str(appStrings.USER_REPORT_MESSAGE_START_DE))
                 for edit in edits:
@@ -152,89 +156,149 @@ def create_user_reports(user_edits):
                 f.write(str(appStrings.USER_REPORT_MESSAGE_END_EN))
 
 
-if __name__ == "__main__":
-    # Load the elements from the JSON file matches.json
-    
-    vf.main()
-    with open("matches.json", "r", encoding='utf-8') as f:
-           elements = json.load(f)
-    # Load the user reports from the JSON file user_reports.json
-    #try:
-    #    with open("user_reports.json", "r", encoding='utf-8') as f:
-    #        user_reports = json.load(f)
-    #except FileNotFoundError:
-    user_reports = {}
+def flush_user_reports(user_edits, dirty_usernames):
+    # Rewrite the aggregated report and only the per-user files that changed since the last flush
+    with open("user_reports.json", "w", encoding='utf-8') as f:
+        json.dump(user_edits, f, indent=2, ensure_ascii=False)
+    os.makedirs(USER_REPORTS_DIR, exist_ok=True)
+    create_user_reports(user_edits, dirty_usernames)
+    dirty_usernames.clear()
+
+
+def reset_checkpoints():
+    for filename in (CHALLENGE_FILE, CHECKPOINT_FILE, USER_EDITS_LOG, "user_reports.json"):
+        if os.path.exists(filename):
+            os.remove(filename)
     # Delete the content of the user_reports/ directory
     try:
-        for filename in os.listdir("user_reports/"):
-            os.remove(os.path.join("user_reports/", filename))
+        for filename in os.listdir(USER_REPORTS_DIR):
+            os.remove(os.path.join(USER_REPORTS_DIR, filename))
     except FileNotFoundError:
         pass
-    
-    # Dictionary to store user -> list of edits
+
+
+def load_checked_elements() -> set:
+    try:
+        with open(CHECKPOINT_FILE, "r", encoding='utf-8') as f:
+            return {line.strip() for line in f if line.strip()}
+    except FileNotFoundError:
+        return set()
+
+
+def load_user_edits() -> dict:
     user_edits = {}
+    try:
+        with open(USER_EDITS_LOG, "r", encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Incomplete last line of a crashed run
+                    continue
+                username = entry.pop("user")
+                edits = user_edits.setdefault(username, [])
+                if entry not in edits:
+                    edits.append(entry)
+    except FileNotFoundError:
+        pass
+    return user_edits
 
-    challenge = mrcb.Challenge()
+
+if __name__ == "__main__":
+    log_config.setup_logging()
+    # Load the elements from the newline-delimited matches file
+    vf.main()
+    elements = list(vf.iter_matches(vf.MATCHES_FILE, label="imgur"))
+
+    if not RESUME or not os.path.exists(CHECKPOINT_FILE):
+        reset_checkpoints()
+
+    # Dictionary to store user -> list of edits
+    user_edits = load_user_edits()
+    dirty_usernames = set(user_edits.keys())
+
+    challenge = mrcb.ChallengeWriter(CHALLENGE_FILE, append=True)
+    checked_elements = load_checked_elements() | challenge.existingIds
     random.shuffle(elements)
 
-    for element in tqdm(elements):
-        print("Checking element: ", element["type"], "/", element["id"])
-        tagChanges = {}
-        offendingKeyValues = {}
-        # Check all tags for imgur URLs
-        for tag_key, tag_value in element["tags"].items():
-            if isinstance(tag_value, str) and "i.imgur.com" in tag_value:
-                imgur_link = extract_imgur_link_from_string(tag_value)
-                if check_imgur_404(imgur_link):
-                    tagChanges[tag_key] = None
-                    offendingKeyValues[tag_key] = tag_value
-                    print(f"Found 404 imgur link in tag: {tag_key}")
-                    
-                    # Find who set this tag
-                    username, version = find_tag_setter(element["type"], element["id"], tag_key, tag_value)
-                    if username:
-                        if username not in user_edits:
-                            user_edits[username] = []
-                        # Store the relevant edit with all relevant info
-                        user_edits[username].append({
-                            'type': element["type"],
-                            'id': element["id"],
-                            'version': version,
-                            'key': tag_key,
-                            'value': tag_value
-                        })
-                        # Save the user_edits to a file
-                        with open("user_reports.json", "w", encoding='utf-8') as f:
-                            json.dump(user_edits, f, indent=2, ensure_ascii=False)
-                    else:
-                        print(f"Could not find who set the tag {tag_key} for {element['type']}/{element['id']}")
-        
-        # Only create a task if we found tags to change
-        if tagChanges:
-            # Create a list of the keys and values to be changed, format the links as Reachable links, start every row with a dash and end it with a newline
-            linkList = "\n".join([f"- {key}: {value}" for key, value in offendingKeyValues.items()])
-            fullTagTable = mrcb.TagsAsMdTable(element["tags"])
-            geom = mrcb.getElementCenterPoint(element)
-            mainFeature = mrcb.GeoFeature.withId(
-                element["type"],
-                element["id"],
-                geom,
-                properties={"linkList": linkList, "fullTagTable": fullTagTable}
-            )
-            cooperativeWork = mrcb.TagFix(
-                element["type"],
-                element["id"],
-                tagChanges
-            )
-            t = mrcb.Task(
-                mainFeature,
-                additionalFeatures=[],
-                cooperativeWork=cooperativeWork
-            )
-            challenge.addTask(t)
-            challenge.saveToFile("imgur404.json")
-    
-        # Create output directory if it doesn't exist
-        os.makedirs("user_reports", exist_ok=True)
-        
-        create_user_reports(user_edits)
+    # Check all links up front in parallel; the loop below is then served from the cache
+    with instrumentation.stage("imgur_prefetch"):
+        get_imgur_checker().prefetch(collect_imgur_ids(
+            element for element in elements if f"{element['type']}/{element['id']}" not in checked_elements
+        ))
+
+    with instrumentation.stage("check_elements"), \
+            open(CHECKPOINT_FILE, "a", encoding='utf-8') as checkpoint, open(USER_EDITS_LOG, "a", encoding='utf-8') as edits_log:
+        for element in tqdm(elements):
+            element_key = f"{element['type']}/{element['id']}"
+            if element_key in checked_elements:
+                instrumentation.count("elements_already_checked")
+                continue
+            logger.debug("Checking element %s", element_key)
+            tagChanges = {}
+            offendingKeyValues = {}
+            # Check all tags for imgur URLs
+            for tag_key, tag_value in element["tags"].items():
+                if isinstance(tag_value, str) and "i.imgur.com" in tag_value:
+                    imgur_link = extract_imgur_link_from_string(tag_value)
+                    if check_imgur_404(imgur_link):
+                        tagChanges[tag_key] = None
+                        offendingKeyValues[tag_key] = tag_value
+                        logger.debug("Found 404 imgur link in tag %s of %s", tag_key, element_key)
+                        
+                        # Find who set this tag
+                        username, version, timestamp = find_tag_setter(element["type"], element["id"], tag_key, tag_value, element.get("version"))
+                        if username:
+                            # Store the relevant edit with all relevant info
+                            edit = {
+                                'type': element["type"],
+                                'id': element["id"],
+                                'version': version,
+                                'timestamp': timestamp,
+                                'key': tag_key,
+                                'value': tag_value
+                            }
+                            user_edits.setdefault(username, []).append(edit)
+                            dirty_usernames.add(username)
+                            # Append the edit to the log so that a resumed run still knows about it
+                            edits_log.write(json.dumps({"user": username, **edit}, ensure_ascii=False) + "\n")
+                            edits_log.flush()
+                        else:
+                            logger.warning("Could not find who set the tag %s for %s", tag_key, element_key)
+            
+            # Only create a task if we found tags to change
+            if tagChanges:
+                # Create a list of the keys and values to be changed, format the links as Reachable links, start every row with a dash and end it with a newline
+                linkList = "\n".join([f"- {key}: {value}" for key, value in offendingKeyValues.items()])
+                fullTagTable = mrcb.TagsAsMdTable(element["tags"])
+                geom = mrcb.getElementCenterPoint(element)
+                mainFeature = mrcb.GeoFeature.withId(
+                    element["type"],
+                    element["id"],
+                    geom,
+                    properties={"linkList": linkList, "fullTagTable": fullTagTable}
+                )
+                cooperativeWork = mrcb.TagFix(
+                    element["type"],
+                    element["id"],
+                    tagChanges
+                )
+                t = mrcb.Task(
+                    mainFeature,
+                    additionalFeatures=[],
+                    cooperativeWork=cooperativeWork
+                )
+                challenge.addTask(t)
+
+            checkpoint.write(element_key + "\n")
+            checkpoint.flush()
+            checked_elements.add(element_key)
+            if len(checked_elements) % REPORT_FLUSH_INTERVAL == 0:
+                flush_user_reports(user_edits, dirty_usernames)
+
+    challenge.close()
+    get_imgur_checker().save()
+    flush_user_reports(user_edits, dirty_usernames)
+    # The run is complete, nothing to resume from anymore
+    os.remove(CHECKPOINT_FILE)
+    os.remove(USER_EDITS_LOG)
@@ -1,46 +1,208 @@
 import os
+import re
+import glob
 import json
+import logging
 import requests
-import osmium
 import sys
-import time
-from typing import Dict, List, Optional, Literal
+import tempfile
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterator, List, Optional, Literal
 from dataclasses import dataclass, asdict
 from tqdm import tqdm
 from enum import Enum
 
 import procPercent as pp
+sys.path.append('../../shared')
+import challenge_builder as mrcb
+import log_config
 import random
 
+try:
+    import osmium
+    _SimpleHandler = osmium.SimpleHandler
+except ImportError:  # only needed to scan extracts, the match and geometry helpers work without it
+    osmium = None
+    _SimpleHandler = object
+
+logger = logging.getLogger("imgur404.valueFinder")
+
 GEOFABRIK_JSON = 'geofabrik_leafs.json'
-MATCHES_FILE = 'matches.json'
+# Newline-delimited JSON, one Overpass-style element per line
+MATCHES_FILE = 'matches.jsonl'
+# The old single JSON array format, produced on demand by export_legacy_matches()
+LEGACY_MATCHES_FILE = 'matches.json'
 SEARCH_SEQUENCE = 'i.imgur.com'
-OVERPASS_API = "https://overpass-api.de/api/interpreter"
 PROCCESSED_URLS = []
-OVERPASS_RETRY_DELAY = 10
-OVERPASS_RETRY_COUNT = 5
+# Compute way and relation centers from the extract itself instead of asking Overpass for every match
+RESOLVE_CENTERS_LOCALLY = True
+# Memory the node location indexes of all parallel scans may use together; scans whose share would not
+# fit use a file-backed index instead
+LOCATION_INDEX_MEMORY_LIMIT = 2 * 1024 ** 3
+# Rough PBF bytes per node of an extract, ways and relations included (the planet has ~9 billion nodes in ~80 GB)
+PBF_BYTES_PER_NODE = 8
+# A sparse location index stores the node ID and the location of every node
+LOCATION_INDEX_BYTES_PER_NODE = 16
+# Number of extracts scanned in parallel (one process each), each with a location index of its own
+SCAN_WORKERS = min(os.cpu_count() or 1, 2)
+# Number of extracts downloaded in parallel while others are scanned
+DOWNLOAD_WORKERS = 2
+# Upper bound for extracts on disk at the same time (downloading, waiting or being scanned)
+MAX_EXTRACTS_ON_DISK = SCAN_WORKERS + DOWNLOAD_WORKERS
+# How many levels of relations-in-relations are followed when resolving relation centers locally
+RELATION_RESOLVE_MAX_DEPTH = 3
 
 
 def post_overpass_query(query: str) -> Optional[dict]:
-    """Post an Overpass query with retry delay on failure."""
-    for attempt in range(1, OVERPASS_RETRY_COUNT + 1):
-        try:
-            response = requests.post(OVERPASS_API, data={"data": query}, timeout=60)
-            response.raise_for_status()
-            return response.json()
-        except requests.RequestException as exc:
-            print(f"Overpass request failed (attempt {attempt}/{OVERPASS_RETRY_COUNT}): {exc}")
-            if attempt < OVERPASS_RETRY_COUNT:
-                print(f"Retrying in {OVERPASS_RETRY_DELAY} seconds...")
-                time.sleep(OVERPASS_RETRY_DELAY)
-    print("Giving up after multiple Overpass request failures.")
-    return None
+    """Run an Overpass query with the shared client (retries, backoff and mirror failover)."""
+    try:
+        return {"elements": mrcb.Overpass().getElementsFromQuery(query)}
+    except ValueError as exc:
+        logger.warning("Giving up on Overpass query: %s", exc)
+        return None
+
+
+class MatchSink:
+    """
+    Buffered, append-only writer for scan matches (one JSON document per line).
+    """
+    def __init__(self, matches_file: str, buffer_size: int = 1000):
+        self.matches_file = matches_file
+        self.buffer_size = buffer_size
+        self.buffer: List[str] = []
+
+    def write(self, element: Dict):
+        self.buffer.append(json.dumps(element, ensure_ascii=False))
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        with open(self.matches_file, 'a', encoding='utf-8') as f:
+            f.write("\n".join(self.buffer) + "\n")
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+
+
+def iter_matches(matches_file: str = MATCHES_FILE, label: Optional[str] = None) -> Iterator[Dict]:
+    """Stream the matches of a scan one element at a time, optionally only those hit by the pattern *label*."""
+    try:
+        with open(matches_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                element = json.loads(line)
+                if label is None or label in element.get("matched_patterns", [label]):
+                    yield element
+    except FileNotFoundError:
+        return
+
+
+def export_legacy_matches(matches_file: str = MATCHES_FILE, legacy_file: str = LEGACY_MATCHES_FILE):
+    """Write the matches as a single JSON array (the format matches.json used to have)."""
+    with open(legacy_file, 'w', encoding='utf-8') as f:
+        f.write("[")
+        for index, element in enumerate(iter_matches(matches_file)):
+            f.write(",\n" if index else "\n")
+            f.write(json.dumps(element, ensure_ascii=False))
+        f.write("\n]\n")
 
 
 class MatchType(str, Enum):
     CONTAINS = "contains"
     EXACT = "exact"
 
+@dataclass
+class TagPattern:
+    """
+    A value to look for in tag values. *pattern* is a literal unless *regex* is set;
+    with *keys* given, only the values of these keys are searched.
+    """
+    label: str
+    pattern: str
+    regex: bool = False
+    match_type: MatchType = MatchType.CONTAINS
+    keys: Optional[List[str]] = None
+
+
+# Patterns searched by main(); each match is labelled with the patterns that hit so several challenges can share one scan
+SEARCH_PATTERNS = [
+    TagPattern(label="imgur", pattern=SEARCH_SEQUENCE),
+]
+
+
+# Inline flags at the start of a regex, which apply to the whole expression
+GLOBAL_FLAGS = re.compile(r"(?:\(\?[aiLmsux]+\))*")
+
+
+class PatternMatcher:
+    """
+    Evaluates a set of TagPatterns in one pass over the tags of an object.
+    All patterns that apply to a key are compiled into one combined regex, so values without
+    any hit (almost all of them) are rejected by a single search. Only values that hit are
+    checked pattern by pattern to find out which labels apply. Regexes that cannot share an
+    alternation with others (capturing groups, which backreferences count on, and global inline
+    flags such as (?i)) are searched on their own.
+    """
+    def __init__(self, patterns: List[TagPattern]):
+        self.patterns = list(patterns)
+        unrestricted = [p for p in self.patterns if not p.keys]
+        restricted_keys = {key for p in self.patterns if p.keys for key in p.keys}
+        self._unrestricted = self._compile(unrestricted)
+        self._by_key = {
+            key: self._compile(unrestricted + [p for p in self.patterns if p.keys and key in p.keys])
+            for key in restricted_keys
+        }
+
+    @staticmethod
+    def _pattern_regex(pattern: TagPattern) -> str:
+        body = pattern.pattern if pattern.regex else re.escape(pattern.pattern)
+        # Global flags have to stay in front of the wrapping group
+        flags = GLOBAL_FLAGS.match(body).group(0) if pattern.regex else ""
+        body = body[len(flags):]
+        if pattern.match_type == MatchType.EXACT:
+            return rf"{flags}\A(?:{body})\Z"
+        return f"{flags}(?:{body})"
+
+    def _compile(self, patterns: List[TagPattern]):
+        if not patterns:
+            return None
+        single, combinable, standalone = [], [], []
+        for p in patterns:
+            source = self._pattern_regex(p)
+            try:
+                regex = re.compile(source)
+            except re.error as exc:
+                raise ValueError(f"Invalid regex for pattern {p.label!r}: {exc}") from exc
+            single.append((p.label, regex))
+            if regex.groups or GLOBAL_FLAGS.match(source).group(0):
+                standalone.append((p.label, regex))
+            else:
+                combinable.append(source)
+        combined = re.compile("|".join(combinable)) if combinable else None
+        return combined, single, standalone
+
+    def match(self, key: str, value: str) -> List[str]:
+        """Return the labels of all patterns that hit the given tag."""
+        compiled = self._by_key.get(key, self._unrestricted)
+        if compiled is None:
+            return []
+        combined, single, standalone = compiled
+        if combined is None or not combined.search(value):
+            # None of the combined patterns hit, only the standalone ones can
+            return [label for label, regex in standalone if regex.search(value)]
+        if len(single) == 1:
+            return [single[0][0]]
+        return [label for label, regex in single if regex.search(value)]
+
+
 @dataclass
 class Center:
     lat: float
@@ -55,13 +217,197 @@ class OSMObject:
     lon: Optional[float] = None
     center: Optional[Center] = None
 
-class ValueFinderHandler(osmium.SimpleHandler):    
-    def __init__(self, search_sequence: str, matches_file: str, match_type: MatchType = MatchType.CONTAINS):
+
+class BBox:
+    """Bounding box that grows with every location added to it."""
+    def __init__(self):
+        self.min_lat = self.min_lon = float('inf')
+        self.max_lat = self.max_lon = float('-inf')
+
+    def add(self, lat: float, lon: float):
+        self.min_lat = min(self.min_lat, lat)
+        self.max_lat = max(self.max_lat, lat)
+        self.min_lon = min(self.min_lon, lon)
+        self.max_lon = max(self.max_lon, lon)
+
+    def extend(self, other: 'BBox'):
+        if not other.is_empty():
+            self.add(other.min_lat, other.min_lon)
+            self.add(other.max_lat, other.max_lon)
+
+    def is_empty(self) -> bool:
+        return self.min_lat > self.max_lat
+
+    def center(self) -> Optional['Center']:
+        # Same as Overpass "out center": the center of the bounding box
+        if self.is_empty():
+            return None
+        return Center(lat=(self.min_lat + self.max_lat) / 2, lon=(self.min_lon + self.max_lon) / 2)
+
+
+def way_bbox(way) -> BBox:
+    """Bounding box of a way; requires the file to be applied with locations=True."""
+    bbox = BBox()
+    for node in way.nodes:
+        if node.location.valid():
+            bbox.add(node.location.lat, node.location.lon)
+    return bbox
+
+
+def location_index_for(pbf_file: str, workers: int = SCAN_WORKERS) -> str:
+    """
+    Pick a sparse in-memory node location index when the expected index of *workers* parallel scans of
+    extracts this size fits into LOCATION_INDEX_MEMORY_LIMIT, and a sparse file-backed one otherwise.
+    A dense index would be sized to the highest node ID of the planet, not to the nodes in the extract.
+    """
+    expected_nodes = os.path.getsize(pbf_file) // PBF_BYTES_PER_NODE
+    if expected_nodes * LOCATION_INDEX_BYTES_PER_NODE * workers <= LOCATION_INDEX_MEMORY_LIMIT:
+        return 'sparse_mem_array'
+    return 'sparse_file_array'
+
+
+@contextlib.contextmanager
+def location_index(pbf_file: str, workers: int = SCAN_WORKERS) -> Iterator[str]:
+    """
+    Yield the idx argument for one apply_file() pass over *pbf_file*. A file-backed index gets a new
+    temporary file next to the extract, which is removed afterwards: libosmium would otherwise load
+    the locations a previous pass or a crashed run left in it.
+    """
+    index_type = location_index_for(pbf_file, workers)
+    if index_type == 'sparse_mem_array':
+        yield index_type
+        return
+    fd, index_file = tempfile.mkstemp(prefix=os.path.basename(pbf_file) + '.', suffix='.locations',
+                                      dir=os.path.dirname(os.path.abspath(pbf_file)))
+    os.close(fd)
+    try:
+        yield f'{index_type},{index_file}'
+    finally:
+        if os.path.exists(index_file):
+            os.remove(index_file)
+
+
+def remove_extract(pbf_file: str):
+    """Delete a downloaded extract together with location indexes a killed scan may have left next to it."""
+    for path in [pbf_file] + glob.glob(glob.escape(pbf_file) + '.*.locations'):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class RelationMemberResolver(_SimpleHandler):
+    """
+    Collects the geometry needed to compute relation centers in an additional pass over the extract:
+    locations of member nodes, bounding boxes of member ways and the members of sub-relations.
+    """
+    def __init__(self, node_ids: set, way_ids: set, relation_ids: set):
+        super().__init__()
+        self.node_ids = node_ids
+        self.way_ids = way_ids
+        self.relation_ids = relation_ids
+        self.node_locations: Dict[int, tuple] = {}
+        self.way_bboxes: Dict[int, BBox] = {}
+        self.relation_members: Dict[int, List[tuple]] = {}
+
+    def node(self, n):
+        if n.id in self.node_ids and n.location.valid():
+            self.node_locations[n.id] = (n.location.lat, n.location.lon)
+
+    def way(self, w):
+        if w.id in self.way_ids:
+            self.way_bboxes[w.id] = way_bbox(w)
+
+    def relation(self, r):
+        if r.id in self.relation_ids:
+            self.relation_members[r.id] = [(m.type, m.ref) for m in r.members]
+
+
+def resolve_relation_centers(pbf_file: str, relation_members: Dict[int, List[tuple]]) -> Dict[int, Optional[Center]]:
+    """
+    Compute the centers of the given relations (id -> [(member type, ref)]) from the extract.
+    Member types use the osmium one-letter codes ('n', 'w', 'r').
+    """
+    members = dict(relation_members)
+    node_locations: Dict[int, tuple] = {}
+    way_bboxes: Dict[int, BBox] = {}
+    for _ in range(RELATION_RESOLVE_MAX_DEPTH):
+        node_ids, way_ids, relation_ids = set(), set(), set()
+        for refs in members.values():
+            for member_type, ref in refs:
+                if member_type == 'n' and ref not in node_locations:
+                    node_ids.add(ref)
+                elif member_type == 'w' and ref not in way_bboxes:
+                    way_ids.add(ref)
+                elif member_type == 'r' and ref not in members:
+                    relation_ids.add(ref)
+        if not (node_ids or way_ids or relation_ids):
+            break
+        resolver = RelationMemberResolver(node_ids, way_ids, relation_ids)
+        if way_ids:
+            with location_index(pbf_file) as idx:
+                resolver.apply_file(pbf_file, locations=True, idx=idx)
+        else:
+            resolver.apply_file(pbf_file)
+        node_locations.update(resolver.node_locations)
+        way_bboxes.update(resolver.way_bboxes)
+        members.update(resolver.relation_members)
+        # Members that are not part of the extract stay unresolved
+        for ref in relation_ids - set(resolver.relation_members):
+            members[ref] = []
+        for ref in way_ids - set(resolver.way_bboxes):
+            way_bboxes[ref] = BBox()
+
+    def relation_bbox(relation_id: int, visited: set) -> BBox:
+        bbox = BBox()
+        visited.add(relation_id)
+        for member_type, ref in members.get(relation_id, []):
+            if member_type == 'n' and ref in node_locations:
+                bbox.add(*node_locations[ref])
+            elif member_type == 'w' and ref in way_bboxes:
+                bbox.extend(way_bboxes[ref])
+            elif member_type == 'r' and ref not in visited:
+                bbox.extend(relation_bbox(ref, visited))
+        return bbox
+
+    return {relation_id: relation_bbox(relation_id, set()).center() for relation_id in relation_members}
+
+
+class ValueFinderHandler(_SimpleHandler):    
+    def __init__(self, search_sequence: str, matches_file: str, match_type: MatchType = MatchType.CONTAINS,
+                 resolve_centers_locally: bool = False, patterns: Optional[List[TagPattern]] = None):
         super().__init__()
         self.search_sequence = search_sequence
         self.matches_file = matches_file
         self.match_type = match_type
+        if patterns is None:
+            patterns = [TagPattern(label=search_sequence, pattern=search_sequence, match_type=match_type)]
+        self.matcher = PatternMatcher(patterns)
+        self.resolve_centers_locally = resolve_centers_locally
+        self.sink = MatchSink(matches_file)
         self.location_handler = osmium.geom.WKBFactory()    
+        # Matched relations whose center is computed after the pass: id -> (element, members)
+        self.pending_relations: Dict[int, tuple] = {}
+
+    def resolve_pending_relations(self, pbf_file: str):
+        """Compute the centers of the matched relations with another local pass and write them out."""
+        if not self.pending_relations:
+            return
+        centers = resolve_relation_centers(
+            pbf_file,
+            {relation_id: members for relation_id, (_, members) in self.pending_relations.items()}
+        )
+        for relation_id, (element, _) in self.pending_relations.items():
+            center = centers.get(relation_id)
+            if center:
+                element["center"] = asdict(center)
+            else:
+                element["lat"] = None
+                element["lon"] = None
+            self.sink.write(element)
+        self.pending_relations = {}
+
+    def close(self):
+        """Flush the matches that are still buffered."""
+        self.sink.close()
 
     def get_center_coordinates(self, osm_type: str, osm_id: int) -> Optional[Center]:
         """Fetch center coordinates for ways and relations using Overpass API"""
@@ -73,7 +419,7 @@ class ValueFinderHandler(osmium.SimpleHandler):
         data = post_overpass_query(query)
         if not data:
             return None
-        print(data)
+        logger.debug("Overpass center result for %s %s: %s", osm_type, osm_id, data)
         if data["elements"]:
             element = data["elements"][0]
             if "center" in element:
@@ -104,15 +450,28 @@ class ValueFinderHandler(osmium.SimpleHandler):
             "id": obj.id,
             "tags": {tag.k: tag.v for tag in obj.tags}
         }
+        # Extracts without metadata report version 0; the version lets history lookups reuse stored histories
+        if obj.version:
+            element["version"] = obj.version
 
         if osm_type == 'node':
             element["lat"] = obj.location.lat
             element["lon"] = obj.location.lon
+        elif osm_type == 'way' and self.resolve_centers_locally:
+            center = way_bbox(obj).center()
+            if center:
+                element["center"] = asdict(center)
+            else:
+                element["lat"] = None
+                element["lon"] = None
+        elif osm_type == 'relation' and self.resolve_centers_locally:
+            # Filled in by resolve_pending_relations() once the member geometries are known
+            pass
         elif osm_type in ['way', 'relation']:
             # Get center coordinates using Overpass API
-            print("Creating center coordinates for way/relation")
+            logger.debug("Creating center coordinates for %s %s", osm_type, obj.id)
             center = self.get_center_coordinates(osm_type, obj.id)
-            print("Center coordinates: ", center)
+            logger.debug("Center coordinates of %s %s: %s", osm_type, obj.id, center)
             if center:
                 element["center"] = asdict(center)
             else:
@@ -129,28 +488,20 @@ class ValueFinderHandler(osmium.SimpleHandler):
         return element
 
     def check_tags(self, osm_type, obj):
+        labels = []
         for tag in obj.tags:
-            matches = (
-                self.search_sequence == tag.v 
-                if self.match_type == MatchType.EXACT 
-                else self.search_sequence in tag.v
-            )
-            if matches:
-                # Create Overpass-style element directly
-                element = self.create_overpass_element(osm_type, obj)
-                
-                try:
-                    with open(self.matches_file, 'r', encoding='utf-8') as f:
-                        MATCHES = json.load(f)
-                except FileNotFoundError:
-                    MATCHES = []
-                
-                MATCHES.append(element)
-                
-                with open(self.matches_file, 'w', encoding='utf-8') as f:
-                    json.dump(MATCHES, f, ensure_ascii=False, indent=4)
-                print(f"Found {self.search_sequence} in {osm_type} {obj.id}")
-                break
+            for label in self.matcher.match(tag.k, tag.v):
+                if label not in labels:
+                    labels.append(label)
+        if labels:
+            # Create Overpass-style element directly
+            element = self.create_overpass_element(osm_type, obj)
+            element["matched_patterns"] = labels
+            if osm_type == 'relation' and self.resolve_centers_locally:
+                self.pending_relations[obj.id] = (element, [(m.type, m.ref) for m in obj.members])
+            else:
+                self.sink.write(element)
+            logger.debug("Found %s in %s %s", ", ".join(labels), osm_type, obj.id)
     
     def display_progress(self, osm_type, osm_id):
         if random.randint(1, 100000) == 42:
@@ -158,10 +509,10 @@ class ValueFinderHandler(osmium.SimpleHandler):
             if osm_type in max_values:
                 max_id = max_values[osm_type]
                 if osm_id > max_id:
-                    print(f"Warning: {osm_type} ID {osm_id} is greater than current max {max_id}.")
+                    logger.warning("%s ID %s is greater than current max %s", osm_type, osm_id, max_id)
                     return
                 percentile = pp.get_id_percentile(osm_type, osm_id)
-                print(f"{percentile:.2f}% of {osm_type} searched.")
+                logger.info("%.2f%% of %s searched", percentile, osm_type)
 
     def node(self, n):
         self.check_tags('node', n)
@@ -194,7 +545,151 @@ def download_file(url, local_filename):
                 progress_bar.update(size)
         progress_bar.close()
 
+def scan_extract(pbf_file: str, search_sequence: str = SEARCH_SEQUENCE, matches_file: str = MATCHES_FILE,
+                 match_type: MatchType = MatchType.CONTAINS, patterns: Optional[List[TagPattern]] = None):
+    """Scan one downloaded extract and append its matches to matches_file."""
+    if osmium is None:
+        raise ImportError("The osmium package is not installed.")
+    handler = ValueFinderHandler(search_sequence, matches_file, match_type,
+                                 resolve_centers_locally=RESOLVE_CENTERS_LOCALLY, patterns=patterns)
+    if RESOLVE_CENTERS_LOCALLY:
+        with location_index(pbf_file) as idx:
+            handler.apply_file(pbf_file, locations=True, idx=idx)
+        handler.resolve_pending_relations(pbf_file)
+    else:
+        handler.apply_file(pbf_file)
+    handler.close()
+
+
+def _scan_extract_to_part(pbf_file: str, part_file: str, search_sequence: str, match_type: MatchType,
+                          patterns: Optional[List[TagPattern]]) -> str:
+    # Runs in a worker process; every extract gets its own part file so that workers never share a file
+    if os.path.exists(part_file):
+        os.remove(part_file)
+    scan_extract(pbf_file, search_sequence, part_file, match_type, patterns)
+    return part_file
+
+
+def merge_matches(part_file: str, matches_file: str = MATCHES_FILE):
+    """Append the matches of one extract to the combined match stream and delete the part file."""
+    if os.path.exists(part_file):
+        with open(part_file, 'r', encoding='utf-8') as src, open(matches_file, 'a', encoding='utf-8') as dst:
+            for line in src:
+                dst.write(line)
+        os.remove(part_file)
+
+
+def migrate_legacy_matches(legacy_file: str = LEGACY_MATCHES_FILE, matches_file: str = MATCHES_FILE) -> bool:
+    """
+    Convert the matches of a run that still wrote the single JSON array (matches.json) into the match stream,
+    so the extracts recorded as processed by that run keep their results. Only done while no stream exists yet.
+    """
+    if os.path.exists(matches_file) or not os.path.exists(legacy_file):
+        return False
+    with open(legacy_file, 'r', encoding='utf-8') as f:
+        try:
+            elements = json.load(f)
+        except json.JSONDecodeError:
+            logger.warning("Could not migrate %s, it is not valid JSON", legacy_file)
+            return False
+    tmp_file = matches_file + ".tmp"
+    sink = MatchSink(tmp_file)
+    for element in elements:
+        sink.write(element)
+    sink.close()
+    if os.path.exists(tmp_file):
+        os.replace(tmp_file, matches_file)
+    logger.info("Migrated %d matches from %s to %s", len(elements), legacy_file, matches_file)
+    return True
+
+
+def run_scan_pipeline(pbf_urls: List[str], search_sequence: str = SEARCH_SEQUENCE,
+                      match_type: MatchType = MatchType.CONTAINS, on_extract_done=None,
+                      patterns: Optional[List[TagPattern]] = None):
+    """
+    Download upcoming extracts while a process pool scans the ones already on disk.
+    At most MAX_EXTRACTS_ON_DISK extracts exist locally at any time. Whenever an extract is
+    scanned, its matches are merged into MATCHES_FILE, the extract is deleted and
+    on_extract_done(pbf_url) is called. Extracts whose download or scan fails are skipped without
+    calling on_extract_done, so the next run tries them again.
+    """
+    disk_slots = threading.BoundedSemaphore(MAX_EXTRACTS_ON_DISK)
+    stopping = threading.Event()
+
+    def download(pbf_url):
+        local_filename = os.path.basename(pbf_url)
+        while not disk_slots.acquire(timeout=1):
+            if stopping.is_set():
+                return None
+        try:
+            logger.info("Downloading %s", pbf_url)
+            download_file(pbf_url, local_filename)
+        except (requests.RequestException, OSError) as exc:
+            # Skip this extract; it is not recorded as processed, so the next run tries it again
+            logger.warning("Skipping %s, the download failed: %s", pbf_url, exc)
+            if os.path.exists(local_filename):
+                os.remove(local_filename)
+            disk_slots.release()
+            return None
+        except BaseException:
+            disk_slots.release()
+            raise
+        return local_filename
+
+    progress = tqdm(total=len(pbf_urls), desc="Extracts")
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as downloads, \
+            ProcessPoolExecutor(max_workers=SCAN_WORKERS) as scanners:
+        active = {downloads.submit(download, pbf_url): ("download", pbf_url) for pbf_url in pbf_urls}
+        try:
+            while active:
+                done, _ = wait(active, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage, pbf_url = active.pop(future)
+                    local_filename = os.path.basename(pbf_url)
+                    if stage == "download":
+                        if future.result() is None:
+                            progress.update(1)
+                            continue
+                        part_file = local_filename + ".matches.jsonl"
+                        scan = scanners.submit(_scan_extract_to_part, future.result(), part_file, search_sequence, match_type, patterns)
+                        active[scan] = ("scan", pbf_url)
+                        continue
+                    part_file = local_filename + ".matches.jsonl"
+                    try:
+                        future.result()
+                        scanned = True
+                    except BrokenProcessPool:
+                        # A scan process died (e.g. out of memory); the pool cannot take more scans
+                        raise
+                    except Exception as exc:
+                        # Skip this extract like a failed download instead of stopping the whole run
+                        logger.warning("Skipping %s, the scan failed: %s", pbf_url, exc)
+                        scanned = False
+                    try:
+                        if scanned:
+                            merge_matches(part_file)
+                        elif os.path.exists(part_file):
+                            os.remove(part_file)
+                    finally:
+                        logger.info("Deleting %s", local_filename)
+                        remove_extract(local_filename)
+                        disk_slots.release()
+                    if scanned and on_extract_done:
+                        on_extract_done(pbf_url)
+                    progress.update(1)
+        except BaseException:
+            # Don't keep downloading and scanning after a failure; processed extracts are already recorded
+            stopping.set()
+            for future in active:
+                future.cancel()
+            raise
+    progress.close()
+
+
 def main():
+    log_config.setup_logging()
+    # Results of runs before the match stream existed belong to the extracts in processed_urls.json
+    migrate_legacy_matches()
     # Load processed URLs from file if it exists
     if os.path.exists('processed_urls.json'):
         with open('processed_urls.json', 'r', encoding='utf-8') as f:
@@ -209,27 +704,21 @@ def main():
         with open(GEOFABRIK_JSON, 'r', encoding='utf-8') as f:
             leafs = json.load(f)
     except FileNotFoundError:
-        print(f"File {GEOFABRIK_JSON} not found.")
+        logger.error("File %s not found", GEOFABRIK_JSON)
         sys.exit(1)
-    for pbf_url in tqdm(leafs):
-        # Skip URLs that have already been processed
-        if pbf_url in PROCCESSED_URLS:
-            print(f"Skipping already processed URL: {pbf_url}")
-            continue
-        local_filename = os.path.basename(pbf_url)
-        print(f"Downloading {pbf_url} ...")
-        # Only download the file if local_filename does not exist
-        download_file(pbf_url, local_filename)
-        handler = ValueFinderHandler(SEARCH_SEQUENCE, MATCHES_FILE)
-        handler.apply_file(local_filename)
-        print(f"Deleting {local_filename} ...")
-        os.remove(local_filename)
-        # Add the downloaded URL to the processed URLs list
+    # Skip URLs that have already been processed
+    pending_urls = [pbf_url for pbf_url in leafs if pbf_url not in PROCCESSED_URLS]
+    logger.info("Skipping %d already processed URLs", len(leafs) - len(pending_urls))
+
+    def mark_processed(pbf_url):
+        # Only record an extract once its matches are merged, so an interrupted run picks it up again
         PROCCESSED_URLS.append(pbf_url)
-        # Save the processed URLs to a file
         with open('processed_urls.json', 'w', encoding='utf-8') as f:
             json.dump(PROCCESSED_URLS, f, ensure_ascii=False, indent=4)
-    print("Done.")
+
+    run_scan_pipeline(pending_urls, SEARCH_SEQUENCE, MatchType.CONTAINS, on_extract_done=mark_processed,
+                      patterns=SEARCH_PATTERNS)
+    logger.info("Done")
 
 def find_value_objects(
     search_sequence: str = SEARCH_SEQUENCE,
@@ -258,22 +747,18 @@ def find_value_objects(
         with open(GEOFABRIK_JSON, 'r', encoding='utf-8') as f:
             leafs = json.load(f)
     except FileNotFoundError:
-        print(f"File {GEOFABRIK_JSON} not found.")
+        logger.error("File %s not found", GEOFABRIK_JSON)
         return []
 
-    for pbf_url in tqdm(leafs):
-        local_filename = os.path.basename(pbf_url)
-        print(f"Downloading {pbf_url} ...")
-        download_file(pbf_url, local_filename)
-
-        handler = ValueFinderHandler(search_sequence, MATCHES_FILE, match_type)
-        handler.apply_file(local_filename)
-        print(f"Deleting {local_filename} ...")
-        os.remove(local_filename)
+    run_scan_pipeline(leafs, search_sequence, match_type)
     
     # Return the results in Overpass format
     return get_overpass_style_elements()
 
+def get_overpass_style_elements() -> List[Dict]:
+    """Load all matches of the last scan as a list of Overpass-style elements."""
+    return list(iter_matches(MATCHES_FILE))
+
 def get_center_coordinates(osm_type: str, osm_id: int) -> Optional[Center]:
     """Fetch center coordinates for ways and relations using Overpass API"""
     query = f"""
@@ -297,4 +782,7 @@ def get_center_coordinates(osm_type: str, osm_id: int) -> Optional[Center]:
 
 
 if __name__ == '__main__':
-    main()
+    if sys.argv[1:] == ['export-legacy']:
+        export_legacy_matches()
+    else:
+        main()
@@ -1,5 +1,6 @@
 import re
 import sys
+import logging
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from typing import Callable, List, Optional, Pattern, Tuple
@@ -8,6 +9,10 @@ import requests
 
 sys.path.append('../../shared')
 import challenge_builder as mrcb
+import history_store
+import instrumentation
+import log_config
+import query_planner
 
 try:
     from tqdm import tqdm
@@ -15,6 +20,8 @@ except ImportError:
     def tqdm(iterable, *args, **kwargs):
         return iterable
 
+logger = logging.getLogger("note_abgerissen")
+
 
 @dataclass
 class DateCandidate:
@@ -172,21 +179,14 @@ def _valid_history_value(value: Optional[str]) -> bool:
     return normalized not in {"razed", "no"}
 
 
-def fetch_history_info(osm_type: str, osm_id: int) -> HistoryInfo:
-    url = f"https://api.openstreetmap.org/api/0.6/{osm_type}/{osm_id}/history.json"
+def fetch_history_info(osm_type: str, osm_id: int, version: Optional[int] = None) -> HistoryInfo:
     try:
-        response = requests.get(url, timeout=30)
+        versions = history_store.get_history_store().get_history(osm_type, osm_id, version)
     except requests.RequestException:
-        return HistoryInfo(None, None, None)
-
-    if response.status_code != 200:
-        return HistoryInfo(None, None, None)
-    try:
-        payload = response.json()
-    except ValueError:
-        return HistoryInfo(None, None, None)
+        return HistoryInfo(None, None, None, None)
 
-    versions = payload.get("elements", [])
+    if versions is None:
+        return HistoryInfo(None, None, None, None)
     name_value: Optional[str] = None
     for version in reversed(versions):
         tags = version.get("tags") or {}
@@ -286,44 +286,51 @@ def build_main_feature(element: dict, instruction_text: str) -> mrcb.GeoFeature:
     return mrcb.GeoFeature.withId(element["type"], element["id"], geometry, properties)
 
 
+def build_task(element, history_info: HistoryInfo) -> mrcb.Task:
+    date_candidate = find_best_date_from_tags(element.get("tags", {}))
+    cooperative = build_tagfix(element["type"], element["id"], history_info, date_candidate)
+
+    instruction_text = build_instruction_text(
+        history_info,
+        date_candidate,
+        should_show_deletion_hint(history_info.last_timestamp),
+        cooperative is not None
+    )
+
+    feature = build_main_feature(element, instruction_text)
+    if cooperative:
+        return mrcb.Task(feature, cooperativeWork=cooperative)
+    return mrcb.Task(feature)
+
+
 def main():
-    overpass = mrcb.Overpass()
-    print("Fetching elements from Overpass...")
-    elements = overpass.getElementsFromQuery(
-        """
+    log_config.setup_logging()
+    logger.info("Fetching elements from Overpass...")
+    # Germany is queried state by state, which finishes reliably and uses several server slots
+    elements = query_planner.run_tiled_query(
+        f"""
 [out:json][timeout:250];
-area(id:3600051477)->.searchArea;
-nwr["note"~"bgerissen"](if:count_tags()==1)(area.searchArea);
-out tags geom;
-        """
+nwr["note"~"bgerissen"](if:count_tags()==1){query_planner.AREA_PLACEHOLDER};
+out meta geom;
+        """,
+        query_planner.german_state_tiles()
     )
 
     challenge = mrcb.Challenge()
 
-    for element in tqdm(elements):
-        if not needs_task(element):
-            continue
-
-        date_candidate = find_best_date_from_tags(element.get("tags", {}))
-        history_info = fetch_history_info(element["type"], element["id"])
-        cooperative = build_tagfix(element["type"], element["id"], history_info, date_candidate)
-
-        instruction_text = build_instruction_text(
-            history_info,
-            date_candidate,
-            should_show_deletion_hint(history_info.last_timestamp),
-            cooperative is not None
+    elements = [element for element in elements if needs_task(element)]
+    logger.info("Fetching element histories...")
+    with instrumentation.stage("histories"):
+        history_infos = mrcb.getHttpClient().map(
+            lambda element: fetch_history_info(element["type"], element["id"], element.get("version")),
+            elements
         )
 
-        feature = build_main_feature(element, instruction_text)
-        if cooperative:
-            task = mrcb.Task(feature, cooperativeWork=cooperative)
-        else:
-            task = mrcb.Task(feature)
-
-        challenge.addTask(task)
+    with instrumentation.stage("build_tasks"):
+        for element, history_info in tqdm(zip(elements, history_infos), total=len(elements)):
+            challenge.addTask(build_task(element, history_info))
 
-    print("Saving challenge...")
+    logger.info("Saving challenge...")
     challenge.saveToFile("note_abgerissen.json")
 
 
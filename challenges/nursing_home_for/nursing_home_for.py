@@ -1,22 +1,19 @@
 import sys
 sys.path.append('../../shared')
 import challenge_builder as mrcb
+import instrumentation
+import log_config
 from tqdm import tqdm
 
-op = mrcb.Overpass()
-
-elements = op.getElementsFromQuery(
-    """
+QUERY = """
 [out:json][timeout:250];
 area(id:3600051477)->.searchArea;
 nwr["amenity"="social_facility"]["social_facility"="nursing_home"][!"social_facility:for"](area.searchArea);
 out tags center;
-    """
-)
+"""
 
-challenge = mrcb.Challenge()
 
-for element in elements:
+def build_task(element):
     geom = mrcb.getElementCenterPoint(element)
     mainFeature = mrcb.GeoFeature.withId(
         element["type"],
@@ -24,9 +21,24 @@ for element in elements:
         geom,
         properties={}
     )
-    t = mrcb.Task(
+    return mrcb.Task(
         mainFeature
     )
-    challenge.addTask(t)
 
-challenge.saveToFile("nursing_home_for.json")
+
+def main():
+    log_config.setup_logging()
+    op = mrcb.Overpass(cache=mrcb.OverpassCache())
+    elements = op.getElementsFromQuery(QUERY)
+
+    challenge = mrcb.Challenge()
+
+    with instrumentation.stage("build_tasks"):
+        for element in elements:
+            challenge.addTask(build_task(element))
+
+    challenge.saveToFile("nursing_home_for.json")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,9 @@
+import os
 import json
 import html
+import logging
+import threading
+from datetime import datetime, timezone
 from pathlib import Path
 from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
 
@@ -9,9 +13,12 @@ except ImportError:  # pragma: no cover - optional dependency
     OpenAI = None
 
 import free_tokens
+import token_budget
 
 PROJECT_NAME = "parking-converter"
 
+logger = logging.getLogger("parking_converter.aihelper")
+
 def _load_creds(path: Optional[Path] = None) -> Dict[str, str]:
     """
     Load the prompt and API credentials from creds.json.
@@ -51,6 +58,16 @@ DEFAULT_MODEL_ORDER = [
     "gpt-5.1"
 ]
 
+# Free tokens per day and model. A run starts from what is left of them today after the usage in
+# USAGE_FILE, so runs on the same day share the quota; free_tokens is asked as well.
+MODEL_TOKEN_BUDGETS = {
+    "gpt-5-mini": 2_500_000,
+    "gpt-5.1": 250_000,
+}
+
+# Tokens used today per model, written by _record_token_usage. The free quota resets at midnight UTC.
+USAGE_FILE = Path(__file__).with_name("token_usage.json")
+
 # Structured output schema expected from the prompt (identical to the example from the
 # playground). This keeps the model response predictable.
 STRUCTURED_TEXT_SCHEMA: Dict[str, Any] = {
@@ -286,21 +303,101 @@ def _ai_payload_to_maproulette(
     return {"meta": {"version": 2, "type": 1}, "operations": operations_out}
 
 
-def _record_token_usage(response: Any, model: str) -> None:
-    """Persist token usage so the free-token quota tracking stays accurate."""
+def _record_token_usage(response: Any, model: str) -> int:
+    """Persist token usage so the free-token quota tracking stays accurate. Returns the tokens used."""
     usage = getattr(response, "usage", None)
     if not usage:
-        return
+        return 0
     total_tokens = getattr(usage, "total_tokens", None)
     if total_tokens is None and isinstance(usage, dict):
         total_tokens = usage.get("total_tokens")
-    if total_tokens:
+    if not total_tokens:
+        return 0
+    # Requests finish in several threads at once, and updating the persisted usage is not thread-safe
+    with _usage_lock:
         free_tokens.add_to_today_tokens(int(total_tokens), model, project=PROJECT_NAME)
+        usage_today = _load_today_usage()
+        usage_today[model] = usage_today.get(model, 0) + int(total_tokens)
+        _save_today_usage(usage_today)
+    return int(total_tokens)
+
+
+def _today() -> str:
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+def _load_today_usage(path: Optional[Path] = None) -> Dict[str, int]:
+    """Tokens used today per model according to USAGE_FILE; usage of earlier days is dropped."""
+    usage_path = path or USAGE_FILE
+    try:
+        with usage_path.open(encoding="utf-8") as f:
+            usage = json.load(f)
+    except FileNotFoundError:
+        return {}
+    if usage.get("date") != _today():
+        return {}
+    return {str(model): int(tokens) for model, tokens in usage.get("tokens", {}).items()}
+
+
+def _save_today_usage(tokens: Dict[str, int], path: Optional[Path] = None):
+    usage_path = path or USAGE_FILE
+    tmp_path = usage_path.with_name(usage_path.name + ".tmp")
+    with tmp_path.open("w", encoding="utf-8") as f:
+        json.dump({"date": _today(), "tokens": tokens}, f, indent=2)
+    os.replace(tmp_path, usage_path)
+
+
+_client = None
+_scheduler = None
+_shared_lock = threading.Lock()
+_usage_lock = threading.Lock()
+
+
+def get_client() -> "OpenAI":
+    """The OpenAI client shared by all requests (and threads) of this process."""
+    global _client
+    if OpenAI is None:
+        raise ImportError("The openai package is not installed.")
+    with _shared_lock:
+        if _client is None:
+            _client = OpenAI(api_key=CREDS["openai_key"])  # type: ignore[arg-type]
+        return _client
+
+
+def _has_quota(model: str) -> bool:
+    return bool(free_tokens.get_model_with_kontingent_from_list([model]))
+
+
+def _remaining_quota(model: str) -> Optional[int]:
+    """Tokens of *model* left today after the usage recorded in USAGE_FILE, or None for a model without a budget."""
+    budget = MODEL_TOKEN_BUDGETS.get(model)
+    if budget is None:
+        return None
+    with _usage_lock:
+        used = _load_today_usage().get(model, 0)
+    return max(0, budget - used)
+
+
+def get_scheduler() -> token_budget.TokenBudgetScheduler:
+    """The token budget scheduler shared by all requests of this process."""
+    global _scheduler
+    with _shared_lock:
+        if _scheduler is None:
+            _scheduler = token_budget.TokenBudgetScheduler(
+                DEFAULT_MODEL_ORDER, MODEL_TOKEN_BUDGETS, _has_quota, _remaining_quota
+            )
+        return _scheduler
+
+
+def _is_quota_error(exc: Exception) -> bool:
+    # Both come back as HTTP 429, but rate limits are already retried by the client itself
+    return getattr(exc, "status_code", None) == 429 and getattr(exc, "code", None) == "insufficient_quota"
 
 
 def request_ai_parking_conversion(
     element: Union[str, Dict[str, Any]],
     model_order: Optional[List[str]] = None,
+    scheduler: Optional[token_budget.TokenBudgetScheduler] = None,
 ) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
     """
     Ask the AI (using only the free-token models) to convert old parking tags.
@@ -312,6 +409,9 @@ def request_ai_parking_conversion(
         raw text blob to feed directly into the prompt.
     model_order: list[str], optional
         Preferred models; defaults to ``DEFAULT_MODEL_ORDER``.
+    scheduler: TokenBudgetScheduler, optional
+        Token budgets to reserve the request from; defaults to the shared ``get_scheduler()``.
+        When the API refuses a model for lack of quota, the next model with budget is tried.
 
     Returns
     -------
@@ -320,35 +420,40 @@ def request_ai_parking_conversion(
         MapRoulette's cooperative work. Both entries are ``None`` when no model with
         free tokens is available or the response could not be parsed.
     """
-    if OpenAI is None:
-        raise ImportError("The openai package is not installed.")
-
-    preferred_models = model_order or DEFAULT_MODEL_ORDER
-    model = free_tokens.get_model_with_kontingent_from_list(preferred_models)
-    if not model:
-        return None, None
-
-    client = OpenAI(api_key=CREDS["openai_key"])  # type: ignore[arg-type]
+    client = get_client()
+    scheduler = scheduler or get_scheduler()
     input_text = _element_to_input_text(element)
 
-    try:
-        response = client.responses.create(
-            model=model,
-            prompt={"id": PROMPT_ID, "version": PROMPT_VERSION},
-            input=[
-                {
-                    "role": "user",
-                    "content": [{"type": "input_text", "text": input_text}],
-                }
-            ],
-            text=STRUCTURED_TEXT_SCHEMA,
-            reasoning={"summary": "auto"},
-        )
-    except Exception:
-        # Keep the caller in control; simply signal failure.
-        return None, None
+    while True:
+        reservation = scheduler.reserve(model_order)
+        if reservation is None:
+            return None, None
+        model = reservation.model
+        logger.debug("Requesting AI conversion with model %s", model)
+        try:
+            response = client.responses.create(
+                model=model,
+                prompt={"id": PROMPT_ID, "version": PROMPT_VERSION},
+                input=[
+                    {
+                        "role": "user",
+                        "content": [{"type": "input_text", "text": input_text}],
+                    }
+                ],
+                text=STRUCTURED_TEXT_SCHEMA,
+                reasoning={"summary": "auto"},
+            )
+        except Exception as exc:
+            scheduler.release(reservation)
+            if _is_quota_error(exc):
+                logger.info("No quota left for model %s, falling back to the next model", model)
+                scheduler.exhaust(model)
+                continue
+            # Keep the caller in control; simply signal failure.
+            return None, None
+        break
 
-    _record_token_usage(response, model)
+    scheduler.settle(reservation, _record_token_usage(response, model))
 
     try:
         ai_payload = _extract_json_from_response(response)
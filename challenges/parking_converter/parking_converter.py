@@ -1,24 +1,38 @@
+import os
 import sys
+import logging
 sys.path.append('../../shared')
 import challenge_builder as mrcb
+import instrumentation
+import log_config
 from tqdm import tqdm
 import random
-import copy
-try:
-    import free_tokens
-except ImportError:
-    free_tokens = None
+import functools
+import itertools
+import collections
+import multiprocessing
+from concurrent.futures import Future, ThreadPoolExecutor
 try:
     import aihelper
 except ImportError:
-    # Set a flag to indicate that AIHelper is not available
+    # Set a flag to indicate that AIHelper (or free_tokens, which it needs) is not available
     aihelper = None
 
+logger = logging.getLogger("parking_converter")
+
 
 # Set to an integer to stop after that many elements; keep as None to process everything.
 PROCESS_LIMIT = None
 # When True, skip tasks that would require manual conversion (only keep auto/AI results).
 ONLY_AUTO_TASKS = True
+# Number of worker processes converting ways in parallel; 0 uses one per CPU core, 1 converts in this process.
+WORKERS = 0
+# Ways handed to the worker pool at a time, which bounds the memory used by queued ways
+WORKER_BATCH_SIZE = 20000
+# AI requests in flight at once; the AI stage runs in threads of the main process and shares one client
+AI_WORKERS = 8
+# Finished records waiting for an earlier AI conversion before the pool is paused
+MAX_PENDING_RECORDS = 10000
 
 
 MSG_COMPLETE = """
@@ -57,517 +71,231 @@ class PrebuiltCooperativeWork:
     def to_dict(self):
         return self.payload
 
-def convert_base_parking_tags(tags):
-    print(f"[convert_base_parking_tags] Received tags: {tags}")
-    tagChanges = {} # to set a new tag: "newTag": "newValue", to unset a tag: "oldTag": None
-    # Go thhrough all tags; if a tag contains parking and the value is "lay_by", change the value of this tag to street_side
-    for key in tags:
-        if "parking" in key and tags[key] == "lay_by":
-            tags[key] = "street_side" # In this case, we want to manipulate the tags themself, not the tagChanges dict
-    # The normal conversion if-cascade
-    if "parking:lane:right" in tags:
-        if tags["parking:lane:right"] == "parallel":
-            tagChanges["parking:right:orientation"] = "parallel"
-            tagChanges["parking:lane:right"] = None
-            if "parking:lane:right:parallel" in tags:
-                if tags["parking:lane:right:parallel"] == "on_street":
-                    tagChanges["parking:right"] = "lane"
-                    tagChanges["parking:lane:right:parallel"] = None
-                elif tags["parking:lane:right:parallel"] == "half_on_kerb":
-                    tagChanges["parking:right"] = "half_on_kerb"
-                    tagChanges["parking:lane:right:parallel"] = None
-                elif tags["parking:lane:right:parallel"] == "on_kerb":
-                    tagChanges["parking:right"] = "on_kerb"
-                    tagChanges["parking:lane:right:parallel"] = None
-                elif tags["parking:lane:right:parallel"] == "street_side":
-                    tagChanges["parking:right"] = "street_side"
-                    tagChanges["parking:lane:right:parallel"] = None
-                elif tags["parking:lane:right:parallel"] == "painted_area_only":
-                    tagChanges["parking:right"] = "lane"
-                    tagChanges["parking:right:markings"] = "yes"
-                    tagChanges["parking:lane:right:parallel"] = None
-                elif tags["parking:lane:right:parallel"] == "marked":
-                    tagChanges["parking:right:markings"] = "yes"
-                    tagChanges["parking:right"] = "yes" # Set the generic "yes" so that it's noted that you can obviously park there, but its unclear how
-                    tagChanges["parking:lane:right:parallel"] = None
-        elif tags["parking:lane:right"] == "diagonal":
-            tagChanges["parking:right:orientation"] = "diagonal"
-            tagChanges["parking:lane:right"] = None
-            if "parking:lane:right:diagonal" in tags:
-                if tags["parking:lane:right:diagonal"] == "on_street":
-                    tagChanges["parking:right"] = "lane"
-                    tagChanges["parking:lane:right:diagonal"] = None
-                elif tags["parking:lane:right:diagonal"] == "half_on_kerb":
-                    tagChanges["parking:right"] = "half_on_kerb"
-                    tagChanges["parking:lane:right:diagonal"] = None
-                elif tags["parking:lane:right:diagonal"] == "on_kerb":
-                    tagChanges["parking:right"] = "on_kerb"
-                    tagChanges["parking:lane:right:diagonal"] = None
-                elif tags["parking:lane:right:diagonal"] == "street_side":
-                    tagChanges["parking:right"] = "street_side"
-                    tagChanges["parking:lane:right:diagonal"] = None
-                elif tags["parking:lane:right:diagonal"] == "painted_area_only":
-                    tagChanges["parking:right"] = "lane"
-                    tagChanges["parking:right:markings"] = "yes"
-                    tagChanges["parking:lane:right:diagonal"] = None
-                elif tags["parking:lane:right:diagonal"] == "marked":
-                    tagChanges["parking:right:markings"] = "yes"
-                    tagChanges["parking:right"] = "yes" # Set the generic "yes" so that it's noted that you can obviously park there, but its unclear how
-                    tagChanges["parking:lane:right:diagonal"] = None
-        elif tags["parking:lane:right"] == "perpendicular":
-            tagChanges["parking:right:orientation"] = "perpendicular"
-            tagChanges["parking:lane:right"] = None
-            if "parking:lane:right:perpendicular" in tags:
-                if tags["parking:lane:right:perpendicular"] == "on_street":
-                    tagChanges["parking:right"] = "lane"
-                    tagChanges["parking:lane:right:perpendicular"] = None
-                elif tags["parking:lane:right:perpendicular"] == "half_on_kerb":
-                    tagChanges["parking:right"] = "half_on_kerb"
-                    tagChanges["parking:lane:right:perpendicular"] = None
-                elif tags["parking:lane:right:perpendicular"] == "on_kerb":
-                    tagChanges["parking:right"] = "on_kerb"
-                    tagChanges["parking:lane:right:perpendicular"] = None
-                elif tags["parking:lane:right:perpendicular"] == "street_side":
-                    tagChanges["parking:right"] = "street_side"
-                    tagChanges["parking:lane:right:perpendicular"] = None
-                elif tags["parking:lane:right:perpendicular"] == "painted_area_only":
-                    tagChanges["parking:right"] = "lane"
-                    tagChanges["parking:right:markings"] = "yes"
-                    tagChanges["parking:lane:right:perpendicular"] = None
-                elif tags["parking:lane:right:perpendicular"] == "marked":
-                    tagChanges["parking:right:markings"] = "yes"
-                    tagChanges["parking:right"] = "yes" # Set the generic "yes" so that it's noted that you can obviously park there, but its unclear how
-                    tagChanges["parking:lane:right:perpendicular"] = None
-        elif tags["parking:lane:right"] == "no":
-            tagChanges["parking:right"] = "no"
-            tagChanges["parking:lane:right"] = None
-        elif tags["parking:lane:right"] == "no_parking":
-            tagChanges["parking:right"] = "no"
-            tagChanges["parking:right:restriction"] = "no_parking"
-            tagChanges["parking:lane:right"] = None
-        elif tags["parking:lane:right"] == "no_stopping":
-            tagChanges["parking:right"] = "no"
-            tagChanges["parking:right:restriction"] = "no_stopping"
-            tagChanges["parking:lane:right"] = None
-        elif tags["parking:lane:right"] == "no_standing":
-            tagChanges["parking:right"] = "no"
-            tagChanges["parking:right:restriction"] = "no_standing"
-            tagChanges["parking:lane:right"] = None
-        elif tags["parking:lane:right"] == "separate":
-            tagChanges["parking:right"] = "separate"
-            tagChanges["parking:lane:right"] = None
-        elif tags["parking:lane:right"] == "marked":
-            tagChanges["parking:right:markings"] = "yes"
-            tagChanges["parking:lane:right"] = None
-        elif tags["parking:lane:right"] == "marked" and "parking:lane:right:marked" in tags:
-            if tags["parking:lane:right:marked"] == "on_street":
-                tagChanges["parking:right"] = "lane"
-                tagChanges["parking:right:markings"] = "yes"
-                tagChanges["parking:lane:right:marked"] = None
-            elif tags["parking:lane:right:marked"] == "half_on_kerb":
-                tagChanges["parking:right"] = "half_on_kerb"
-                tagChanges["parking:right:markings"] = "yes"
-                tagChanges["parking:lane:right:marked"] = None
-            elif tags["parking:lane:right:marked"] == "on_kerb":
-                tagChanges["parking:right"] = "on_kerb"
-                tagChanges["parking:right:markings"] = "yes"
-                tagChanges["parking:lane:right:marked"] = None
-            elif tags["parking:lane:right:marked"] == "street_side":
-                tagChanges["parking:right"] = "street_side"
-                tagChanges["parking:right:markings"] = "yes"
-                tagChanges["parking:lane:right:marked"] = None
-    # Left side
-    if "parking:lane:left" in tags:
-        if tags["parking:lane:left"] == "parallel":
-            tagChanges["parking:left:orientation"] = "parallel"
-            tagChanges["parking:lane:left"] = None
-            if "parking:lane:left:parallel" in tags:
-                if tags["parking:lane:left:parallel"] == "on_street":
-                    tagChanges["parking:left"] = "lane"
-                    tagChanges["parking:lane:left:parallel"] = None
-                elif tags["parking:lane:left:parallel"] == "half_on_kerb":
-                    tagChanges["parking:left"] = "half_on_kerb"
-                    tagChanges["parking:lane:left:parallel"] = None
-                elif tags["parking:lane:left:parallel"] == "on_kerb":
-                    tagChanges["parking:left"] = "on_kerb"
-                    tagChanges["parking:lane:left:parallel"] = None
-                elif tags["parking:lane:left:parallel"] == "street_side":
-                    tagChanges["parking:left"] = "street_side"
-                    tagChanges["parking:lane:left:parallel"] = None
-                elif tags["parking:lane:left:parallel"] == "painted_area_only":
-                    tagChanges["parking:left"] = "lane"
-                    tagChanges["parking:left:markings"] = "yes"
-                    tagChanges["parking:lane:left:parallel"] = None
-                elif tags["parking:lane:left:parallel"] == "marked":
-                    tagChanges["parking:left:markings"] = "yes"
-                    tagChanges["parking:left"] = "yes" # Set the generic "yes" so that it's noted that you can obviously park there, but its unclear how
-                    tagChanges["parking:lane:left:parallel"] = None
-        elif tags["parking:lane:left"] == "diagonal":
-            tagChanges["parking:left:orientation"] = "diagonal"
-            tagChanges["parking:lane:left"] = None
-            if "parking:lane:left:diagonal" in tags:
-                if tags["parking:lane:left:diagonal"] == "on_street":
-                    tagChanges["parking:left"] = "lane"
-                    tagChanges["parking:lane:left:diagonal"] = None
-                elif tags["parking:lane:left:diagonal"] == "half_on_kerb":
-                    tagChanges["parking:left"] = "half_on_kerb"
-                    tagChanges["parking:lane:left:diagonal"] = None
-                elif tags["parking:lane:left:diagonal"] == "on_kerb":
-                    tagChanges["parking:left"] = "on_kerb"
-                    tagChanges["parking:lane:left:diagonal"] = None
-                elif tags["parking:lane:left:diagonal"] == "street_side":
-                    tagChanges["parking:left"] = "street_side"
-                    tagChanges["parking:lane:left:diagonal"] = None
-                elif tags["parking:lane:left:diagonal"] == "painted_area_only":
-                    tagChanges["parking:left"] = "lane"
-                    tagChanges["parking:left:markings"] = "yes"
-                    tagChanges["parking:lane:left:diagonal"] = None
-                elif tags["parking:lane:left:diagonal"] == "marked":
-                    tagChanges["parking:left:markings"] = "yes"
-                    tagChanges["parking:left"] = "yes" # Set the generic "yes" so that it's noted that you can obviously park there, but its unclear how
-                    tagChanges["parking:lane:left:diagonal"] = None
-        elif tags["parking:lane:left"] == "perpendicular":
-            tagChanges["parking:left:orientation"] = "perpendicular"
-            tagChanges["parking:lane:left"] = None
-            if "parking:lane:left:perpendicular" in tags:
-                if tags["parking:lane:left:perpendicular"] == "on_street":
-                    tagChanges["parking:left"] = "lane"
-                    tagChanges["parking:lane:left:perpendicular"] = None
-                elif tags["parking:lane:left:perpendicular"] == "half_on_kerb":
-                    tagChanges["parking:left"] = "half_on_kerb"
-                    tagChanges["parking:lane:left:perpendicular"] = None
-                elif tags["parking:lane:left:perpendicular"] == "on_kerb":
-                    tagChanges["parking:left"] = "on_kerb"
-                    tagChanges["parking:lane:left:perpendicular"] = None
-                elif tags["parking:lane:left:perpendicular"] == "street_side":
-                    tagChanges["parking:left"] = "street_side"
-                    tagChanges["parking:lane:left:perpendicular"] = None
-                elif tags["parking:lane:left:perpendicular"] == "painted_area_only":
-                    tagChanges["parking:left"] = "lane"
-                    tagChanges["parking:left:markings"] = "yes"
-                    tagChanges["parking:lane:left:perpendicular"] = None
-                elif tags["parking:lane:left:perpendicular"] == "marked":
-                    tagChanges["parking:left:markings"] = "yes"
-                    tagChanges["parking:left"] = "yes" # Set the generic "yes" so that it's noted that you can obviously park there, but its unclear how
-                    tagChanges["parking:lane:left:perpendicular"] = None
-        elif tags["parking:lane:left"] == "no":
-            tagChanges["parking:left"] = "no"
-            tagChanges["parking:lane:left"] = None
-        elif tags["parking:lane:left"] == "no_parking":
-            tagChanges["parking:left"] = "no"
-            tagChanges["parking:left:restriction"] = "no_parking"
-            tagChanges["parking:lane:left"] = None
-        elif tags["parking:lane:left"] == "no_stopping":
-            tagChanges["parking:left"] = "no"
-            tagChanges["parking:left:restriction"] = "no_stopping"
-            tagChanges["parking:lane:left"] = None
-        elif tags["parking:lane:left"] == "no_standing":
-            tagChanges["parking:left"] = "no"
-            tagChanges["parking:left:restriction"] = "no_standing"
-            tagChanges["parking:lane:left"] = None
-        elif tags["parking:lane:left"] == "separate":
-            tagChanges["parking:left"] = "separate"
-            tagChanges["parking:lane:left"] = None
-        elif tags["parking:lane:left"] == "marked":
-            tagChanges["parking:left:markings"] = "yes"
-            tagChanges["parking:left"] = "yes" # Set the generic "yes" so that it's noted that you can obviously park there, but its unclear how
-            tagChanges["parking:lane:left"] = None
-        elif tags["parking:lane:left"] == "marked" and "parking:lane:left:marked" in tags:
-            if tags["parking:lane:left:marked"] == "on_street":
-                tagChanges["parking:left"] = "lane"
-                tagChanges["parking:left:markings"] = "yes"
-                tagChanges["parking:lane:left:marked"] = None
-            elif tags["parking:lane:left:marked"] == "half_on_kerb":
-                tagChanges["parking:left"] = "half_on_kerb"
-                tagChanges["parking:left:markings"] = "yes"
-                tagChanges["parking:lane:left:marked"] = None
-            elif tags["parking:lane:left:marked"] == "on_kerb":
-                tagChanges["parking:left"] = "on_kerb"
-                tagChanges["parking:left:markings"] = "yes"
-                tagChanges["parking:lane:left:marked"] = None
-            elif tags["parking:lane:left:marked"] == "street_side":
-                tagChanges["parking:left"] = "street_side"
-                tagChanges["parking:left:markings"] = "yes"
-                tagChanges["parking:lane:left:marked"] = None
-    # Both sides
-    if "parking:lane:both" in tags:
-        if tags["parking:lane:both"] == "parallel":
-            tagChanges["parking:both:orientation"] = "parallel"
-            tagChanges["parking:lane:both"] = None
-            if "parking:lane:both:parallel" in tags:
-                if tags["parking:lane:both:parallel"] == "on_street":
-                    tagChanges["parking:both"] = "lane"
-                    tagChanges["parking:lane:both:parallel"] = None
-                elif tags["parking:lane:both:parallel"] == "half_on_kerb":
-                    tagChanges["parking:both"] = "half_on_kerb"
-                    tagChanges["parking:lane:both:parallel"] = None
-                elif tags["parking:lane:both:parallel"] == "on_kerb":
-                    tagChanges["parking:both"] = "on_kerb"
-                    tagChanges["parking:lane:both:parallel"] = None
-                elif tags["parking:lane:both:parallel"] == "street_side":
-                    tagChanges["parking:both"] = "street_side"
-                    tagChanges["parking:lane:both:parallel"] = None
-                elif tags["parking:lane:both:parallel"] == "painted_area_only":
-                    tagChanges["parking:both"] = "lane"
-                    tagChanges["parking:both:markings"] = "yes"
-                    tagChanges["parking:lane:both:parallel"] = None
-                elif tags["parking:lane:both:parallel"] == "marked":
-                    tagChanges["parking:both:markings"] = "yes"
-                    tagChanges["parking:lane:both:parallel"] = None
-        elif tags["parking:lane:both"] == "diagonal":
-            tagChanges["parking:both:orientation"] = "diagonal"
-            tagChanges["parking:lane:both"] = None
-            if "parking:lane:both:diagonal" in tags:
-                if tags["parking:lane:both:diagonal"] == "on_street":
-                    tagChanges["parking:both"] = "lane"
-                    tagChanges["parking:lane:both:diagonal"] = None
-                elif tags["parking:lane:both:diagonal"] == "half_on_kerb":
-                    tagChanges["parking:both"] = "half_on_kerb"
-                    tagChanges["parking:lane:both:diagonal"] = None
-                elif tags["parking:lane:both:diagonal"] == "on_kerb":
-                    tagChanges["parking:both"] = "on_kerb"
-                    tagChanges["parking:lane:both:diagonal"] = None
-                elif tags["parking:lane:both:diagonal"] == "street_side":
-                    tagChanges["parking:both"] = "street_side"
-                    tagChanges["parking:lane:both:diagonal"] = None
-                elif tags["parking:lane:both:diagonal"] == "painted_area_only":
-                    tagChanges["parking:both"] = "lane"
-                    tagChanges["parking:both:markings"] = "yes"
-                    tagChanges["parking:lane:both:diagonal"] = None
-                elif tags["parking:lane:both:diagonal"] == "marked":
-                    tagChanges["parking:both:markings"] = "yes"
-                    tagChanges["parking:lane:both:diagonal"] = None
-        elif tags["parking:lane:both"] == "perpendicular":
-            tagChanges["parking:both:orientation"] = "perpendicular"
-            tagChanges["parking:lane:both"] = None
-            if "parking:lane:both:perpendicular" in tags:
-                if tags["parking:lane:both:perpendicular"] == "on_street":
-                    tagChanges["parking:both"] = "lane"
-                    tagChanges["parking:lane:both:perpendicular"] = None
-                elif tags["parking:lane:both:perpendicular"] == "half_on_kerb":
-                    tagChanges["parking:both"] = "half_on_kerb"
-                    tagChanges["parking:lane:both:perpendicular"] = None
-                elif tags["parking:lane:both:perpendicular"] == "on_kerb":
-                    tagChanges["parking:both"] = "on_kerb"
-                    tagChanges["parking:lane:both:perpendicular"] = None
-                elif tags["parking:lane:both:perpendicular"] == "street_side":
-                    tagChanges["parking:both"] = "street_side"
-                    tagChanges["parking:lane:both:perpendicular"] = None
-                elif tags["parking:lane:both:perpendicular"] == "painted_area_only":
-                    tagChanges["parking:both"] = "lane"
-                    tagChanges["parking:both:markings"] = "yes"
-                    tagChanges["parking:lane:both:perpendicular"] = None
-                elif tags["parking:lane:both:perpendicular"] == "marked":
-                    tagChanges["parking:both:markings"] = "yes"
-                    tagChanges["parking:lane:both:perpendicular"] = None
-        elif tags["parking:lane:both"] == "no":
-            tagChanges["parking:both"] = "no"
-            tagChanges["parking:lane:both"] = None
-        elif tags["parking:lane:both"] == "no_parking":
-            tagChanges["parking:both"] = "no"
-            tagChanges["parking:both:restriction"] = "no_parking"
-            tagChanges["parking:lane:both"] = None
-        elif tags["parking:lane:both"] == "no_stopping":
-            tagChanges["parking:both"] = "no"
-            tagChanges["parking:both:restriction"] = "no_stopping"
-            tagChanges["parking:lane:both"] = None
-        elif tags["parking:lane:both"] == "no_standing":
-            tagChanges["parking:both"] = "no"
-            tagChanges["parking:both:restriction"] = "no_standing"
-            tagChanges["parking:lane:both"] = None
-        elif tags["parking:lane:both"] == "separate":
-            tagChanges["parking:both"] = "separate"
-            tagChanges["parking:lane:both"] = None
-        elif tags["parking:lane:both"] == "marked":
-            tagChanges["parking:both:markings"] = "yes"
-            tagChanges["parking:lane:both"] = None
-        elif tags["parking:lane:both"] == "marked" and "parking:lane:both:marked" in tags:
-            if tags["parking:lane:both:marked"] == "on_street":
-                tagChanges["parking:both"] = "lane"
-                tagChanges["parking:both:markings"] = "yes"
-                tagChanges["parking:lane:both:marked"] = None
-            elif tags["parking:lane:both:marked"] == "half_on_kerb":
-                tagChanges["parking:both"] = "half_on_kerb"
-                tagChanges["parking:both:markings"] = "yes"
-                tagChanges["parking:lane:both:marked"] = None
-            elif tags["parking:lane:both:marked"] == "on_kerb":
-                tagChanges["parking:both"] = "on_kerb"
-                tagChanges["parking:both:markings"] = "yes"
-                tagChanges["parking:lane:both:marked"] = None
-            elif tags["parking:lane:both:marked"] == "street_side":
-                tagChanges["parking:both"] = "street_side"
-                tagChanges["parking:both:markings"] = "yes"
-                tagChanges["parking:lane:both:marked"] = None
-    # Other things like conditions
-    ## Ensure base parking tag when any sub-tag exists under parking:<side> in converted tags
-    ## Said differently: if there is a tag parking:<side>:<something>, then there should also a tag set parking:<side> with value "yes" (but only if the tag does not exist already with a more specific value)
-    for side in ["right", "left", "both"]:
-        base = f"parking:{side}"
-        is_basetag_set = tagChanges.get(base) is not None
-        basetag_needs_to_be_set = False
-        for key in tagChanges:
-            if key.startswith(base + ":") and key != base:
-                if not is_basetag_set:
-                    basetag_needs_to_be_set = True # Don't change the dict during iteration
-        
-        if basetag_needs_to_be_set:
-            tagChanges[base] = "yes"
 
-    ## Free parking
-    if "parking:condition:right" in tags and tags["parking:condition:right"] == "free":
-        tagChanges["parking:right:fee"] = "no"
-        tagChanges["parking:condition:right"] = None
-    if "parking:condition:left" in tags and tags["parking:condition:left"] == "free":
-        tagChanges["parking:left:fee"] = "no"
-        tagChanges["parking:condition:left"] = None
-    if "parking:condition:both" in tags and tags["parking:condition:both"] == "free":
-        tagChanges["parking:both:fee"] = "no"
-        tagChanges["parking:condition:both"] = None
-    ## condition: disc
-    if "parking:condition:right" in tags and tags["parking:condition:right"] == "disc":
-        if "parking:condition:right:maxstay" in tags and "parking:condition:right:time_interval" in tags:
-            maxstay = tags["parking:condition:right:maxstay"]
-            interval = tags["parking:condition:right:time_interval"]
-            tagChanges["parking:right:maxstay:conditional"] = f"{maxstay} @ {interval}"
-            tagChanges["parking:right:authentication:disc:conditional"] = f"yes @ {interval}"
-            tagChanges["parking:condition:right"] = None
-            tagChanges["parking:condition:right:maxstay"] = None
-            tagChanges["parking:condition:right:time_interval"] = None
-    if "parking:condition:left" in tags and tags["parking:condition:left"] == "disc":
-        if "parking:condition:left:maxstay" in tags and "parking:condition:left:time_interval" in tags:
-            maxstay = tags["parking:condition:left:maxstay"]
-            interval = tags["parking:condition:left:time_interval"]
-            tagChanges["parking:left:maxstay:conditional"] = f"{maxstay} @ {interval}"
-            tagChanges["parking:left:authentication:disc:conditional"] = f"yes @ {interval}"
-            tagChanges["parking:condition:left"] = None
-            tagChanges["parking:condition:left:maxstay"] = None
-            tagChanges["parking:condition:left:time_interval"] = None
-    if "parking:condition:both" in tags and tags["parking:condition:both"] == "disc":
-        if "parking:condition:both:maxstay" in tags and "parking:condition:both:time_interval" in tags:
-            maxstay = tags["parking:condition:both:maxstay"]
-            interval = tags["parking:condition:both:time_interval"]
-            tagChanges["parking:both:maxstay:conditional"] = f"{maxstay} @ {interval}"
-            tagChanges["parking:both:authentication:disc:conditional"] = f"yes @ {interval}"
-            tagChanges["parking:condition:both"] = None
-            tagChanges["parking:condition:both:maxstay"] = None
-            tagChanges["parking:condition:both:time_interval"] = None
-    ## condition: ticket
-    if "parking:condition:right" in tags and tags["parking:condition:right"] == "ticket":
-        tagChanges["parking:right:fee"] = "yes"
-        tagChanges["parking:right:authentication:ticket"] = "yes"
-        tagChanges["parking:condition:right"] = None
-    if "parking:condition:left" in tags and tags["parking:condition:left"] == "ticket":
-        tagChanges["parking:left:fee"] = "yes"
-        tagChanges["parking:left:authentication:ticket"] = "yes"
-        tagChanges["parking:condition:left"] = None
-    if "parking:condition:both" in tags and tags["parking:condition:both"] == "ticket":
-        tagChanges["parking:both:fee"] = "yes"
-        tagChanges["parking:both:authentication:ticket"] = "yes"
-        tagChanges["parking:condition:both"] = None
-    ## condition: no_parking
-    if "parking:condition:right" in tags and tags["parking:condition:right"] == "no_parking":
-        tagChanges["parking:right"] = "no"
-        tagChanges["parking:right:restriction"] = "no_parking"
-        tagChanges["parking:condition:right"] = None
-    if "parking:condition:left" in tags and tags["parking:condition:left"] == "no_parking":
-        tagChanges["parking:left"] = "no"
-        tagChanges["parking:left:restriction"] = "no_parking"
-        tagChanges["parking:condition:left"] = None
-    if "parking:condition:both" in tags and tags["parking:condition:both"] == "no_parking":
-        tagChanges["parking:both"] = "no"
-        tagChanges["parking:both:restriction"] = "no_parking"
-        tagChanges["parking:condition:both"] = None
-    ## condition: no_stopping
-    if "parking:condition:right" in tags and tags["parking:condition:right"] == "no_stopping":
-        tagChanges["parking:right"] = "no"
-        tagChanges["parking:right:restriction"] = "no_stopping"
-        tagChanges["parking:condition:right"] = None
-    if "parking:condition:left" in tags and tags["parking:condition:left"] == "no_stopping":
-        tagChanges["parking:left"] = "no"
-        tagChanges["parking:left:restriction"] = "no_stopping"
-        tagChanges["parking:condition:left"] = None
-    if "parking:condition:both" in tags and tags["parking:condition:both"] == "no_stopping":
-        tagChanges["parking:both"] = "no"
-        tagChanges["parking:both:restriction"] = "no_stopping"
-        tagChanges["parking:condition:both"] = None
-    # capacity: parking:lane:<side>:capacity OR parking:lane:<side>:capacity -> parking:<side>:capacity
-    if "parking:lane:right:capacity" in tags:
-        tagChanges["parking:right:capacity"] = tags["parking:lane:right:capacity"]
-        tagChanges["parking:lane:right:capacity"] = None
-    if "parking:lane:left:capacity" in tags:
-        tagChanges["parking:left:capacity"] = tags["parking:lane:left:capacity"]
-        tagChanges["parking:lane:left:capacity"] = None
-    if "parking:lane:both:capacity" in tags:
-        tagChanges["parking:both:capacity"] = tags["parking:lane:both:capacity"]
-        tagChanges["parking:lane:both:capacity"] = None
-    if "parking:condition:right:capacity" in tags:
-        tagChanges["parking:right:capacity"] = tags["parking:condition:right:capacity"]
-        tagChanges["parking:condition:right:capacity"] = None
-    if "parking:condition:left:capacity" in tags:
-        tagChanges["parking:left:capacity"] = tags["parking:condition:left:capacity"]
-        tagChanges["parking:condition:left:capacity"] = None
-    if "parking:condition:both:capacity" in tags:
-        tagChanges["parking:both:capacity"] = tags["parking:condition:both:capacity"]
-        tagChanges["parking:condition:both:capacity"] = None
-    
-    
-    ## Combine left and right tags if they are the same
-    if "parking:right" in tagChanges and "parking:left" in tagChanges and tagChanges["parking:right"] == tagChanges["parking:left"]:
-        tagChanges["parking:both"] = tagChanges["parking:right"]
-        tagChanges["parking:right"] = None
-        tagChanges["parking:left"] = None
-    if "parking:right:orientation" in tagChanges and "parking:left:orientation" in tagChanges and tagChanges["parking:right:orientation"] == tagChanges["parking:left:orientation"]:
-        tagChanges["parking:both:orientation"] = tagChanges["parking:right:orientation"]
-        tagChanges["parking:right:orientation"] = None
-        tagChanges["parking:left:orientation"] = None
-    if "parking:right:markings" in tagChanges and "parking:left:markings" in tagChanges and tagChanges["parking:right:markings"] == tagChanges["parking:left:markings"]:
-        tagChanges["parking:both:markings"] = tagChanges["parking:right:markings"]
-        tagChanges["parking:right:markings"] = None
-        tagChanges["parking:left:markings"] = None
-    if "parking:right:fee" in tagChanges and "parking:left:fee" in tagChanges and tagChanges["parking:right:fee"] == tagChanges["parking:left:fee"]:
-        tagChanges["parking:both:fee"] = tagChanges["parking:right:fee"]
-        tagChanges["parking:right:fee"] = None
-        tagChanges["parking:left:fee"] = None
-    if "parking:right:restriction" in tagChanges and "parking:left:restriction" in tagChanges and tagChanges["parking:right:restriction"] == tagChanges["parking:left:restriction"]:
-        tagChanges["parking:both:restriction"] = tagChanges["parking:right:restriction"]
-        tagChanges["parking:right:restriction"] = None
-        tagChanges["parking:left:restriction"] = None
-    if "parking:right:maxstay" in tagChanges and "parking:left:maxstay" in tagChanges and tagChanges["parking:right:maxstay"] == tagChanges["parking:left:maxstay"]:
-        tagChanges["parking:both:maxstay"] = tagChanges["parking:right:maxstay"]
-        tagChanges["parking:right:maxstay"] = None
-        tagChanges["parking:left:maxstay"] = None
-    if "parking:right:maxstay:conditional" in tagChanges and "parking:left:maxstay:conditional" in tagChanges and tagChanges["parking:right:maxstay:conditional"] == tagChanges["parking:left:maxstay:conditional"]:
-        tagChanges["parking:both:maxstay:conditional"] = tagChanges["parking:right:maxstay:conditional"]
-        tagChanges["parking:right:maxstay:conditional"] = None
-        tagChanges["parking:left:maxstay:conditional"] = None
-    if "parking:right:authentication:disc" in tagChanges and "parking:left:authentication:disc" in tagChanges and tagChanges["parking:right:authentication:disc"] == tagChanges["parking:left:authentication:disc"]:
-        tagChanges["parking:both:authentication:disc"] = tagChanges["parking:right:authentication:disc"]
-        tagChanges["parking:right:authentication:disc"] = None
-        tagChanges["parking:left:authentication:disc"] = None
-    if "parking:right:authentication:disc:conditional" in tagChanges and "parking:left:authentication:disc:conditional" in tagChanges and tagChanges["parking:right:authentication:disc:conditional"] == tagChanges["parking:left:authentication:disc:conditional"]:
-        tagChanges["parking:both:authentication:disc:conditional"] = tagChanges["parking:right:authentication:disc:conditional"]
-        tagChanges["parking:right:authentication:disc:conditional"] = None
-        tagChanges["parking:left:authentication:disc:conditional"] = None
-    if "parking:right:capacity" in tagChanges and "parking:left:capacity" in tagChanges and tagChanges["parking:right:capacity"] == tagChanges["parking:left:capacity"]:
-        tagChanges["parking:both:capacity"] = tagChanges["parking:right:capacity"]
-        tagChanges["parking:right:capacity"] = None
-        tagChanges["parking:left:capacity"] = None
+SIDES = ("right", "left", "both")
+BASE_TAGS = tuple(f"parking:{side}" for side in SIDES)
+ORIENTATIONS = ("parallel", "diagonal", "perpendicular")
+
+
+class TagValue:
+    """A new tag value built from other tags of the way, e.g. TagValue("{maxstay} @ {interval}", maxstay=<key>, ...)."""
+
+    def __init__(self, template, **fields):
+        self.template = template
+        self.fields = fields
+
+    def for_side(self, side):
+        return TagValue(self.template, **{name: key.format(side=side) for name, key in self.fields.items()})
+
+    def __call__(self, tags):
+        return self.template.format(**{name: tags[key] for name, key in self.fields.items()})
+
+
+def _lane_position_rules(orientation):
+    # parking:lane:<side>:<orientation>=<position>, only looked at after parking:lane:<side>=<orientation>
+    sub_key = "parking:lane:{side}:" + orientation
+    rules = [
+        (sub_key, position, [("parking:{side}", new_value), (sub_key, None)], SIDES)
+        for position, new_value in (("on_street", "lane"), ("half_on_kerb", "half_on_kerb"),
+                                    ("on_kerb", "on_kerb"), ("street_side", "street_side"))
+    ]
+    rules += [
+        (sub_key, "painted_area_only", [("parking:{side}", "lane"), ("parking:{side}:markings", "yes"), (sub_key, None)], SIDES),
+        # The generic "yes" notes that you can obviously park there, but it is unclear how
+        (sub_key, "marked", [("parking:{side}:markings", "yes"), ("parking:{side}", "yes"), (sub_key, None)], ("right", "left")),
+        (sub_key, "marked", [("parking:{side}:markings", "yes"), (sub_key, None)], ("both",)),
+    ]
+    return rules
+
+
+# Rules are rows of (old key, old value, changes, sides): on a way where the old key has the old value,
+# the changes are applied in order (None removes a tag). "{side}" stands for each of the listed sides.
+# An old value of None matches any value.
+LANE_RULES = [
+    *[("parking:lane:{side}", orientation,
+       [("parking:{side}:orientation", orientation), ("parking:lane:{side}", None)], SIDES)
+      for orientation in ORIENTATIONS],
+    ("parking:lane:{side}", "no", [("parking:{side}", "no"), ("parking:lane:{side}", None)], SIDES),
+    *[("parking:lane:{side}", restriction,
+       [("parking:{side}", "no"), ("parking:{side}:restriction", restriction), ("parking:lane:{side}", None)], SIDES)
+      for restriction in ("no_parking", "no_stopping", "no_standing")],
+    ("parking:lane:{side}", "separate", [("parking:{side}", "separate"), ("parking:lane:{side}", None)], SIDES),
+    ("parking:lane:{side}", "marked", [("parking:{side}:markings", "yes"), ("parking:lane:{side}", None)], ("right", "both")),
+    ("parking:lane:{side}", "marked",
+     [("parking:{side}:markings", "yes"), ("parking:{side}", "yes"), ("parking:lane:{side}", None)], ("left",)),
+]
+LANE_POSITION_RULES = {orientation: _lane_position_rules(orientation) for orientation in ORIENTATIONS}
+
+# Applied after the lane rules, ordered by row and then by side
+CONDITION_RULES = [
+    ("parking:condition:{side}", "free", [("parking:{side}:fee", "no"), ("parking:condition:{side}", None)], SIDES),
+    ("parking:condition:{side}", "disc", [
+        ("parking:{side}:maxstay:conditional", TagValue("{maxstay} @ {interval}",
+                                                        maxstay="parking:condition:{side}:maxstay",
+                                                        interval="parking:condition:{side}:time_interval")),
+        ("parking:{side}:authentication:disc:conditional", TagValue("yes @ {interval}",
+                                                                    interval="parking:condition:{side}:time_interval")),
+        ("parking:condition:{side}", None),
+        ("parking:condition:{side}:maxstay", None),
+        ("parking:condition:{side}:time_interval", None),
+    ], SIDES),
+    ("parking:condition:{side}", "ticket", [("parking:{side}:fee", "yes"), ("parking:{side}:authentication:ticket", "yes"),
+                                            ("parking:condition:{side}", None)], SIDES),
+    *[("parking:condition:{side}", restriction,
+       [("parking:{side}", "no"), ("parking:{side}:restriction", restriction), ("parking:condition:{side}", None)], SIDES)
+      for restriction in ("no_parking", "no_stopping")],
+    *[(capacity_key, None, [("parking:{side}:capacity", TagValue("{capacity}", capacity=capacity_key)), (capacity_key, None)], SIDES)
+      for capacity_key in ("parking:lane:{side}:capacity", "parking:condition:{side}:capacity")],
+]
+
+# parking:right:<suffix> and parking:left:<suffix> with the same value are merged into parking:both:<suffix>
+COMBINED_SUFFIXES = ("", ":orientation", ":markings", ":fee", ":restriction", ":maxstay", ":maxstay:conditional",
+                     ":authentication:disc", ":authentication:disc:conditional", ":capacity")
+
+# Condition rules rank after all lane rules; the base tags are filled in between
+CONDITION_RANK = len(SIDES)
+
+
+class ParkingRule:
+    __slots__ = ("rank", "changes", "constant_changes", "required_keys", "sub_tag_bases", "then_key", "then")
+
+    def __init__(self, rank, changes):
+        self.rank = rank
+        self.changes = changes
+        # Most rules only set fixed values, which is a single dict update
+        has_tag_values = any(isinstance(value, TagValue) for _, value in changes)
+        self.constant_changes = None if has_tag_values else dict(changes)
+        # TagValue fields must all be present, otherwise the rule does not apply
+        self.required_keys = tuple(dict.fromkeys(
+            key for _, value in changes if isinstance(value, TagValue) for key in value.fields.values()
+        ))
+        # parking:<side> base tags for which this rule sets a parking:<side>:* sub tag
+        self.sub_tag_bases = tuple(base for base in BASE_TAGS if any(key.startswith(base + ":") for key, _ in changes))
+        # Follow-up rules keyed by the value of then_key
+        self.then_key = None
+        self.then = None
+
+    def apply(self, tags, tagChanges):
+        """Apply the rule and its follow-up; returns the base tags that got a sub tag."""
+        for key in self.required_keys:
+            if key not in tags:
+                return ()
+        if self.constant_changes is not None:
+            tagChanges.update(self.constant_changes)
+        else:
+            for key, value in self.changes:
+                tagChanges[key] = value(tags) if isinstance(value, TagValue) else value
+        if self.then_key is not None:
+            follow_up = self.then.get(tags.get(self.then_key))
+            if follow_up is not None:
+                return self.sub_tag_bases + follow_up.apply(tags, tagChanges)
+        return self.sub_tag_bases
+
+
+def _compile_rules(rows, first_rank=0, by_side=False):
+    """
+    Expand *rows* for their sides and index them as {old key: {old value: rule}}; wildcard rules under the value None.
+    Rules run ordered by row and then by side, or with *by_side* by side only.
+    """
+    index = {}
+    for row_number, (key_template, value, changes, sides) in enumerate(rows):
+        for side in sides:
+            side_changes = tuple(
+                (new_key.format(side=side), new_value.for_side(side) if isinstance(new_value, TagValue) else new_value)
+                for new_key, new_value in changes
+            )
+            rank = first_rank + (SIDES.index(side) if by_side else row_number * len(SIDES) + SIDES.index(side))
+            index.setdefault(key_template.format(side=side), {})[value] = ParkingRule(rank, side_changes)
+    return index
+
+
+def compile_parking_rules():
+    """Compile the rule tables into one index {old key: {old value: rule}}."""
+    # A way has one parking:lane:<side> value per side, so the lane rules run side by side
+    index = _compile_rules(LANE_RULES, by_side=True)
+    for key, rules in index.items():
+        for value, rule in rules.items():
+            if value in LANE_POSITION_RULES:
+                rule.then_key = f"{key}:{value}"
+                rule.then = _compile_rules(LANE_POSITION_RULES[value])[rule.then_key]
+    index.update(_compile_rules(CONDITION_RULES, first_rank=CONDITION_RANK))
+    return index
+
+
+PARKING_RULES = compile_parking_rules()
+PARKING_RULE_KEYS = frozenset(PARKING_RULES)
+# parking:right:<suffix>, parking:left:<suffix> and parking:both:<suffix> for every suffix that is merged
+COMBINED_KEYS = tuple((f"parking:right{suffix}", f"parking:left{suffix}", f"parking:both{suffix}")
+                      for suffix in COMBINED_SUFFIXES)
+
+
+# parking:both<suffix> -> (parking:left<suffix>, parking:right<suffix>), filled as keys come up
+_SIDE_KEYS = {}
+
 
+def _rank(rule):
+    return rule.rank
+
+
+def _combine_sides(tagChanges):
+    for right, left, both in COMBINED_KEYS:
+        if right in tagChanges and left in tagChanges and tagChanges[right] == tagChanges[left]:
+            tagChanges[both] = tagChanges[right]
+            tagChanges[right] = None
+            tagChanges[left] = None
     # Remove side-specific tags when they duplicate a parking:both value
     for key, value in list(tagChanges.items()):
-        if not key.startswith("parking:both") or value is None:
+        if value is None or not key.startswith("parking:both"):
             continue
-        suffix = key[len("parking:both"):]  # includes the leading colon or is empty for the base tag
-        for side in ["left", "right"]:
-            side_key = f"parking:{side}{suffix}"
+        side_keys = _SIDE_KEYS.get(key)
+        if side_keys is None:
+            suffix = key[len("parking:both"):]  # includes the leading colon or is empty for the base tag
+            side_keys = _SIDE_KEYS[key] = (f"parking:left{suffix}", f"parking:right{suffix}")
+        for side_key in side_keys:
             if side_key in tagChanges and tagChanges[side_key] == value:
                 tagChanges[side_key] = None
-    print(f"[convert_base_parking_tags] Calculated tag changes: {tagChanges}")
+
+
+def convert_base_parking_tags(tags):
+    logger.debug("Received tags: %s", tags)
+    tagChanges = {} # to set a new tag: "newTag": "newValue", to unset a tag: "oldTag": None
+    # Go thhrough all tags; if a tag contains parking and the value is "lay_by", change the value of this tag to street_side
+    for key, value in tags.items():
+        if value == "lay_by" and "parking" in key:
+            tags[key] = "street_side" # In this case, we want to manipulate the tags themself, not the tagChanges dict
+    # Only the rules for keys present on the way are looked at; they run in table order
+    lane_rules = []
+    condition_rules = []
+    for key in PARKING_RULE_KEYS.intersection(tags):
+        rules = PARKING_RULES[key]
+        rule = rules.get(tags[key]) or rules.get(None)
+        if rule is None:
+            continue
+        if rule.rank < CONDITION_RANK:
+            lane_rules.append(rule)
+        else:
+            condition_rules.append(rule)
+    if len(lane_rules) > 1:
+        lane_rules.sort(key=_rank)
+    bases_with_sub_tags = set()
+    for rule in lane_rules:
+        bases_with_sub_tags.update(rule.apply(tags, tagChanges))
+    # If there is a tag parking:<side>:<something>, there should also be a tag parking:<side>,
+    # with value "yes" unless a more specific value is already set
+    for base in BASE_TAGS:
+        if base in bases_with_sub_tags and tagChanges.get(base) is None:
+            tagChanges[base] = "yes"
+    if len(condition_rules) > 1:
+        condition_rules.sort(key=_rank)
+    for rule in condition_rules:
+        rule.apply(tags, tagChanges)
+    _combine_sides(tagChanges)
+    logger.debug("Calculated tag changes: %s", tagChanges)
     return tagChanges
 
 
 def apply_tag_changes_to_tags(tags, tag_changes):
-    updated = copy.deepcopy(tags)
+    updated = dict(tags)
     for key, value in tag_changes.items():
         if value is None:
             updated.pop(key, None)
@@ -632,7 +360,7 @@ def build_conversion_breakdown(original_tags, tag_changes):
 
 def are_all_old_parking_tags_gone(tags, tagChanges):
     # go through the tags. If a key in the tags dictionary has a value of None in the tagChanges dictionary, remove the key from the tags dictionary
-    poppableDict = copy.deepcopy(tags)
+    poppableDict = dict(tags)
     for key in tags:
         if key in tagChanges and tagChanges[key] == None:
             poppableDict.pop(key)
@@ -647,108 +375,80 @@ def are_all_old_parking_tags_gone(tags, tagChanges):
     return offendingTags
 
 
+def parking_signature(tags):
+    """
+    The parking related tags of a way, sorted; the conversion depends on nothing else.
+    The rules run in table order, so only the order of the offending tags follows the tags of the way
+    (see convert_element()).
+    """
+    return tuple(sorted((key, value) for key, value in tags.items() if "parking" in key))
 
-op = mrcb.Overpass()
 
-elements = op.getElementsFromQuery(
+@functools.lru_cache(maxsize=None)
+def convert_parking_signature(signature):
     """
+    Convert the parking tags of a signature (see parking_signature()) once for all ways that share it.
+    Returns (tag changes, breakdown text, offending tags); the dicts are shared and must not be modified.
+    """
+    original_tags = dict(signature)
+    tags_for_conversion = dict(signature)
+    dd = convert_base_parking_tags(tags_for_conversion)
+    conversion_breakdown = build_conversion_breakdown(original_tags, dd)
+    logger.debug("Conversion breakdown: %s", conversion_breakdown)
+    breakdown_text = ""
+    if conversion_breakdown:
+        breakdown_text = "\n\nAutomatic Conversion (old => new):\n" + "\n".join([f"- {line}" for line in conversion_breakdown])
+    # Only provide cooperative work if there are no old parking tags left
+    offendingTags = are_all_old_parking_tags_gone(tags_for_conversion, dd)
+    return dd, breakdown_text, offendingTags
+
+
+def conversion_cache_hit_rate():
+    info = convert_parking_signature.cache_info()
+    lookups = info.hits + info.misses
+    return info.hits / lookups if lookups else 0.0
+
+
+PARKING_QUERY = """
 [out:json][timeout:250];
 way["parking:lane:right"];
 way["parking:lane:both"];
 way["parking:lane:left"];
 out geom;
-    """
-)
-
-
+"""
 
-print(f"[main] Retrieved {len(elements)} elements from Overpass")
 
-challenge = mrcb.Challenge()
+def iter_elements():
+    """
+    Stream the parking ways from Overpass and yield them in random order, so a challenge that hits its
+    task limit holds a random selection of ways rather than the first ones Overpass returned.
+    With PROCESS_LIMIT set, a uniform random sample of that many ways is drawn (reservoir sampling),
+    so only the sample is ever held in memory; otherwise all ways are read and shuffled.
+    The stream is always read to the end, which also lets the Overpass cache store it.
+    """
+    op = mrcb.Overpass(cache=mrcb.OverpassCache())
+    elements = op.iterElementsFromQuery(PARKING_QUERY)
+    if PROCESS_LIMIT is None:
+        sample = list(elements)
+    else:
+        sample = []
+        for seen, element in enumerate(elements):
+            if seen < PROCESS_LIMIT:
+                sample.append(element)
+            else:
+                slot = random.randint(0, seen)
+                if slot < PROCESS_LIMIT:
+                    sample[slot] = element
+    random.shuffle(sample)
+    logger.info("Sampled %d elements from Overpass", len(sample))
+    yield from sample
 
-random.shuffle(elements)
 
-processed_count = 0
-for element in tqdm(elements):
-    if PROCESS_LIMIT is not None and processed_count >= PROCESS_LIMIT:
-        print(f"[main] Process limit {PROCESS_LIMIT} reached, stopping early")
-        break
-    processed_count += 1
-    print(f"[main] Processing element {element['type']} {element['id']}")
+def _make_task(element, instruction, cooperativeWork):
     # Convert the geometry into a LineString
     # In the element, element["geometry"] is a dict of {"lat": float, "lon": float} for each node in the way
     # Convert this into a list of [lon, lat] pairs
     geom = [[node["lon"], node["lat"]] for node in element["geometry"]]
-    # geom = mrcb.getElementCenterPoint(element)
-    original_tags = copy.deepcopy(element["tags"])
-    tags_for_conversion = copy.deepcopy(element["tags"])
-    dd = convert_base_parking_tags(tags_for_conversion)
-    print(f"[main] Conversion result for {element['id']}: {dd}")
-    conversion_breakdown = build_conversion_breakdown(original_tags, dd)
-    print(f"[main] Conversion breakdown for {element['id']}: {conversion_breakdown}")
-    breakdown_text = ""
-    if conversion_breakdown:
-        breakdown_text = "\n\nAutomatic Conversion (old => new):\n" + "\n".join([f"- {line}" for line in conversion_breakdown])
-
-    # Only provide cooperative work if there are no old parking tags left
-    offendingTags = are_all_old_parking_tags_gone(tags_for_conversion, dd)
-    print(f"[main] Offending tags for element {element['id']}: {offendingTags}")
-    cooperativeWork = None
-    if offendingTags == {}:
-        cooperativeWork = mrcb.TagFix(
-            element["type"],
-            element["id"],
-            dd
-        )
-        instruction = MSG_COMPLETE
-        if breakdown_text:
-            instruction += breakdown_text
-        print(f"[main] Element {element['id']} fully converted without AI")
-    else:
-        base_instruction = MSG_INCOMPLETE_1
-        # Use dict comprehension to print "- ❌ KEY: VALUE" for all keys in offendingTags
-        base_instruction += "\n".join([f"- ❌ {key}={offendingTags[key]}" for key in offendingTags])
-        base_instruction += MSG_INCOMPLETE_2
-
-        ai_used = False
-        if aihelper is not None and free_tokens is not None:
-            available_model = free_tokens.get_model_with_kontingent_from_list(
-                getattr(aihelper, "DEFAULT_MODEL_ORDER", [])
-            )
-            if available_model:
-                print(f"[main] Trying AI conversion for element {element['id']} with model {available_model}")
-                try:
-                    mr_ops, _ = aihelper.request_ai_parking_conversion(
-                        element, model_order=[available_model]
-                    )
-                    if mr_ops:
-                        cooperativeWork = PrebuiltCooperativeWork(mr_ops)
-                        instruction = MSG_COMPLETE_AI
-                        ai_used = True
-                        print(f"[main] AI provided cooperative work for element {element['id']}")
-                except Exception:
-                    ai_used = False
-                    print(f"[main] AI conversion failed for element {element['id']}")
-            else:
-                print(f"[main] No AI model available for element {element['id']}")
-        else:
-            print("[main] AI helper or free_tokens not available, skipping AI conversion")
-
-        if not ai_used or cooperativeWork is None:
-            cooperativeWork = mrcb.TagFix(
-                    element["type"],
-                    element["id"],
-                    {"thistagwillneverbepresentandwillnotchangetags":None}
-                )
-            print(f"[main] Fallback cooperative work used for element {element['id']}")
-            if ONLY_AUTO_TASKS:
-                print(f"[main] Skipping element {element['id']} because ONLY_AUTO_TASKS is enabled and no AI result was available")
-                continue
-            instruction = base_instruction
-            if breakdown_text:
-                instruction += breakdown_text
-        else:
-            instruction = MSG_COMPLETE_AI
     mainFeature = mrcb.GeoFeature.withId(
         element["type"],
         element["id"],
@@ -758,18 +458,195 @@ for element in tqdm(elements):
             "oneway": "yes",
         },
     )
-    t = mrcb.Task(
+    return mrcb.Task(
         mainFeature,
         additionalFeatures=[],
         cooperativeWork=cooperativeWork
     )
 
 
-    challenge.addTask(t)
-    print(f"[main] Task added for element {element['id']}")
+def convert_element(element):
+    """
+    Convert the parking tags of one way without any AI help.
+    Returns (task, None) if the way could be fully converted, otherwise (None, instruction for a manual conversion).
+    """
+    logger.debug("Processing element %s %s", element["type"], element["id"])
+    # Ways with the same parking tags share one conversion
+    with instrumentation.stage("convert"):
+        dd, breakdown_text, offendingTags = convert_parking_signature(parking_signature(element["tags"]))
+    if len(offendingTags) > 1:
+        # The signature is sorted; list the offending tags in the order of the way
+        offendingTags = {key: offendingTags[key] for key in element["tags"] if key in offendingTags}
+    logger.debug("Conversion result for %s: %s", element["id"], dd)
+    logger.debug("Offending tags for element %s: %s", element["id"], offendingTags)
+    if offendingTags == {}:
+        cooperativeWork = mrcb.TagFix(
+            element["type"],
+            element["id"],
+            dd
+        )
+        instruction = MSG_COMPLETE
+        if breakdown_text:
+            instruction += breakdown_text
+        logger.debug("Element %s fully converted without AI", element["id"])
+        return _make_task(element, instruction, cooperativeWork), None
+    instruction = MSG_INCOMPLETE_1
+    # Use dict comprehension to print "- ❌ KEY: VALUE" for all keys in offendingTags
+    instruction += "\n".join([f"- ❌ {key}={offendingTags[key]}" for key in offendingTags])
+    instruction += MSG_INCOMPLETE_2
+    if breakdown_text:
+        instruction += breakdown_text
+    return None, instruction
+
+
+def ai_available():
+    # aihelper imports without the openai package, but then every request would fail
+    return aihelper is not None and aihelper.OpenAI is not None
+
 
-challenge.cap()
-print("[main] Challenge capped")
+def convert_with_ai(element, manual_instruction):
+    """
+    Ask the AI to convert a way that convert_element() could not fully convert.
+    Without an AI result the task asks for a manual conversion, or is skipped (returns None) with ONLY_AUTO_TASKS.
+    """
+    cooperativeWork = None
+    if not ai_available():
+        logger.debug("AI helper, free_tokens or openai not available, skipping AI conversion")
+    elif not aihelper.get_scheduler().available:
+        logger.debug("No AI model with tokens left for element %s", element["id"])
+    else:
+        logger.debug("Trying AI conversion for element %s", element["id"])
+        instrumentation.count("ai_requests")
+        try:
+            # The models are picked and their token budgets kept by aihelper's shared scheduler
+            with instrumentation.stage("ai"):
+                mr_ops, _ = aihelper.request_ai_parking_conversion(element)
+            if mr_ops:
+                cooperativeWork = PrebuiltCooperativeWork(mr_ops)
+                logger.debug("AI provided cooperative work for element %s", element["id"])
+        except Exception:
+            instrumentation.count("ai_failures")
+            logger.warning("AI conversion failed for element %s", element["id"], exc_info=True)
+
+    if cooperativeWork is not None:
+        return _make_task(element, MSG_COMPLETE_AI, cooperativeWork)
+    logger.debug("Fallback cooperative work used for element %s", element["id"])
+    if ONLY_AUTO_TASKS:
+        logger.debug("Skipping element %s because ONLY_AUTO_TASKS is enabled and no AI result was available", element["id"])
+        return None
+    cooperativeWork = mrcb.TagFix(
+            element["type"],
+            element["id"],
+            {"thistagwillneverbepresentandwillnotchangetags":None}
+        )
+    return _make_task(element, manual_instruction, cooperativeWork)
+
+
+def build_task(element):
+    """
+    Convert one parking way into a task. Returns None if the way is skipped (see ONLY_AUTO_TASKS).
+    """
+    task, manual_instruction = convert_element(element)
+    if task is not None:
+        return task
+    return convert_with_ai(element, manual_instruction)
 
-challenge.saveToFile("parking_converter.json")
-print("[main] Challenge saved to parking_converter.json")
+
+def process_element(element):
+    """
+    Worker process stage: convert one way and serialize its task.
+    Returns (record, manual instruction, cache hit): the serialized task or None if the way is skipped,
+    or a manual instruction if the way has to go through the AI stage of the main process instead.
+    """
+    hits = convert_parking_signature.cache_info().hits
+    task, manual_instruction = convert_element(element)
+    cache_hit = convert_parking_signature.cache_info().hits > hits
+    if task is None and ai_available():
+        return None, manual_instruction, cache_hit
+    if task is None:
+        task = convert_with_ai(element, manual_instruction)
+    return (mrcb.serializeTask(task) if task is not None else None), None, cache_hit
+
+
+def _write_finished(pending, challenge, max_pending=0):
+    """
+    Write the records at the head of *pending* in order. An AI conversion at the head is only waited for
+    while more than *max_pending* records are queued.
+    """
+    while pending:
+        head = pending[0]
+        if isinstance(head, Future):
+            if not head.done() and len(pending) <= max_pending:
+                return
+            task = head.result()
+            record = mrcb.serializeTask(task) if task is not None else None
+        else:
+            record = head
+        pending.popleft()
+        if record is None:
+            instrumentation.count("tasks_skipped")
+        else:
+            challenge.addRecord(record)
+
+
+def write_tasks(elements, challenge, workers):
+    """
+    Convert *elements* in *workers* processes (1: in this process) and write their tasks to *challenge*
+    in input order. Ways that need the AI are converted by AI_WORKERS threads of this process meanwhile.
+    """
+    elements = iter(elements)
+    # None: skipped, str: serialized task, Future: AI conversion of a task
+    pending = collections.deque()
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    try:
+        with ThreadPoolExecutor(max_workers=AI_WORKERS) as ai_pool:
+            while not challenge.isFull():
+                batch = list(itertools.islice(elements, WORKER_BATCH_SIZE))
+                if not batch:
+                    break
+                if pool is None:
+                    results = map(process_element, batch)
+                else:
+                    results = pool.imap(process_element, batch, max(1, len(batch) // (workers * 8)))
+                for element, (record, manual_instruction, cache_hit) in zip(batch, results):
+                    instrumentation.count("conversion_cache_hits" if cache_hit else "conversion_cache_misses")
+                    if manual_instruction is not None:
+                        pending.append(ai_pool.submit(convert_with_ai, element, manual_instruction))
+                    else:
+                        pending.append(record)
+                    _write_finished(pending, challenge, MAX_PENDING_RECORDS)
+                    if challenge.isFull():
+                        break
+            if challenge.isFull():
+                # Everything still pending would be dropped anyway
+                pending.clear()
+                ai_pool.shutdown(cancel_futures=True)
+            else:
+                _write_finished(pending, challenge)
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+
+def main():
+    log_config.setup_logging()
+    challenge = mrcb.ChallengeWriter("parking_converter.json")
+    workers = WORKERS or os.cpu_count() or 1
+
+    if workers > 1:
+        logger.info("Converting with %d worker processes", workers)
+    with instrumentation.stage("write_tasks"):
+        write_tasks(tqdm(iter_elements()), challenge, workers)
+    if challenge.isFull():
+        logger.info("Task limit %d reached, stopping early", challenge.max_tasks)
+
+    challenge.close()
+    logger.info("Challenge saved to parking_converter.json (%d tasks)", challenge.taskCount)
+    hits = instrumentation.counter("conversion_cache_hits")
+    lookups = hits + instrumentation.counter("conversion_cache_misses")
+    if lookups:
+        logger.info("Conversion cache hit rate %.1f%%", 100 * hits / lookups)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Token budgets for the AI conversions of parking_converter.
+
+The free OpenAI quota is granted per model and day. A TokenBudgetScheduler hands out the models
+in order of preference and reserves the expected tokens of a request before it is sent, so
+requests running at the same time cannot overrun a budget together. When the response arrives
+the reservation is replaced by the tokens the request really used. A model whose budget is used
+up is skipped and the next model in the order takes over, until no model is left.
+"""
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional
+
+# Tokens reserved for the first request to a model; later requests reserve the most a request has used so far
+DEFAULT_TOKENS_PER_REQUEST = 4000
+# The external quota check is repeated after this many tokens were spent on a model
+DEFAULT_RECHECK_TOKENS = 50000
+
+
+@dataclass(frozen=True)
+class Reservation:
+    model: str
+    tokens: int
+
+
+class TokenBudgetScheduler:
+    """
+    Thread-safe token accounting for a list of models.
+
+    *budgets* maps a model to the tokens this run may spend on it; models without an entry are only
+    limited by *has_quota*. *has_quota(model)* is the external check of the remaining quota (for example
+    the persisted daily usage). It is asked before a model is used first and again every *recheck_tokens*
+    tokens, instead of before every request; tokens reserved by requests in flight count towards them. *remaining_quota(model)* returns the tokens still left on a
+    model, or None if that is unknown; it is asked once before the model is used first and lowers the
+    budget of this run to it, so tokens spent earlier (e.g. by another run on the same day) count as well.
+    """
+    def __init__(self, model_order: Iterable[str], budgets: Optional[Dict[str, int]] = None,
+                 has_quota: Optional[Callable[[str], bool]] = None,
+                 remaining_quota: Optional[Callable[[str], Optional[int]]] = None,
+                 tokens_per_request: int = DEFAULT_TOKENS_PER_REQUEST,
+                 recheck_tokens: int = DEFAULT_RECHECK_TOKENS):
+        self.model_order: List[str] = list(model_order)
+        self.budgets = dict(budgets or {})
+        self.has_quota = has_quota
+        self.remaining_quota = remaining_quota
+        self.tokens_per_request = tokens_per_request
+        self.recheck_tokens = recheck_tokens
+        self._lock = threading.Lock()
+        self._spent: Dict[str, int] = {}
+        self._reserved: Dict[str, int] = {}
+        self._estimates: Dict[str, int] = {}
+        self._checked_at: Dict[str, int] = {}
+        self._exhausted = set()
+        self._quota_read = set()
+
+    def _usable(self, model: str) -> bool:
+        if model in self._exhausted:
+            return False
+        spent = self._spent.get(model, 0)
+        # Parallel requests must not all slip through between two checks
+        committed = spent + self._reserved.get(model, 0)
+        if self.remaining_quota is not None and model not in self._quota_read:
+            self._quota_read.add(model)
+            remaining = self.remaining_quota(model)
+            if remaining is not None:
+                budget = self.budgets.get(model)
+                self.budgets[model] = spent + remaining if budget is None else min(budget, spent + remaining)
+        if self.has_quota is not None:
+            checked_at = self._checked_at.get(model)
+            if checked_at is None or committed - checked_at >= self.recheck_tokens:
+                self._checked_at[model] = committed
+                if not self.has_quota(model):
+                    self._exhausted.add(model)
+                    return False
+        budget = self.budgets.get(model)
+        if budget is not None and spent >= budget:
+            self._exhausted.add(model)
+            return False
+        return True
+
+    def reserve(self, models: Optional[Iterable[str]] = None) -> Optional[Reservation]:
+        """
+        Reserve the tokens of one request on the first model of *models* (default: the model order)
+        whose budget still has room for it. Returns None if no model has.
+        """
+        with self._lock:
+            for model in (self.model_order if models is None else models):
+                if not self._usable(model):
+                    continue
+                tokens = self._estimates.get(model, self.tokens_per_request)
+                budget = self.budgets.get(model)
+                reserved = self._reserved.get(model, 0)
+                if budget is not None and self._spent.get(model, 0) + reserved + tokens > budget:
+                    # Requests in flight may leave room once they report their real usage
+                    if not reserved:
+                        self._exhausted.add(model)
+                    continue
+                self._reserved[model] = self._reserved.get(model, 0) + tokens
+                return Reservation(model, tokens)
+        return None
+
+    def settle(self, reservation: Reservation, used_tokens: int):
+        """Replace *reservation* by the tokens the request used."""
+        with self._lock:
+            model = reservation.model
+            self._reserved[model] -= reservation.tokens
+            self._spent[model] = self._spent.get(model, 0) + used_tokens
+            if used_tokens > 0:
+                estimate = self._estimates.get(model)
+                self._estimates[model] = used_tokens if estimate is None else max(estimate, used_tokens)
+
+    def release(self, reservation: Reservation):
+        """Give back *reservation* of a request that was not sent or used no tokens."""
+        self.settle(reservation, 0)
+
+    def exhaust(self, model: str):
+        """Stop using *model*, e.g. after the API refused a request for lack of quota."""
+        with self._lock:
+            self._exhausted.add(model)
+
+    def spent(self, model: str) -> int:
+        with self._lock:
+            return self._spent.get(model, 0)
+
+    @property
+    def available(self) -> bool:
+        """False once every model is known to be used up."""
+        with self._lock:
+            return any(model not in self._exhausted for model in self.model_order)
@@ -4,6 +4,7 @@ import requests
 from tqdm import tqdm
 import geojson
 import challenge_builder as mrcb
+import log_config
 from time import sleep
 
 import json
@@ -183,9 +184,6 @@ class OSMDataHandler:
             return True
         return False
 
-stop_give_way_sign_direction_challenge = mrcb.Challenge()
-#stop_give_way_sign_direction_challenge.loadFromFile("stop_give_way_sign_direction_challenge.json")
-
 INSTRUCTIONS = """
 (Klappe dieses Feld auf, um die Visualisierung zu sehen!)
 ![](IMAGE_URL_PLACEHOLDER)
@@ -204,8 +202,19 @@ Bitte überprüfe, ob die Richtung korrekt ist. (Und überprüfe natürlich gern
 
 """
 
-def addToChallenge(data):
-    global stop_give_way_sign_direction_challenge
+SIGN_ICONS = {
+    "give_way": "icon_yield",
+    "stop": "icon_stop",
+}
+
+# Ways containing a highway=give_way / highway=stop node without direction, in Germany, Austria and Switzerland
+GIVE_WAY_QUERY_URL = "https://overpass-api.de/api/interpreter?data=%5Bout%3Ajson%5D%5Btimeout%3A250%5D%3B%0Aarea%28id%3A3600051477%29-%3E.searchArea%3B%0Anode%5B%22highway%22%3D%22give_way%22%5D%5B%21%22direction%22%5D%28area.searchArea%29%3B%0Away%28bn%29%3B%0A%28._%3B%3E%3B%29%3B%0Aout%20body%3B%0Aarea%28id%3A3600016239%29-%3E.searchArea2%3B%0Anode%5B%22highway%22%3D%22give_way%22%5D%5B%21%22direction%22%5D%28area.searchArea2%29%3B%0Away%28bn%29%3B%0A%28._%3B%3E%3B%29%3B%0Aout%20body%3B%0Aarea%28id%3A3600051701%29-%3E.searchArea3%3B%0Anode%5B%22highway%22%3D%22give_way%22%5D%5B%21%22direction%22%5D%28area.searchArea3%29%3B%0Away%28bn%29%3B%0A%28._%3B%3E%3B%29%3B%0Aout%20body%3B"
+STOP_QUERY_URL = "https://overpass-api.de/api/interpreter?data=%5Bout%3Ajson%5D%5Btimeout%3A250%5D%3B%0Aarea%28id%3A3600051477%29-%3E.searchArea%3B%0Anode%5B%22highway%22%3D%22stop%22%5D%5B%21%22direction%22%5D%28area.searchArea%29%3B%0Away%28bn%29%3B%0A%28._%3B%3E%3B%29%3B%0Aout%20body%3B%0Aarea%28id%3A3600016239%29-%3E.searchArea2%3B%0Anode%5B%22highway%22%3D%22stop%22%5D%5B%21%22direction%22%5D%28area.searchArea2%29%3B%0Away%28bn%29%3B%0A%28._%3B%3E%3B%29%3B%0Aout%20body%3B%0Aarea%28id%3A3600051701%29-%3E.searchArea3%3B%0Anode%5B%22highway%22%3D%22stop%22%5D%5B%21%22direction%22%5D%28area.searchArea3%29%3B%0Away%28bn%29%3B%0A%28._%3B%3E%3B%29%3B%0Aout%20body%3B"
+
+static_map_size = "480x312"
+
+
+def addToChallenge(challenge, data):
     SIGNTYPE_MAP = {
         "give_way": "Vorfahrt gewähren-Schild",
         "stop": "Stoppschild"
@@ -226,101 +235,64 @@ def addToChallenge(data):
         additionalFeatures=[],
         cooperativeWork=cooperativeWork
     )
-    stop_give_way_sign_direction_challenge.addTask(t)
-
+    challenge.addTask(t)
 
-import requests, os, json
 
-static_map_size = "480x312"
-
-# Get all the way ids from ways that contain a highway=give_way node by getting https://overpass-api.de/api/interpreter?data=%5Bout%3Ajson%5D%5Btimeout%3A250%5D%3B%0Aarea%28id%3A3600051477%29-%3E.searchArea%3B%0Anode%5B%22highway%22%3D%22give_way%22%5D%5B%21%22direction%22%5D%28area.searchArea%29%3B%0Away%28bn%29%3B%0A%28._%3B%3E%3B%29%3B%0Aout%20body%3B
-print("Downloading data from Overpass API...")
-response = requests.get("https://overpass-api.de/api/interpreter?data=%5Bout%3Ajson%5D%5Btimeout%3A250%5D%3B%0Aarea%28id%3A3600051477%29-%3E.searchArea%3B%0Anode%5B%22highway%22%3D%22give_way%22%5D%5B%21%22direction%22%5D%28area.searchArea%29%3B%0Away%28bn%29%3B%0A%28._%3B%3E%3B%29%3B%0Aout%20body%3B%0Aarea%28id%3A3600016239%29-%3E.searchArea2%3B%0Anode%5B%22highway%22%3D%22give_way%22%5D%5B%21%22direction%22%5D%28area.searchArea2%29%3B%0Away%28bn%29%3B%0A%28._%3B%3E%3B%29%3B%0Aout%20body%3B%0Aarea%28id%3A3600051701%29-%3E.searchArea3%3B%0Anode%5B%22highway%22%3D%22give_way%22%5D%5B%21%22direction%22%5D%28area.searchArea3%29%3B%0Away%28bn%29%3B%0A%28._%3B%3E%3B%29%3B%0Aout%20body%3B")
-print(f"Overpass response status: {response.status_code} {response.reason}")
-print(f"Response URL: {response.url}")
-print(f"Response headers: {dict(response.headers)}")
-print(f"Response body length: {len(response.text)}")
-snippet = response.text[:1000].replace('\n', ' ') if response.text else ''
-print(f"Response body snippet (first 1000 chars): {snippet!r}")
-data_handler = OSMDataHandler(response.text)
-ways = data_handler.get_ways()
-print("Sorting ways...")
-# For each of those ways, get the full way xml by calling osm.org/api/0.6/way/way_id/full
-for way in tqdm(ways):
-    way_id = way["id"]
-    # Guard clause to skip *ways* that are problematic
-    if data_handler.discardWayForTags(data_handler.getWayTags(way_id)):
-        continue
-    give_way_nodes = data_handler.get_give_way_nodes(way_id)
-    for give_way_node in give_way_nodes:
-        # Guard clauses to skip *nodes in a way* that are problematic (first or last node in a way, part of more than one way)
-        if data_handler.isFirstOrLastNodeInWay(give_way_node, way_id):
-            continue
-        if data_handler.getNumberOfWaysNodeIsPartOf(give_way_node) > 1:
+def collect_sign_data(data_handler, sign_type):
+    """Yield the proposed direction for every sign of *sign_type* ("give_way" or "stop") that can be determined."""
+    ways = data_handler.get_ways()
+    for way in tqdm(ways):
+        way_id = way["id"]
+        # Guard clause to skip *ways* that are problematic
+        if data_handler.discardWayForTags(data_handler.getWayTags(way_id)):
             continue
-        direction = data_handler.determine_give_way_direction(give_way_node, way_id)
-        angle = data_handler.calculate_rotation_angle(give_way_node, way_id)
-        int_angle = int(angle)
-        sign_lat, sign_long = data_handler.get_node_coordinates(give_way_node)
-        #print(f"Way ID: {way_id}, Give Way Node: {give_way_node}, Direction: {direction}, Angle: {angle}")
-        lat, lon = data_handler.get_node_coordinates(give_way_node)
-        url = f"https://haukauntrie.de/online/api/staticmaps/staticmap.php?center={lat},{lon}&zoom=19&size={static_map_size}&maptype=mapnikde&markers={lat},{lon},icon_yield_{int_angle}"
-        datatoappend = {
-            "way_id": way_id,
-            "node_id": give_way_node,
-            "direction": direction,
-            "angle": angle,
-            "img_url": url,
-            "sign_type": "give_way",
-            "sign_lat": sign_lat,
-            "sign_long": sign_long
-        }
-        addToChallenge(datatoappend)
-
-## Now, we do the same for highway=stop
-
-# Get all the way ids from ways that contain a highway=stop node by getting https://overpass-api.de/api/interpreter?data=%5Bout%3Ajson%5D%5Btimeout%3A250%5D%3B%0Aarea%28id%3A3600051477%29-%3E.searchArea%3B%0Anode%5B%22highway%22%3D%22stop%22%5D%5B%21%22direction%22%5D%28area.searchArea%29%3B%0Away%28bn%29%3B%0A%28._%3B%3E%3B%29%3B%0Aout%20body%3B
-print("Downloading data from Overpass API...")
-response = requests.get("https://overpass-api.de/api/interpreter?data=%5Bout%3Ajson%5D%5Btimeout%3A250%5D%3B%0Aarea%28id%3A3600051477%29-%3E.searchArea%3B%0Anode%5B%22highway%22%3D%22stop%22%5D%5B%21%22direction%22%5D%28area.searchArea%29%3B%0Away%28bn%29%3B%0A%28._%3B%3E%3B%29%3B%0Aout%20body%3B%0Aarea%28id%3A3600016239%29-%3E.searchArea2%3B%0Anode%5B%22highway%22%3D%22stop%22%5D%5B%21%22direction%22%5D%28area.searchArea2%29%3B%0Away%28bn%29%3B%0A%28._%3B%3E%3B%29%3B%0Aout%20body%3B%0Aarea%28id%3A3600051701%29-%3E.searchArea3%3B%0Anode%5B%22highway%22%3D%22stop%22%5D%5B%21%22direction%22%5D%28area.searchArea3%29%3B%0Away%28bn%29%3B%0A%28._%3B%3E%3B%29%3B%0Aout%20body%3B")
-data_handler = OSMDataHandler(response.text)
-ways = data_handler.get_ways()
-print("Sorting ways...")
-
-# For each of those ways, get the full way xml by calling osm.org/api/0.6/way/way_id/full
-for way in tqdm(ways):
-    way_id = way["id"]
-    # Guard clause to skip ways that are problematic
-    if data_handler.discardWayForTags(data_handler.getWayTags(way_id)):
-        continue
-    stop_nodes = data_handler.get_stop_nodes(way_id)
-    for stop_node in stop_nodes:
-        # Guard clauses to skip *nodes in a way* that are problematic (first or last node in a way, part of more than one way)
-        if data_handler.isFirstOrLastNodeInWay(give_way_node, way_id):
-            continue
-        if data_handler.getNumberOfWaysNodeIsPartOf(give_way_node) > 1:
-            continue
-        direction = data_handler.determine_give_way_direction(stop_node, way_id)
-        angle = data_handler.calculate_rotation_angle(stop_node, way_id)
-        int_angle = int(angle)
-        sign_lat, sign_long = data_handler.get_node_coordinates(stop_node)
-        #print(f"Way ID: {way_id}, Stop Node: {stop_node}, Direction: {direction}, Angle: {angle}")
-        lat, lon = data_handler.get_node_coordinates(stop_node)
-        url = f"https://haukauntrie.de/online/api/staticmaps/staticmap.php?center={lat},{lon}&zoom=19&size={static_map_size}&maptype=mapnikde&markers={lat},{lon},icon_stop_{int_angle}"
-        toadddata = {
-            "way_id": way_id,
-            "node_id": stop_node,
-            "direction": direction,
-            "angle": angle,
-            "img_url": url,
-            "sign_type": "stop",
-            "sign_lat": sign_lat,
-            "sign_long": sign_long
-        }
-        addToChallenge(toadddata)
-
-
-stop_give_way_sign_direction_challenge.saveToFile("stop_give_way_sign_direction_challenge.json")
-
-
-
-
+        if sign_type == "give_way":
+            sign_nodes = data_handler.get_give_way_nodes(way_id)
+        else:
+            sign_nodes = data_handler.get_stop_nodes(way_id)
+        for sign_node in sign_nodes:
+            # Guard clauses to skip *nodes in a way* that are problematic (first or last node in a way, part of more than one way)
+            if data_handler.isFirstOrLastNodeInWay(sign_node, way_id):
+                continue
+            if data_handler.getNumberOfWaysNodeIsPartOf(sign_node) > 1:
+                continue
+            direction = data_handler.determine_give_way_direction(sign_node, way_id)
+            angle = data_handler.calculate_rotation_angle(sign_node, way_id)
+            int_angle = int(angle)
+            sign_lat, sign_long = data_handler.get_node_coordinates(sign_node)
+            lat, lon = data_handler.get_node_coordinates(sign_node)
+            url = f"https://haukauntrie.de/online/api/staticmaps/staticmap.php?center={lat},{lon}&zoom=19&size={static_map_size}&maptype=mapnikde&markers={lat},{lon},{SIGN_ICONS[sign_type]}_{int_angle}"
+            yield {
+                "way_id": way_id,
+                "node_id": sign_node,
+                "direction": direction,
+                "angle": angle,
+                "img_url": url,
+                "sign_type": sign_type,
+                "sign_lat": sign_lat,
+                "sign_long": sign_long
+            }
+
+
+def download_sign_data(url):
+    print("Downloading data from Overpass API...")
+    response = requests.get(url)
+    print(f"Overpass response status: {response.status_code} {response.reason}")
+    print(f"Response body length: {len(response.text)}")
+    return OSMDataHandler(response.text)
+
+
+def main():
+    log_config.setup_logging()
+    challenge = mrcb.Challenge()
+    #challenge.loadFromFile("stop_give_way_sign_direction_challenge.json")
+    for sign_type, url in (("give_way", GIVE_WAY_QUERY_URL), ("stop", STOP_QUERY_URL)):
+        data_handler = download_sign_data(url)
+        print("Sorting ways...")
+        for data in collect_sign_data(data_handler, sign_type):
+            addToChallenge(challenge, data)
+    challenge.saveToFile("stop_give_way_sign_direction_challenge.json")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,19 @@
-import os, sys, json, base64
+import os, sys, re, json, base64, hashlib, codecs, time, random, threading, copy, logging
+import email.utils
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass, field
-from typing import List, Dict, Optional
+from typing import Callable, Iterable, Iterator, List, Dict, Optional
+from urllib.parse import urlsplit
 import xml.etree.ElementTree as ET
 import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from . import instrumentation
+except ImportError:
+    import instrumentation
+
+logger = logging.getLogger(__name__)
 
 def TagsAsMdTable(tags):
     # This function takes a dict of tags and returns a markdown table with the tags
@@ -35,12 +46,11 @@ class GeoFeature:
             else:
                 self.geometryType = "Point"
         else:
-            print(geometry)
-            raise ValueError("Invalid coordinates")
+            raise ValueError(f"Invalid coordinates: {geometry}")
 
     @classmethod
     def withId(cls, osmType, osmId, geometry, properties):
-        print(osmType, osmId, geometry, properties)
+        logger.debug("Feature %s/%s: %s %s", osmType, osmId, geometry, properties)
         properties["@id"] = str(osmType) + "/" + str(osmId)
         return cls(geometry, properties)
 
@@ -110,17 +120,150 @@ class OscChange():
         }
 
 
+# Point the OSM API and Overpass at another server, e.g. the local stand-in from standin_server.py:
+# TAGFIXES_BASE_URL=http://127.0.0.1:8765 serves /api/0.6/... and /api/interpreter
+BASE_URL = os.environ.get("TAGFIXES_BASE_URL", "").rstrip("/") or None
+OSM_API_URL = (BASE_URL or "https://api.openstreetmap.org") + "/api/0.6"
+
+
+class RateLimiter:
+    """
+    Polite per-host rate limiter: consecutive requests to the same host are spaced at least *min_interval* seconds apart.
+    """
+
+    def __init__(self, min_interval: float = 0.0):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next_slot: Dict[str, float] = {}
+
+    def wait(self, host: str):
+        if self.min_interval <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+# Responses that are worth retrying; everything else is returned to the caller as is
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def _retry_after_seconds(response: requests.Response) -> Optional[float]:
+    """Seconds to wait according to the Retry-After header (delay in seconds or HTTP date), or None without one."""
+    value = response.headers.get("Retry-After")
+    if not isinstance(value, str) or not value.strip():
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class HttpClient:
+    """
+    Shared fetch layer for the OSM API and friends.
+    Keeps connections alive in a pooled session, limits the number of requests in flight
+    to *max_concurrency* and spaces requests per host with a RateLimiter.
+    Failed connections, timeouts and RETRY_STATUS_CODES are retried up to *retries* times
+    with exponential backoff starting at *backoff* seconds, or after the delay the server
+    asks for in a Retry-After header.
+    """
+
+    def __init__(self, max_concurrency: int = 4, min_interval: float = 0.1, timeout: float = 60,
+                 user_agent: str = "maproulette-tagfixes", retries: int = 3, backoff: float = 1.0):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.rate_limiter = RateLimiter(min_interval)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = user_agent
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=max_concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self._request(self.session.get, url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        """Like get(), for idempotent requests that carry a body, e.g. long Overpass queries."""
+        return self._request(self.session.post, url, **kwargs)
+
+    def _request(self, send: Callable, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        host = urlsplit(url).netloc
+        for attempt in range(self.retries + 1):
+            delay = self.backoff * 2 ** attempt
+            try:
+                with self._slots:
+                    self.rate_limiter.wait(host)
+                    instrumentation.count("http_requests")
+                    with instrumentation.stage("http"):
+                        response = send(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt == self.retries:
+                    return response
+                retry_after = _retry_after_seconds(response)
+                if retry_after is not None:
+                    delay = retry_after
+                response.close()
+            # Back off without holding a slot so other requests can proceed
+            instrumentation.count("http_retries")
+            time.sleep(delay)
+
+    def map(self, func: Callable, items: Iterable) -> List:
+        """
+        Run *func* over *items* with at most max_concurrency calls in flight. Results keep the input order.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            return list(pool.map(func, items))
+
+
+_http_client: Optional[HttpClient] = None
+
+
+def getHttpClient() -> HttpClient:
+    """
+    Return the process-wide HttpClient so that all lookups share one connection pool and rate limiter.
+    """
+    global _http_client
+    if _http_client is None:
+        _http_client = HttpClient()
+    return _http_client
+
+
+# Number of IDs per multi-fetch request; keeps the URL well below common length limits
+MULTI_FETCH_CHUNK_SIZE = 100
+# Multi-fetch answers with these if one of the IDs does not exist (or never did)
+MULTI_FETCH_MISSING_STATUS_CODES = {404, 410}
+
+
 class OscBuilder:
     """
     Helper to build .osc change files with convenience helpers for common operations.
+    Elements that will be touched can be registered with prefetch() so they are
+    resolved in bulk instead of with one request per operation.
     """
 
-    def __init__(self, generator: str = "maproulette-tagfixes"):
+    def __init__(self, generator: str = "maproulette-tagfixes", http: Optional[HttpClient] = None):
         self.generator = generator
+        self.http = http or getHttpClient()
         self.create_elems: List[ET.Element] = []
         self.modify_elems: List[ET.Element] = []
         self.delete_elems: List[ET.Element] = []
         self._next_temp_id = -1
+        self._element_cache: Dict[tuple, Dict] = {}
 
     def _new_temp_id(self) -> int:
         temp_id = self._next_temp_id
@@ -128,15 +271,67 @@ class OscBuilder:
         return temp_id
 
     def _fetch_current_element(self, osm_type: str, osm_id: int) -> Dict:
-        url = f"https://api.openstreetmap.org/api/0.6/{osm_type}/{osm_id}.json"
-        response = requests.get(url)
+        # Callers modify the returned element, so always hand out a copy of the cached one
+        cached = self._element_cache.get((osm_type, int(osm_id)))
+        if cached is not None:
+            instrumentation.count("osm_element_cache_hits")
+            return copy.deepcopy(cached)
+        instrumentation.count("osm_element_cache_misses")
+        url = f"{OSM_API_URL}/{osm_type}/{osm_id}.json"
+        with instrumentation.stage("osm_api"):
+            response = self.http.get(url)
         if response.status_code != 200:
             raise ValueError(f"Could not fetch {osm_type} {osm_id}: HTTP {response.status_code}")
         data = response.json()
         elements = data.get("elements", [])
         if not elements:
             raise ValueError(f"No data returned for {osm_type} {osm_id}")
-        return elements[0]
+        self._element_cache[(osm_type, int(osm_id))] = elements[0]
+        return copy.deepcopy(elements[0])
+
+    def _fetch_elements_chunk(self, osm_type: str, osm_ids: List[int]) -> List[Dict]:
+        url = f"{OSM_API_URL}/{osm_type}s.json"
+        response = self.http.get(url, params={f"{osm_type}s": ",".join(str(i) for i in osm_ids)})
+        if response.status_code == 200:
+            return response.json().get("elements", [])
+        if response.status_code not in MULTI_FETCH_MISSING_STATUS_CODES:
+            # The client already retried overload responses; splitting would only add requests
+            raise ValueError(f"Could not fetch {osm_type}s {osm_ids[0]}..{osm_ids[-1]}: HTTP {response.status_code}")
+        if len(osm_ids) == 1:
+            # Leave it to the per-element lookup, which raises a proper error when the element is used
+            return []
+        # The API rejects the whole request if a single ID is missing, so narrow it down
+        middle = len(osm_ids) // 2
+        return self._fetch_elements_chunk(osm_type, osm_ids[:middle]) + self._fetch_elements_chunk(osm_type, osm_ids[middle:])
+
+    def prefetch(self, osm_type: str, osm_ids: Iterable[int]):
+        """
+        Register elements that will be touched later and resolve them with chunked multi-fetch
+        requests (/nodes?nodes=..., /ways?ways=..., /relations?relations=...).
+        Subsequent operations on these elements are served from memory.
+        """
+        if osm_type not in ("node", "way", "relation"):
+            raise ValueError(f"Unsupported element type: {osm_type}")
+        pending = sorted({int(i) for i in osm_ids if int(i) > 0 and (osm_type, int(i)) not in self._element_cache})
+        chunks = [pending[i:i + MULTI_FETCH_CHUNK_SIZE] for i in range(0, len(pending), MULTI_FETCH_CHUNK_SIZE)]
+        with instrumentation.stage("osm_api"):
+            results = self.http.map(lambda chunk: self._fetch_elements_chunk(osm_type, chunk), chunks)
+        for elements in results:
+            for element in elements:
+                # Deleted elements are reported with visible=false; the single lookup raises for those
+                if element.get("visible") is False:
+                    continue
+                self._element_cache[(element["type"], int(element["id"]))] = element
+        return self
+
+    def preload(self, elements: Iterable[Dict]):
+        """
+        Register current elements (in API 0.6 JSON format) that are already known, e.g. from a recorded run,
+        so that no request is made for them.
+        """
+        for element in elements:
+            self._element_cache[(element["type"], int(element["id"]))] = element
+        return self
 
     def _element_to_xml(self, element: Dict) -> ET.Element:
         el_type = element.get("type")
@@ -283,8 +478,9 @@ class OscBuilder:
         return osc
 
     def to_string(self) -> str:
-        osc = self.to_xml_element()
-        return ET.tostring(osc, encoding="unicode")
+        with instrumentation.stage("osc_serialize"):
+            osc = self.to_xml_element()
+            return ET.tostring(osc, encoding="unicode")
 
     def to_osc_change(self) -> OscChange:
         return OscChange(self.to_string())
@@ -313,30 +509,410 @@ class Task:
                 "cooperativeWork": self.cooperativeWork.to_dict()
             }
 
+
+# MapRoulette does not accept more tasks than this in a single challenge
+MAX_CHALLENGE_TASKS = 50000
+
+
+def serializeTask(task) -> str:
+    # One line-delimited, RS-prefixed GeoJSON record per task
+    return '\x1E' + json.dumps(task.to_dict(), ensure_ascii=False) + '\n'
+
+
 @dataclass
 class Challenge:
     def __init__(self):
         self.tasks = []
 
     def addTask(self, task):
+        instrumentation.count("tasks_emitted")
         self.tasks.append(task)
 
     def saveToFile(self, filename):
-        with open(filename, 'w', encoding="UTF-8") as f:
+        with instrumentation.stage("save_challenge"), open(filename, 'w', encoding="UTF-8") as f:
             for task in self.tasks:
-                f.write('\x1E')
-                json.dump(task.to_dict(), f, ensure_ascii=False)
-                f.write('\n')
+                f.write(serializeTask(task))
     
     def cap(self):
-        # Makes sure that the number of tasks is no more than 50000 (drops everything beyond that)
-        if len(self.tasks) > 50000:
-            self.tasks = self.tasks[:49999]
+        # Makes sure that the number of tasks is no more than 50000 (drops everything beyond that), like ChallengeWriter
+        if len(self.tasks) > MAX_CHALLENGE_TASKS:
+            self.tasks = self.tasks[:MAX_CHALLENGE_TASKS]
+
+
+class ChallengeWriter:
+    """
+    Streaming counterpart of Challenge: every task is serialized as soon as it is added,
+    so memory stays flat no matter how many tasks are produced.
+    Records are written to a temporary file that atomically replaces *filename* on close();
+    tasks beyond *max_tasks* are counted but dropped.
+    With *append* set, records are appended to *filename* directly and flushed one by one
+    instead, so a crashed run can be resumed; the IDs of the tasks already in the file are
+    available in existingIds.
+    """
+
+    def __init__(self, filename: str, max_tasks: int = MAX_CHALLENGE_TASKS, append: bool = False):
+        self.filename = filename
+        self.max_tasks = max_tasks
+        self.append = append
+        self.taskCount = 0
+        self.droppedCount = 0
+        self.existingIds = set()
+        if append:
+            if os.path.exists(filename):
+                self._read_existing_records()
+            self._tmp_filename = None
+            self._file = open(filename, 'a', encoding="UTF-8")
+        else:
+            self._tmp_filename = filename + ".tmp"
+            self._file = open(self._tmp_filename, 'w', encoding="UTF-8")
+
+    def _read_existing_records(self):
+        valid_end = 0
+        with open(self.filename, 'rb') as f:
+            for raw_line in f:
+                if not raw_line.endswith(b'\n'):
+                    # The last record of a crashed run may be incomplete
+                    break
+                valid_end += len(raw_line)
+                line = raw_line.decode("UTF-8").strip('\x1E\n')
+                if not line:
+                    continue
+                self.taskCount += 1
+                features = json.loads(line).get("features") or [{}]
+                task_id = features[0].get("properties", {}).get("@id")
+                if task_id:
+                    self.existingIds.add(task_id)
+        if valid_end < os.path.getsize(self.filename):
+            os.truncate(self.filename, valid_end)
+
+    def isFull(self) -> bool:
+        return self.taskCount >= self.max_tasks
+
+    def _drop(self) -> bool:
+        self.droppedCount += 1
+        instrumentation.count("tasks_dropped")
+        return False
+
+    def addTask(self, task) -> bool:
+        """
+        Serialize and write the task. Returns False if the task was dropped because the cap is reached.
+        """
+        if self.isFull():
+            return self._drop()
+        with instrumentation.stage("serialize_task"):
+            record = serializeTask(task)
+        return self.addRecord(record)
+
+    def addRecord(self, record: str) -> bool:
+        """
+        Write a task that was already serialized with serializeTask(), e.g. in a worker process.
+        Returns False if the task was dropped because the cap is reached.
+        """
+        if self.isFull():
+            return self._drop()
+        self._file.write(record)
+        if self.append:
+            self._file.flush()
+        self.taskCount += 1
+        instrumentation.count("tasks_emitted")
+        return True
+
+    def close(self):
+        if self._file.closed:
+            return
+        with instrumentation.stage("save_challenge"):
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            if self._tmp_filename is not None:
+                os.replace(self._tmp_filename, self.filename)
+
+    def abort(self):
+        """
+        Discard everything written so far and keep a previously existing output file untouched.
+        In append mode the records written so far are kept for resuming.
+        """
+        if not self._file.closed:
+            self._file.close()
+        if self._tmp_filename is not None and os.path.exists(self._tmp_filename):
+            os.remove(self._tmp_filename)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+# Read size when streaming Overpass responses from the network or the cache
+STREAM_CHUNK_SIZE = 64 * 1024
+DEFAULT_OVERPASS_CACHE_DIR = ".overpass_cache"
+
+
+class OverpassCache:
+    """
+    Content-addressed on-disk cache for raw Overpass responses.
+
+    Entries are keyed by the normalized query text and expire *ttl* seconds after
+    they were fetched. Once the cache grows beyond *max_bytes*, the least recently
+    used entries are evicted. With *refresh_only* set, cached entries are never
+    served but fresh responses are still written back (defaults to the
+    OVERPASS_CACHE_REFRESH=1 environment variable).
+    """
+
+    def __init__(self, directory: str = DEFAULT_OVERPASS_CACHE_DIR, ttl: float = 6 * 60 * 60,
+                 max_bytes: int = 2 * 1024 ** 3, refresh_only: Optional[bool] = None):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        if refresh_only is None:
+            refresh_only = os.environ.get("OVERPASS_CACHE_REFRESH") == "1"
+        self.refresh_only = refresh_only
+
+    @staticmethod
+    def normalize_query(overpass_query: str) -> str:
+        # Indentation and blank lines do not change the meaning of a query
+        lines = [line.strip() for line in overpass_query.strip().splitlines()]
+        return "\n".join(line for line in lines if line)
+
+    def key(self, overpass_query: str) -> str:
+        return hashlib.sha256(self.normalize_query(overpass_query).encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".json")
+
+    def _fresh_path(self, overpass_query: str) -> Optional[str]:
+        if self.refresh_only:
+            return None
+        path = self._path(self.key(overpass_query))
+        try:
+            fetched_at = os.path.getmtime(path)
+            if time.time() - fetched_at > self.ttl:
+                os.remove(path)
+                return None
+            # atime tracks the last use for LRU eviction, mtime keeps the fetch time for the TTL
+            os.utime(path, (time.time(), fetched_at))
+        except FileNotFoundError:
+            return None
+        return path
+
+    def get(self, overpass_query: str) -> Optional[bytes]:
+        """
+        Return the cached response body for the query, or None on a miss.
+        """
+        path = self._fresh_path(overpass_query)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def get_stream(self, overpass_query: str, chunk_size: int = STREAM_CHUNK_SIZE) -> Optional[Iterator[bytes]]:
+        """
+        Like get(), but return the cached body as an iterator of chunks so it never has to be held in memory.
+        """
+        path = self._fresh_path(overpass_query)
+        if path is None:
+            return None
+
+        def chunks():
+            with open(path, "rb") as f:
+                while True:
+                    chunk = f.read(chunk_size)
+                    if not chunk:
+                        return
+                    yield chunk
+
+        return chunks()
+
+    def put(self, overpass_query: str, body: bytes):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(self.key(overpass_query))
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def put_stream(self, overpass_query: str, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """
+        Pass *chunks* through while writing them to the cache.
+        The entry is only stored once all chunks were consumed; an aborted stream leaves no entry behind.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(self.key(overpass_query))
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        complete = False
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            complete = True
+        finally:
+            if complete:
+                os.replace(tmp_path, path)
+                self.evict()
+            elif os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def discard(self, overpass_query: str):
+        """Remove the entry of *overpass_query*, if any."""
+        path = self._path(self.key(overpass_query))
+        if os.path.exists(path):
+            os.remove(path)
+
+    def evict(self):
+        """
+        Drop expired entries and then the least recently used ones until the cache fits into max_bytes.
+        """
+        entries = []
+        now = time.time()
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime > self.ttl:
+                os.remove(path)
+                continue
+            entries.append((stat.st_atime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+
+def _iter_json_array(chunks: Iterable[bytes], key: str) -> Iterator:
+    """
+    Incrementally decode the array of objects stored under *key* in a JSON document read from byte *chunks*.
+    Items are yielded one by one and only the item being decoded is kept in memory.
+    The first occurrence of "<key>": [ is taken as the array, which holds for Overpass responses.
+    After the array the remaining chunks are read to the end and the text following it is returned.
+    """
+    chunks = iter(chunks)
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    exhausted = False
+
+    def read_more():
+        nonlocal buffer, exhausted
+        chunk = next(chunks, None)
+        if chunk is None:
+            buffer += text_decoder.decode(b"", final=True)
+            exhausted = True
+        else:
+            buffer += text_decoder.decode(chunk)
+
+    # Skip everything up to the opening bracket of the array
+    array_start = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+    while True:
+        match = array_start.search(buffer)
+        if match:
+            buffer = buffer[match.end():]
+            break
+        if exhausted:
+            raise ValueError(f"Invalid return data: no {key!r} array found")
+        # Keep a tail in case the key is split between two chunks
+        buffer = buffer[-(len(key) + 32):]
+        read_more()
+
+    pos = 0
+    while True:
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if pos == len(buffer):
+            if exhausted:
+                raise ValueError(f"Invalid return data: {key!r} array is truncated")
+            buffer, pos = "", 0
+            read_more()
+            continue
+        if buffer[pos] == "]":
+            # Exhaust the chunks so wrapped streams (e.g. OverpassCache.put_stream) see the end
+            buffer = buffer[pos + 1:]
+            while not exhausted:
+                read_more()
+            return buffer
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if exhausted:
+                raise ValueError(f"Invalid return data: {key!r} array is truncated or malformed")
+            # The item continues in the next chunks; at least double the buffer so large items stay linear
+            buffer, pos = buffer[pos:], 0
+            target = 2 * len(buffer)
+            while len(buffer) < target and not exhausted:
+                read_more()
+            continue
+        yield item
+        pos = end
+        if pos > STREAM_CHUNK_SIZE:
+            buffer, pos = buffer[pos:], 0
+
+
+def _trailer_remark(trailer: str) -> str:
+    """Return the "remark" of an Overpass response from the text following its elements array."""
+    try:
+        rest = json.loads("{" + trailer.lstrip(" \t\r\n,"))
+    except ValueError:
+        return ""
+    return (rest.get("remark") or "") if isinstance(rest, dict) else ""
+
+
+# Overpass endpoints tried in order; override with a comma separated list in OVERPASS_ENDPOINTS.
+# Without such a list, TAGFIXES_BASE_URL also serves the Overpass queries.
+DEFAULT_OVERPASS_ENDPOINTS = [
+    "https://overpass-api.de/api/interpreter",
+    "https://overpass.private.coffee/api/interpreter",
+    "https://maps.mail.ru/osm/tools/overpass/api/interpreter",
+]
+
+
+def _overpass_endpoints() -> List[str]:
+    if os.environ.get("OVERPASS_ENDPOINTS"):
+        return os.environ["OVERPASS_ENDPOINTS"].split(",")
+    if BASE_URL:
+        return [BASE_URL + "/api/interpreter"]
+    return list(DEFAULT_OVERPASS_ENDPOINTS)
+
+
+OVERPASS_ENDPOINTS = _overpass_endpoints()
+# Queries longer than this are sent as POST body instead of a URL parameter
+OVERPASS_POST_THRESHOLD = 1500
+
 
 class Overpass:
-    def __init__(self):
+    """
+    Overpass client with an optional OverpassCache.
+    Requests are sent through *http* (default: the shared HttpClient), which retries a busy endpoint
+    first, and fail over between *endpoints*. When every endpoint is busy, it waits as long as the
+    /api/status of a rate-limited server asks, or else backs off exponentially with jitter, for
+    up to *max_attempts* rounds.
+    """
+    def __init__(self, cache: Optional[OverpassCache] = None, endpoints: Optional[List[str]] = None,
+                 max_attempts: int = 5, backoff: float = 5.0, max_backoff: float = 300.0, timeout: float = 300,
+                 http: Optional[HttpClient] = None):
         self.resultElements = {}
-        self.overpass_url = "https://overpass-api.de/api/interpreter"
+        self.http = http or getHttpClient()
+        self.endpoints = list(endpoints or OVERPASS_ENDPOINTS)
+        self.overpass_url = self.endpoints[0]
+        self.cache = cache
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
 
     def _response_excerpt(self, response, max_chars=500):
         text = response.text or ""
@@ -345,18 +921,134 @@ class Overpass:
             return text[:max_chars] + "...[truncated]"
         return text
 
-    def getElementsFromQuery(self, overpass_query):
-        response = requests.get(self.overpass_url, params={'data': overpass_query})
+    def _send(self, endpoint: str, overpass_query: str, stream: bool = False) -> requests.Response:
+        instrumentation.count("overpass_requests")
+        if len(overpass_query) > OVERPASS_POST_THRESHOLD:
+            return self.http.post(endpoint, data={'data': overpass_query}, timeout=self.timeout, stream=stream)
+        return self.http.get(endpoint, params={'data': overpass_query}, timeout=self.timeout, stream=stream)
+
+    def _status_text(self, endpoint: str) -> Optional[str]:
+        status_url = endpoint.rsplit("/", 1)[0] + "/status"
+        try:
+            response = self.http.get(status_url, timeout=10)
+        except requests.RequestException:
+            return None
         if response.status_code != 200:
-            snippet = self._response_excerpt(response)
-            raise ValueError(f"Invalid return data (HTTP {response.status_code}): {snippet}")
+            return None
+        return response.text
+
+    def slotWait(self, endpoint: str) -> Optional[float]:
+        """
+        Ask the /api/status of *endpoint* how many seconds until a query slot is free.
+        Returns 0 if a slot is available now and None if the status could not be read.
+        """
+        status = self._status_text(endpoint)
+        if status is None:
+            return None
+        available = re.search(r"(\d+) slots? available now", status)
+        if available and int(available.group(1)) > 0:
+            return 0
+        waits = [int(seconds) for seconds in re.findall(r"Slot available after: \S+, in (-?\d+) seconds", status)]
+        if waits:
+            return max(0, min(waits))
+        return None
+
+    def rateLimit(self, endpoint: Optional[str] = None) -> Optional[int]:
+        """
+        Return the number of query slots *endpoint* (default: the first endpoint) grants us,
+        0 if it does not limit us and None if the status could not be read.
+        """
+        status = self._status_text(endpoint or self.endpoints[0])
+        if status is None:
+            return None
+        match = re.search(r"Rate limit: (\d+)", status)
+        return int(match.group(1)) if match else None
+
+    def _fetch(self, overpass_query: str, stream: bool = False) -> requests.Response:
+        last_error = None
+        for attempt in range(self.max_attempts):
+            slot_waits = []
+            for endpoint in self.endpoints:
+                try:
+                    response = self._send(endpoint, overpass_query, stream)
+                except requests.RequestException as exc:
+                    last_error = f"{endpoint}: {exc}"
+                    continue
+                if response.status_code == 200:
+                    self.overpass_url = endpoint
+                    return response
+                last_error = f"{endpoint}: HTTP {response.status_code}: {self._response_excerpt(response)}"
+                if response.status_code == 400:
+                    # The query itself is broken, another mirror or attempt will not help
+                    raise ValueError(f"Invalid return data (HTTP {response.status_code}): {self._response_excerpt(response)}")
+                if response.status_code == 429:
+                    wait = self.slotWait(endpoint)
+                    if wait is not None:
+                        slot_waits.append(wait)
+            if attempt == self.max_attempts - 1:
+                break
+            if slot_waits:
+                delay = min(min(slot_waits) + 1, self.max_backoff)
+            else:
+                delay = min(self.backoff * 2 ** attempt, self.max_backoff) * random.uniform(0.5, 1.5)
+            logger.warning("All Overpass endpoints busy (%s), retrying in %.0f seconds", last_error, delay)
+            time.sleep(delay)
+        raise ValueError(f"Overpass request failed after {self.max_attempts} attempts: {last_error}")
+
+    @instrumentation.stage("overpass")
+    def getElementsFromQuery(self, overpass_query):
+        if self.cache is not None:
+            cached_body = self.cache.get(overpass_query)
+            if cached_body is not None:
+                instrumentation.count("overpass_cache_hits")
+                return json.loads(cached_body)["elements"]
+            instrumentation.count("overpass_cache_misses")
+        response = self._fetch(overpass_query)
         try:
-            resultElements = response.json()["elements"]
+            result = response.json()
+            resultElements = result["elements"]
         except (ValueError, KeyError, TypeError):
             snippet = self._response_excerpt(response)
             raise ValueError(f"Invalid return data (HTTP {response.status_code}): {snippet}")
+        remark = result.get("remark") or ""
+        if "runtime error" in remark:
+            # Timeouts and memory exhaustion still answer 200, but with a partial result
+            raise ValueError(f"Overpass query did not complete: {remark}")
+        if self.cache is not None:
+            self.cache.put(overpass_query, response.content)
         return resultElements
 
+    def iterElementsFromQuery(self, overpass_query) -> Iterator[Dict]:
+        """
+        Like getElementsFromQuery(), but stream the response and yield the elements one by one,
+        so neither the body nor the full result list is ever held in memory.
+        Responses are written to the cache while streaming and cached responses are streamed from disk.
+        """
+        response = None
+        chunks = self.cache.get_stream(overpass_query) if self.cache is not None else None
+        if self.cache is not None:
+            instrumentation.count("overpass_cache_hits" if chunks is not None else "overpass_cache_misses")
+        if chunks is None:
+            # Only the request is timed; reading the stream is interleaved with the caller's work
+            with instrumentation.stage("overpass"):
+                response = self._fetch(overpass_query, stream=True)
+            chunks = response.iter_content(chunk_size=STREAM_CHUNK_SIZE)
+            if self.cache is not None:
+                chunks = self.cache.put_stream(overpass_query, chunks)
+        try:
+            trailer = yield from _iter_json_array(chunks, "elements")
+            remark = _trailer_remark(trailer)
+            if "runtime error" in remark:
+                # The stream is cached once it was read to the end, but a partial result must not be
+                if self.cache is not None:
+                    self.cache.discard(overpass_query)
+                raise ValueError(f"Overpass query did not complete: {remark}")
+        finally:
+            # Closing the chunk generators right away drops unfinished cache entries
+            if hasattr(chunks, "close"):
+                chunks.close()
+            if response is not None:
+                response.close()
 
 def createElementCenterPoint(element):
     # This function forces the element to have a lat and lon key
@@ -393,8 +1085,7 @@ def createElementCenterPoint(element):
             element['lat'] = lat / len(element['geometry']['coordinates'])
             element['lon'] = lon / len(element['geometry']['coordinates'])
     else:
-        print(element)
-        raise ValueError("No handalable coordinates found for element")
+        raise ValueError(f"No handalable coordinates found for element: {element}")
     return element
 
 def createGeometryFromElement(element):
@@ -415,8 +1106,7 @@ def createGeometryFromElement(element):
             [element["bounds"]["minlon"], element["bounds"]["minlat"]]
         ]	
     else:
-        print(element)
-        raise ValueError("No handalable geometry found for element")
+        raise ValueError(f"No handalable geometry found for element: {element}")
     return element
 
 def getElementCenterPoint(element):
@@ -428,39 +1118,113 @@ def getElementGeometry(element):
     return newElement["simpleGeometry"]
 
 
-def _element_was_modified_by_user(osmType, osmId, username):
-    """Return True if the given user appears in the history of the element."""
-    url = f"https://api.openstreetmap.org/api/0.6/{osmType}/{osmId}/history.json"
-    response = requests.get(url)
-    if response.status_code != 200:
-        return False
+def _get_history_store():
+    # Imported lazily because history_store itself builds on this module
     try:
-        versions = response.json().get("elements", [])
-    except ValueError:
+        from . import history_store
+    except ImportError:
+        import history_store
+    return history_store.get_history_store()
+
+
+def _element_was_modified_by_user(osmType, osmId, username, store=None, version=None):
+    """Return True if the given user appears in the history of the element."""
+    versions = (store or _get_history_store()).get_history(osmType, osmId, version)
+    if not versions:
         return False
-    for version in versions:
-        if version.get("user") == username:
+    for entry in versions:
+        if entry.get("user") == username:
             return True
     return False
 
 
-def filterElementsByUser(elements, username):
+def getUserChangesetIds(username, http=None):
+    """Return the IDs of all changesets of *username*, newest first."""
+    http = http or getHttpClient()
+    url = f"{OSM_API_URL}/changesets.json"
+    changeset_ids = []
+    seen = set()
+    created_before = None
+    while True:
+        params = {"display_name": username}
+        if created_before:
+            # The API returns at most 100 changesets per call, so page backwards through time
+            params["time"] = f"2004-01-01T00:00:00Z,{created_before}"
+        response = http.get(url, params=params)
+        response.raise_for_status()
+        changesets = [c for c in response.json().get("changesets", []) if c["id"] not in seen]
+        if not changesets:
+            break
+        for changeset in changesets:
+            seen.add(changeset["id"])
+            changeset_ids.append(changeset["id"])
+        created_before = min(c["created_at"] for c in changesets)
+    return changeset_ids
+
+
+def getChangesetElementIds(changesetIds, http=None):
+    """Return the set of (type, id) of all elements created, modified or deleted in the given changesets."""
+    http = http or getHttpClient()
+
+    def download(changesetId):
+        response = http.get(f"{OSM_API_URL}/changeset/{changesetId}/download")
+        response.raise_for_status()
+        root = ET.fromstring(response.content)
+        return {(element.tag, int(element.get("id"))) for action in root for element in action}
+
+    element_ids = set()
+    for ids in http.map(download, changesetIds):
+        element_ids |= ids
+    return element_ids
+
+
+def filterElementsByUser(elements, username, store=None, max_workers=None, use_changesets=False, progress_every=1000):
     """Filter a list of elements keeping only those edited by *username*.
 
     *elements* may contain Overpass-style dicts with ``type`` and ``id`` keys
-    or ``(type, id)`` tuples. The original objects are returned for elements
-    where the user has at least one version in the OSM history.
-    """
+    or ``(type, id)`` tuples. The original objects are returned, in input order,
+    for elements where the user has at least one version in the OSM history.
+    Histories come from the shared history store (or *store* if given) and are
+    checked by *max_workers* threads (default: the concurrency of the store's HTTP client).
 
-    filtered = []
+    With *use_changesets* the user's changesets are downloaded once instead and
+    elements are kept if they appear in one of them, so no history is fetched.
+    That is faster for users with few changesets and many candidate elements.
+    """
+    store = store or _get_history_store()
+    candidates = []
     for element in elements:
+        version = None
         if isinstance(element, tuple):
             osmType, osmId = element
         else:
             osmType = element.get("type")
             osmId = element.get("id")
+            version = element.get("version")
         if not osmType or not osmId:
             continue
-        if _element_was_modified_by_user(osmType, osmId, username):
-            filtered.append(element)
-    return filtered
+        candidates.append((element, osmType, int(osmId), version))
+
+    if use_changesets:
+        changeset_ids = getUserChangesetIds(username, store.http)
+        touched = getChangesetElementIds(changeset_ids, store.http)
+        logger.info("%s touched %d elements in %d changesets", username, len(touched), len(changeset_ids))
+        return [element for element, osmType, osmId, _ in candidates if (osmType, osmId) in touched]
+
+    def check(candidate):
+        _, osmType, osmId, version = candidate
+        try:
+            return _element_was_modified_by_user(osmType, osmId, username, store, version)
+        except requests.RequestException as exc:
+            logger.warning("Could not check history of %s/%s: %s", osmType, osmId, exc)
+            return False
+
+    start = time.monotonic()
+    with instrumentation.stage("filter_by_user"), \
+            ThreadPoolExecutor(max_workers=max_workers or store.http.max_concurrency) as pool:
+        futures = [pool.submit(check, candidate) for candidate in candidates]
+        for done, _ in enumerate(as_completed(futures), 1):
+            if done % progress_every == 0 or done == len(futures):
+                elapsed = max(time.monotonic() - start, 1e-9)
+                logger.info("Checked %d/%d histories (%.1f/s)", done, len(futures), done / elapsed)
+    return [candidate[0] for candidate, future in zip(candidates, futures) if future.result()]
@@ -0,0 +1,134 @@
+"""
+Persistent store for the version histories of OSM elements.
+
+Histories are kept in a SQLite database shared by all challenges, keyed by
+(type, id). An entry is reused as long as it covers the element's current
+version, so several challenges running over the same objects download each
+history only once.
+"""
+import os
+import json
+import time
+import logging
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+try:
+    from . import challenge_builder as mrcb
+    from . import instrumentation
+except ImportError:
+    import challenge_builder as mrcb
+    import instrumentation
+
+logger = logging.getLogger(__name__)
+
+# Shared by all challenges, so it lives next to the shared modules instead of the working directory
+DEFAULT_HISTORY_DB = os.environ.get(
+    "OSM_HISTORY_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".history_cache.sqlite")
+)
+# How long a history is trusted when the caller does not know the current version of the element
+UNVERSIONED_TTL = 24 * 60 * 60
+# Fields kept from each version; geometry and members are not needed by any history consumer
+VERSION_FIELDS = ("type", "id", "version", "timestamp", "user", "uid", "changeset", "visible", "tags")
+
+
+class HistoryStore:
+    """
+    Fetches element histories from the OSM API and caches them in SQLite.
+    get_history() returns the versions oldest first as dicts in the format of the JSON API.
+    Safe to use from several threads; network requests are made outside the database lock.
+    """
+    def __init__(self, path: str = DEFAULT_HISTORY_DB, http: Optional["mrcb.HttpClient"] = None,
+                 unversioned_ttl: float = UNVERSIONED_TTL):
+        self.path = path
+        self.http = http or mrcb.getHttpClient()
+        self.unversioned_ttl = unversioned_ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # WAL lets several challenge scripts read and write the store at the same time
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS history ("
+            "type TEXT NOT NULL, id INTEGER NOT NULL, version INTEGER NOT NULL, "
+            "fetched REAL NOT NULL, versions TEXT NOT NULL, PRIMARY KEY (type, id))"
+        )
+        self._db.commit()
+
+    def _lookup(self, osm_type: str, osm_id: int, current_version: Optional[int]) -> Optional[List[Dict]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT version, fetched, versions FROM history WHERE type = ? AND id = ?",
+                (osm_type, int(osm_id))
+            ).fetchone()
+        if row is None:
+            return None
+        version, fetched, versions = row
+        if current_version is not None:
+            if version < int(current_version):
+                return None
+        elif time.time() - fetched > self.unversioned_ttl:
+            return None
+        return json.loads(versions)
+
+    def _store(self, osm_type: str, osm_id: int, versions: List[Dict]):
+        latest = max((int(v.get("version", 0)) for v in versions), default=0)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO history (type, id, version, fetched, versions) VALUES (?, ?, ?, ?, ?)",
+                (osm_type, int(osm_id), latest, time.time(), json.dumps(versions, ensure_ascii=False, separators=(",", ":")))
+            )
+            self._db.commit()
+
+    def _fetch(self, osm_type: str, osm_id: int) -> Optional[List[Dict]]:
+        url = f"{mrcb.OSM_API_URL}/{osm_type}/{osm_id}/history.json"
+        response = self.http.get(url)
+        if response.status_code != 200:
+            logger.warning("Failed to get history for %s/%s (HTTP %s)", osm_type, osm_id, response.status_code)
+            return None
+        try:
+            elements = response.json().get("elements", [])
+        except ValueError:
+            return None
+        return [{field: element[field] for field in VERSION_FIELDS if field in element} for element in elements]
+
+    def get_stored_history(self, osm_type: str, osm_id: int, current_version: Optional[int] = None) -> Optional[List[Dict]]:
+        """
+        Return the stored history if it is still valid for *current_version* (see get_history()), without any download.
+        Callers that only need part of a history can stream it themselves on a miss.
+        """
+        versions = self._lookup(osm_type, osm_id, current_version)
+        instrumentation.count("history_cache_misses" if versions is None else "history_cache_hits")
+        return versions
+
+    def get_history(self, osm_type: str, osm_id: int, current_version: Optional[int] = None) -> Optional[List[Dict]]:
+        """
+        Return all versions of the element, oldest first, or None if the history could not be fetched.
+        A stored history is used if it contains *current_version*; without a version it is trusted for unversioned_ttl seconds.
+        """
+        versions = self.get_stored_history(osm_type, osm_id, current_version)
+        if versions is not None:
+            return versions
+        with instrumentation.stage("history_fetch"):
+            versions = self._fetch(osm_type, osm_id)
+        if versions is not None:
+            self._store(osm_type, osm_id, versions)
+        return versions
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_history_store: Optional[HistoryStore] = None
+_history_store_lock = threading.Lock()
+
+
+def get_history_store() -> HistoryStore:
+    """Return the history store shared by everything in this process."""
+    global _history_store
+    with _history_store_lock:
+        if _history_store is None:
+            _history_store = HistoryStore()
+        return _history_store
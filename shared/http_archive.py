@@ -0,0 +1,240 @@
+"""
+Record and replay all HTTP traffic of a generator run.
+
+With TAGFIXES_HTTP_MODE=record every request made through requests (the shared HttpClient,
+Overpass, history lookups, imgur checks, ...) is appended to the archive at TAGFIXES_HTTP_ARCHIVE
+(default: http_archive.bin in the working directory). With TAGFIXES_HTTP_MODE=replay the same run
+is answered from the archive without any network access, so CPU hot paths can be profiled
+offline on production-sized inputs.
+
+The archive is append-only: each record is a JSON header line followed by the zlib-compressed
+body. A crashed recording stays readable up to the last complete record. Identical requests are
+replayed in the order they were recorded; once a request's recordings run out, the last one is served again.
+Streamed bodies are compressed into a temporary file while the caller reads them and are only
+archived once read to the end. Worker processes forked from the recording process write to an
+archive of their own (<archive>.<pid>), which is replayed together with the main one.
+"""
+import io
+import os
+import json
+import zlib
+import shutil
+import hashlib
+import tempfile
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+DEFAULT_ARCHIVE = "http_archive.bin"
+# Responses with larger bodies (e.g. PBF extracts) are passed through but not recorded
+MAX_RECORDED_BODY = 256 * 1024 ** 2
+# Bytes read at a time when the rest of an abandoned streamed body is recorded
+STREAM_CHUNK_SIZE = 64 * 1024
+# Headers kept in the archive; the body is stored decoded, so encoding and length headers are dropped
+KEPT_HEADERS = ("Content-Type",)
+
+
+class NotInArchive(requests.RequestException):
+    pass
+
+
+def request_key(request: requests.PreparedRequest) -> str:
+    key = f"{request.method} {request.url}"
+    body = request.body
+    if body:
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        key += " " + hashlib.sha256(body).hexdigest()
+    return key
+
+
+class _RecordingStream:
+    """
+    Stands in for response.raw of a streamed response being recorded. The decoded body is compressed
+    into a temporary file as the caller reads it and archived once it was read to the end; bodies
+    growing beyond MAX_RECORDED_BODY are passed through without being recorded.
+    """
+    def __init__(self, archive: "HttpArchive", header: Dict, raw):
+        self._archive = archive
+        self._header = header
+        self._raw = raw
+        self._spool = tempfile.TemporaryFile()
+        self._compressor = zlib.compressobj()
+        self._size = 0
+        # The body is always handed out decoded; readers like osm_history set this anyway
+        self.decode_content = True
+
+    def read(self, amt: Optional[int] = None, *args, **kwargs) -> bytes:
+        data = self._raw.read(amt, decode_content=True)
+        if self._spool is not None:
+            self._size += len(data)
+            if self._size > MAX_RECORDED_BODY:
+                self._discard()
+            elif data:
+                self._spool.write(self._compressor.compress(data))
+            if self._spool is not None and (not data or amt is None):
+                self._finish()
+        return data
+
+    def _finish(self):
+        self._spool.write(self._compressor.flush())
+        self._header["size"] = self._spool.tell()
+        self._spool.seek(0)
+        self._archive._append(self._header, self._spool)
+        self._discard()
+
+    def _discard(self):
+        self._spool.close()
+        self._spool = None
+
+    def close(self):
+        # Callers may stop reading early (e.g. osm_history); the rest is read so the replay gets the full body
+        while self._spool is not None:
+            self.read(STREAM_CHUNK_SIZE)
+        self._raw.close()
+
+    def release_conn(self):
+        release_conn = getattr(self._raw, "release_conn", None)
+        if release_conn is not None:
+            release_conn()
+
+    @property
+    def closed(self) -> bool:
+        return self._raw.closed
+
+
+class HttpArchive:
+    def __init__(self, path: str, mode: str):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown HTTP archive mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._index: Dict[str, List[Tuple[str, int, int, Dict]]] = {}
+        self._served: Dict[str, int] = {}
+        if mode == "replay":
+            paths = [path for path in self.archive_files() if os.path.exists(path)]
+            if not paths:
+                raise FileNotFoundError(f"No HTTP archive at {self.path}")
+            for path in paths:
+                self._load_index(path)
+
+    def archive_files(self) -> List[str]:
+        """The archive followed by the archives recorded by worker processes."""
+        directory = os.path.dirname(self.path) or "."
+        prefix = os.path.basename(self.path) + "."
+        worker_files = sorted(
+            name for name in os.listdir(directory) if name.startswith(prefix) and name[len(prefix):].isdigit()
+        )
+        return [self.path] + [os.path.join(directory, name) for name in worker_files]
+
+    def _record_path(self) -> str:
+        pid = os.getpid()
+        return self.path if pid == self._pid else f"{self.path}.{pid}"
+
+    def _load_index(self, path: str):
+        with open(path, "rb") as f:
+            while True:
+                line = f.readline()
+                if not line:
+                    break
+                try:
+                    header = json.loads(line)
+                except ValueError:
+                    # Torn header of an interrupted recording
+                    break
+                offset = f.tell()
+                f.seek(header["size"], os.SEEK_CUR)
+                if f.tell() > os.fstat(f.fileno()).st_size:
+                    break
+                self._index.setdefault(header["key"], []).append((path, offset, header["size"], header))
+
+    def _append(self, header: Dict, compressed):
+        """Append a record; *compressed* is the compressed body as bytes or as a file positioned at its start."""
+        with self._lock:
+            with open(self._record_path(), "ab") as f:
+                f.write(json.dumps(header, ensure_ascii=False).encode("utf-8") + b"\n")
+                if isinstance(compressed, bytes):
+                    f.write(compressed)
+                else:
+                    shutil.copyfileobj(compressed, f)
+
+    def record(self, request: requests.PreparedRequest, response: requests.Response):
+        header = {
+            "key": request_key(request),
+            "url": response.url,
+            "status": response.status_code,
+            "headers": {name: response.headers[name] for name in KEPT_HEADERS if name in response.headers},
+        }
+        if not response._content_consumed:
+            # Streamed: record the body while the caller reads it
+            response.raw = _RecordingStream(self, header, response.raw)
+            return
+        body = response.content or b""
+        if len(body) > MAX_RECORDED_BODY:
+            return
+        compressed = zlib.compress(body)
+        header["size"] = len(compressed)
+        self._append(header, compressed)
+
+    def replay(self, request: requests.PreparedRequest) -> requests.Response:
+        key = request_key(request)
+        with self._lock:
+            entries = self._index.get(key)
+            if not entries:
+                raise NotInArchive(f"No recorded response for {key}", request=request)
+            served = self._served.get(key, 0)
+            self._served[key] = served + 1
+        path, offset, size, header = entries[min(served, len(entries) - 1)]
+        with open(path, "rb") as f:
+            f.seek(offset)
+            body = zlib.decompress(f.read(size))
+        response = requests.Response()
+        response.status_code = header["status"]
+        response.headers = CaseInsensitiveDict(header["headers"])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = header["url"]
+        response.request = request
+        response.reason = ""
+        response._content = body
+        response.raw = io.BytesIO(body)
+        return response
+
+
+_archive: Optional[HttpArchive] = None
+_original_send = requests.Session.send
+
+
+def _archived_send(session, request, **kwargs):
+    if _archive is None:
+        return _original_send(session, request, **kwargs)
+    if _archive.mode == "replay":
+        return _archive.replay(request)
+    response = _original_send(session, request, **kwargs)
+    _archive.record(request, response)
+    return response
+
+
+def enable(mode: str, path: str = DEFAULT_ARCHIVE) -> HttpArchive:
+    """Route all requests sessions of this process through an archive in *mode* ("record" or "replay")."""
+    global _archive
+    _archive = HttpArchive(path, mode)
+    requests.Session.send = _archived_send
+    return _archive
+
+
+def disable():
+    global _archive
+    _archive = None
+    requests.Session.send = _original_send
+
+
+def enable_from_env() -> Optional[HttpArchive]:
+    mode = os.environ.get("TAGFIXES_HTTP_MODE")
+    if not mode or _archive is not None:
+        return _archive
+    return enable(mode, os.environ.get("TAGFIXES_HTTP_ARCHIVE", DEFAULT_ARCHIVE))
@@ -0,0 +1,138 @@
+"""
+Lightweight per-stage timing and counters for generator runs.
+
+    with instrumentation.stage("overpass"):
+        elements = op.getElementsFromQuery(query)
+
+    @instrumentation.stage("build_task")
+    def build_task(element): ...
+
+    instrumentation.count("tasks_skipped")
+
+The shared modules already time Overpass, OSM API and history lookups and serialization, and count
+HTTP requests, cache hits and emitted tasks. With TAGFIXES_RUN_REPORT=<path> set, a JSON report of
+all stages and counters is written to that path when the process exits.
+
+Stage times are cumulative: stages that run in several threads at once can add up to more than the wall time.
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+
+class StageStats:
+    __slots__ = ("calls", "seconds", "max_seconds")
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "seconds": round(self.seconds, 6),
+            "max_seconds": round(self.max_seconds, 6),
+        }
+
+
+_lock = threading.Lock()
+_stages: Dict[str, StageStats] = {}
+_counters: Dict[str, int] = {}
+_started = time.time()
+_started_perf = time.perf_counter()
+_report_path: Optional[str] = None
+_pid = os.getpid()
+
+
+@contextmanager
+def stage(name: str):
+    """Time the enclosed block (or, used as a decorator, every call of the function) under *name*."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with _lock:
+            stats = _stages.get(name)
+            if stats is None:
+                stats = _stages[name] = StageStats()
+            stats.calls += 1
+            stats.seconds += elapsed
+            if elapsed > stats.max_seconds:
+                stats.max_seconds = elapsed
+
+
+def count(name: str, amount: int = 1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def counter(name: str) -> int:
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def report() -> Dict:
+    """Return the stages and counters collected so far in this process."""
+    with _lock:
+        stages = {name: stats.to_dict() for name, stats in sorted(_stages.items())}
+        counters = dict(sorted(_counters.items()))
+    return {
+        "script": os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else None,
+        "argv": sys.argv[1:],
+        "pid": os.getpid(),
+        "started": datetime.fromtimestamp(_started, timezone.utc).isoformat(),
+        "wall_seconds": round(time.perf_counter() - _started_perf, 6),
+        "stages": stages,
+        "counters": counters,
+    }
+
+
+def write_report(path: str):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(report(), f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def reset():
+    global _started, _started_perf
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+        _started = time.time()
+        _started_perf = time.perf_counter()
+
+
+def _write_report_at_exit():
+    # Worker processes inherit the registration; only the process that enabled the report writes it
+    if _report_path is None or os.getpid() != _pid:
+        return
+    try:
+        write_report(_report_path)
+    except OSError as exc:
+        print(f"Could not write run report to {_report_path}: {exc}", file=sys.stderr)
+
+
+def enable_report(path: str):
+    """Write the run report to *path* when the process exits."""
+    global _report_path, _pid
+    _report_path = path
+    _pid = os.getpid()
+
+
+def enable_from_env() -> Optional[str]:
+    path = os.environ.get("TAGFIXES_RUN_REPORT")
+    if path and _report_path is None:
+        enable_report(path)
+    return _report_path
+
+
+atexit.register(_write_report_at_exit)
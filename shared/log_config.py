@@ -0,0 +1,92 @@
+"""
+Logging setup for the challenge generators.
+
+The shared modules and the challenge scripts log through the standard logging module:
+
+    logger = logging.getLogger(__name__)
+    logger.debug("Conversion result for %s: %s", element["id"], tag_changes)
+
+Messages are only formatted when their level is enabled, so per-element detail logged at debug
+level costs next to nothing in a normal run. A script calls setup_logging() once in main();
+TAGFIXES_LOG_LEVEL=DEBUG (or INFO, WARNING, ...) overrides the level it asks for.
+
+setup_logging() also switches on the other options of a run that are set in the environment:
+TAGFIXES_HTTP_MODE=record|replay routes all HTTP traffic through an archive (see http_archive) and
+TAGFIXES_RUN_REPORT=<path> writes the stage timings and counters there on exit (see instrumentation).
+Importing the shared modules never does.
+
+Log lines are written through tqdm when it is installed, so they do not break progress bars,
+and the number of records per level is added to the run report (see instrumentation) as
+log_<level> counters.
+"""
+import os
+import sys
+import logging
+from typing import Union
+
+try:
+    from tqdm import tqdm
+except ImportError:
+    tqdm = None
+
+try:
+    from . import http_archive, instrumentation
+except ImportError:
+    import http_archive
+    import instrumentation
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+DATE_FORMAT = "%H:%M:%S"
+
+
+class TqdmHandler(logging.StreamHandler):
+    """Writes records to stderr above any running tqdm progress bar."""
+
+    def emit(self, record):
+        if tqdm is None:
+            super().emit(record)
+            return
+        try:
+            tqdm.write(self.format(record), file=self.stream)
+        except Exception:
+            self.handleError(record)
+
+
+class LevelCounter(logging.Handler):
+    """Counts the records of each level in the instrumentation counters."""
+
+    def emit(self, record):
+        instrumentation.count("log_" + record.levelname.lower())
+
+
+def _parse_level(level: Union[int, str]) -> int:
+    if isinstance(level, int):
+        return level
+    value = logging.getLevelName(level.strip().upper())
+    if not isinstance(value, int):
+        raise ValueError(f"Unknown log level: {level}")
+    return value
+
+
+def setup_logging(level: Union[int, str] = logging.INFO, stream=None) -> int:
+    """
+    Route the log records of this process to *stream* (default: stderr) at *level* and count them,
+    and enable the HTTP archive and run report configured in the environment.
+    Calling it again only changes the level. Returns the level in effect.
+    """
+    http_archive.enable_from_env()
+    instrumentation.enable_from_env()
+    env_level = os.environ.get("TAGFIXES_LOG_LEVEL")
+    effective = _parse_level(env_level) if env_level else _parse_level(level)
+    root = logging.getLogger()
+    root.setLevel(effective)
+    if not any(isinstance(handler, LevelCounter) for handler in root.handlers):
+        handler = TqdmHandler(stream or sys.stderr)
+        handler.setFormatter(logging.Formatter(LOG_FORMAT, DATE_FORMAT))
+        root.addHandler(handler)
+        root.addHandler(LevelCounter())
+    # Third party libraries are only interesting when something goes wrong
+    for name in ("urllib3", "requests"):
+        logging.getLogger(name).setLevel(max(effective, logging.WARNING))
+    return effective
+
@@ -0,0 +1,80 @@
+"""
+Analysis of the version history of OSM elements.
+
+The XML history returned by the OSM API is parsed incrementally: versions are
+yielded one by one (oldest first) and discarded right after, so long histories
+never have to be held in memory and callers can stop as soon as they found what
+they were looking for.
+"""
+import logging
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, Optional
+import xml.etree.ElementTree as ET
+
+try:
+    from . import challenge_builder as mrcb
+except ImportError:
+    import challenge_builder as mrcb
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TagSetter:
+    user: Optional[str]
+    version: int
+    timestamp: Optional[str]
+
+
+def iter_history_versions(source) -> Iterator[Dict]:
+    """
+    Incrementally parse an OSM API XML history from the file-like *source*.
+    Yields one dict per version in the format of the JSON API (type, id, version, user, timestamp, tags).
+    """
+    root = None
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = elem
+            continue
+        if elem.tag not in ("node", "way", "relation"):
+            continue
+        yield {
+            "type": elem.tag,
+            "id": int(elem.get("id")),
+            "version": int(elem.get("version")),
+            "user": elem.get("user"),
+            "timestamp": elem.get("timestamp"),
+            "tags": {tag.get("k"): tag.get("v") for tag in elem.iter("tag")},
+        }
+        # Drop the parsed version so memory stays flat for long histories
+        root.clear()
+
+
+def find_tag_introduction(versions: Iterable[Dict], key: str, value: str) -> Optional[TagSetter]:
+    """
+    Return who set key=value, i.e. the first version (oldest first) that has the tag with that value.
+    Stops consuming *versions* as soon as it is found.
+    """
+    for version in versions:
+        if (version.get("tags") or {}).get(key) == value:
+            return TagSetter(version.get("user"), int(version["version"]), version.get("timestamp"))
+    return None
+
+
+def fetch_tag_setter(osm_type: str, osm_id: int, key: str, value: str,
+                     http: Optional["mrcb.HttpClient"] = None) -> Optional[TagSetter]:
+    """
+    Stream the history of an element and return who introduced key=value.
+    The download is abandoned as soon as the introducing version has been parsed.
+    """
+    url = f"{mrcb.OSM_API_URL}/{osm_type}/{osm_id}/history"
+    response = (http or mrcb.getHttpClient()).get(url, stream=True)
+    try:
+        if response.status_code != 200:
+            logger.warning("Failed to get history for %s/%s (HTTP %s)", osm_type, osm_id, response.status_code)
+            return None
+        response.raw.decode_content = True
+        return find_tag_introduction(iter_history_versions(response.raw), key, value)
+    finally:
+        response.close()
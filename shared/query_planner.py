@@ -0,0 +1,150 @@
+"""
+Split large Overpass queries into tiles, run the tiles concurrently and merge the results.
+
+A query template marks the spot where a search area filter belongs with AREA_PLACEHOLDER,
+for example ``nwr["note"~"bgerissen"]{{area}};``. Every tile replaces the placeholder with
+its own filter: a sub-area such as a German state, or a cell of a bbox grid. Tiles run in
+parallel within the slot count the Overpass server grants. Failed tiles are retried on
+their own, and elements are deduplicated by (type, id) across tiles.
+"""
+import re
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    from . import challenge_builder as mrcb
+    from . import instrumentation
+except ImportError:
+    import challenge_builder as mrcb
+    import instrumentation
+
+logger = logging.getLogger(__name__)
+
+AREA_PLACEHOLDER = "{{area}}"
+# Overpass area IDs (3600000000 + relation ID) of the German states
+GERMAN_STATE_AREA_IDS = {
+    "Baden-Württemberg": 3600062611,
+    "Bayern": 3602145268,
+    "Berlin": 3600062422,
+    "Brandenburg": 3600062504,
+    "Bremen": 3600062718,
+    "Hamburg": 3600062782,
+    "Hessen": 3600062650,
+    "Mecklenburg-Vorpommern": 3600028322,
+    "Niedersachsen": 3600454192,
+    "Nordrhein-Westfalen": 3600062761,
+    "Rheinland-Pfalz": 3600062341,
+    "Saarland": 3600062372,
+    "Sachsen": 3600062467,
+    "Sachsen-Anhalt": 3600062607,
+    "Schleswig-Holstein": 3600051529,
+    "Thüringen": 3600062366,
+}
+# (south, west, north, east)
+GERMANY_BBOX = (47.27, 5.86, 55.06, 15.05)
+# Used when the server status cannot be read
+DEFAULT_SLOTS = 2
+# Rounds in which failed tiles are run again
+TILE_ATTEMPTS = 3
+
+# The leading [out:json][timeout:...]; settings statement of a query
+_SETTINGS = re.compile(r"^\s*(\[[^\]]*\]\s*)+;")
+
+
+@dataclass
+class Tile:
+    name: str
+    # Replaces AREA_PLACEHOLDER in the query
+    area_filter: str
+    # Statements the filter depends on, inserted after the settings of the query
+    preamble: str = ""
+
+    def render(self, template: str) -> str:
+        if AREA_PLACEHOLDER not in template:
+            raise ValueError(f"Query template does not contain {AREA_PLACEHOLDER}")
+        query = template.replace(AREA_PLACEHOLDER, self.area_filter)
+        if not self.preamble:
+            return query
+        settings = _SETTINGS.match(query)
+        if settings is None:
+            return self.preamble + "\n" + query
+        return query[:settings.end()] + "\n" + self.preamble + query[settings.end():]
+
+
+def area_tiles(area_ids: Dict[str, int]) -> List[Tile]:
+    """One tile per Overpass area, given as {name: area id}."""
+    return [
+        Tile(name, "(area.tileArea)", f"area(id:{area_id})->.tileArea;")
+        for name, area_id in area_ids.items()
+    ]
+
+
+def german_state_tiles() -> List[Tile]:
+    return area_tiles(GERMAN_STATE_AREA_IDS)
+
+
+def bbox_tiles(bbox: Tuple[float, float, float, float] = GERMANY_BBOX, rows: int = 4, cols: int = 4) -> List[Tile]:
+    """Split *bbox* (south, west, north, east) into a rows x cols grid of tiles."""
+    south, west, north, east = bbox
+    lat_step = (north - south) / rows
+    lon_step = (east - west) / cols
+    tiles = []
+    for row in range(rows):
+        for col in range(cols):
+            cell = (south + row * lat_step, west + col * lon_step,
+                    south + (row + 1) * lat_step, west + (col + 1) * lon_step)
+            tiles.append(Tile(f"bbox {row}/{col}", "(" + ",".join(f"{c:.6f}" for c in cell) + ")"))
+    return tiles
+
+
+def _dedupe(results: Iterable[List[Dict]]) -> List[Dict]:
+    merged: Dict[Tuple[str, int], Dict] = {}
+    for elements in results:
+        for element in elements:
+            merged.setdefault((element["type"], element["id"]), element)
+    return list(merged.values())
+
+
+def run_tiled_query(template: str, tiles: List[Tile], overpass: Optional["mrcb.Overpass"] = None,
+                    max_parallel: Optional[int] = None, attempts: int = TILE_ATTEMPTS) -> List[Dict]:
+    """
+    Run *template* once per tile and return the merged elements, deduplicated by (type, id) in tile order.
+    At most *max_parallel* tiles run at the same time (default: the slot count of the Overpass server).
+    Tiles that fail are retried for up to *attempts* rounds; if one still fails, ValueError is raised.
+    """
+    overpass = overpass or mrcb.Overpass(cache=mrcb.OverpassCache())
+    if max_parallel is None:
+        # A rate limit of 0 means the server does not limit us
+        max_parallel = overpass.rateLimit() or DEFAULT_SLOTS
+    results: Dict[int, List[Dict]] = {}
+    pending = list(range(len(tiles)))
+    errors: Dict[int, Exception] = {}
+
+    def run(index):
+        try:
+            return index, overpass.getElementsFromQuery(tiles[index].render(template)), None
+        except ValueError as exc:
+            return index, None, exc
+
+    for attempt in range(attempts):
+        if not pending:
+            break
+        with instrumentation.stage("overpass_tiles"), \
+                ThreadPoolExecutor(max_workers=max(1, min(max_parallel, len(pending)))) as pool:
+            outcomes = list(pool.map(run, pending))
+        pending = []
+        for index, elements, error in outcomes:
+            if error is None:
+                results[index] = elements
+                logger.info("Tile %s: %d elements", tiles[index].name, len(elements))
+            else:
+                errors[index] = error
+                pending.append(index)
+                instrumentation.count("overpass_tile_failures")
+                logger.warning("Tile %s failed (round %d/%d): %s", tiles[index].name, attempt + 1, attempts, error)
+    if pending:
+        failed = ", ".join(tiles[index].name for index in pending)
+        raise ValueError(f"Tiles failed after {attempts} rounds: {failed} ({errors[pending[0]]})")
+    return _dedupe(results[index] for index in range(len(tiles)))
@@ -0,0 +1,175 @@
+"""
+Local stand-in for the Overpass and OSM APIs that serves recorded responses from a fixture directory.
+
+Point the generators at it with TAGFIXES_BASE_URL=http://127.0.0.1:8765 to run and benchmark
+them without touching the public services. Latency and errors can be injected to exercise
+retries and concurrency.
+
+Fixture layout:
+    overpass/<OverpassCache key>.json   interpreter responses; entries of .overpass_cache/ can be copied as is
+    osm/node/1.json                     GET /api/0.6/node/1.json, also used to answer /api/0.6/nodes.json?nodes=1,2
+    osm/node/1/history.json             GET /api/0.6/node/1/history.json
+    osm/node/1/history.xml              GET /api/0.6/node/1/history (paths without extension are served from .xml)
+
+Usage: python standin_server.py <fixture dir> [--port 8765] [--latency 0.2] [--jitter 0.1]
+                                [--error-rate 0.05] [--error-status 503]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+from urllib.parse import urlsplit, parse_qs
+
+try:
+    from . import challenge_builder as mrcb
+except ImportError:
+    import challenge_builder as mrcb
+
+DEFAULT_PORT = 8765
+CONTENT_TYPES = {".json": "application/json", ".xml": "text/xml"}
+
+
+class StandinServer:
+    """
+    Threaded HTTP server answering Overpass (/api/interpreter, /api/status) and OSM API 0.6 requests from *fixture_dir*.
+    Every request waits *latency* (+ up to *jitter*) seconds, and a share of *error_rate* requests fails with *error_status*.
+    """
+    def __init__(self, fixture_dir: str, host: str = "127.0.0.1", port: int = DEFAULT_PORT,
+                 latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, error_status: int = 503):
+        self.fixture_dir = fixture_dir
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.request_count = 0
+        self._count_lock = threading.Lock()
+        self._cache_keys = mrcb.OverpassCache(os.path.join(fixture_dir, "overpass"))
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _read_fixture(self, *parts) -> Optional[bytes]:
+        path = os.path.join(self.fixture_dir, *parts)
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except (FileNotFoundError, IsADirectoryError):
+            return None
+
+    def overpass(self, query: str) -> Tuple[int, str, bytes]:
+        body = self._read_fixture("overpass", self._cache_keys.key(query) + ".json")
+        if body is None:
+            return 400, "text/plain", b"No recorded response for this query"
+        return 200, "application/json", body
+
+    def osm_api(self, path: str, params: dict) -> Tuple[int, str, bytes]:
+        parts = [p for p in path.split("/") if p]
+        name, ext = os.path.splitext(parts[-1])
+        if len(parts) == 1 and name in ("nodes", "ways", "relations"):
+            # Multi-fetch: like the real API, the whole request fails if one element is missing
+            osm_type = name[:-1]
+            elements = []
+            for osm_id in params.get(name, [""])[0].split(","):
+                body = self._read_fixture("osm", osm_type, f"{osm_id}.json")
+                if body is None:
+                    return 404, "text/plain", f"{osm_type} {osm_id} not found".encode()
+                elements.extend(json.loads(body)["elements"])
+            return 200, "application/json", json.dumps({"version": "0.6", "elements": elements}).encode()
+        if not ext:
+            parts[-1] = name + ".xml"
+            ext = ".xml"
+        body = self._read_fixture("osm", *parts)
+        if body is None:
+            return 404, "text/plain", b"Not found"
+        return 200, CONTENT_TYPES.get(ext, "application/octet-stream"), body
+
+    def status(self) -> Tuple[int, str, bytes]:
+        return 200, "text/plain", b"Connected as: 0\nRate limit: 0\n4 slots available now.\n"
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _respond(self, query_params: dict, form: Optional[dict] = None):
+                with server._count_lock:
+                    server.request_count += 1
+                delay = server.latency + random.uniform(0, server.jitter)
+                if delay > 0:
+                    time.sleep(delay)
+                if server.error_rate > 0 and random.random() < server.error_rate:
+                    status, content_type, body = server.error_status, "text/plain", b"Injected error"
+                else:
+                    path = urlsplit(self.path).path
+                    if path == "/api/interpreter":
+                        data = (form or query_params).get("data", [""])[0]
+                        status, content_type, body = server.overpass(data)
+                    elif path == "/api/status":
+                        status, content_type, body = server.status()
+                    elif path.startswith("/api/0.6/"):
+                        status, content_type, body = server.osm_api(path[len("/api/0.6/"):], query_params)
+                    else:
+                        status, content_type, body = 404, "text/plain", b"Not found"
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self._respond(parse_qs(urlsplit(self.path).query))
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                form = parse_qs(self.rfile.read(length).decode("utf-8"))
+                self._respond(parse_qs(urlsplit(self.path).query), form)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        """Serve in a background thread."""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve recorded Overpass and OSM API responses")
+    parser.add_argument("fixture_dir")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra latency of up to this many seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with --error-status")
+    parser.add_argument("--error-status", type=int, default=503)
+    args = parser.parse_args(argv)
+    server = StandinServer(args.fixture_dir, args.host, args.port, args.latency, args.jitter,
+                           args.error_rate, args.error_status)
+    print(f"Serving {args.fixture_dir} on {server.base_url}, set TAGFIXES_BASE_URL={server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
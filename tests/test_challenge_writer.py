@@ -0,0 +1,92 @@
+import os
+import json
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from shared.challenge_builder import Challenge, ChallengeWriter, GeoFeature, Task, TagFix
+
+
+def _task(osm_id):
+    feature = GeoFeature.withId("node", osm_id, [1.0, 2.0], {"name": f"Node {osm_id}"})
+    return Task(feature, cooperativeWork=TagFix("node", osm_id, {"amenity": None}))
+
+
+class ChallengeWriterTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmpdir.name, "challenge.json")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_output_matches_in_memory_challenge(self):
+        challenge = Challenge()
+        for i in range(3):
+            challenge.addTask(_task(i))
+        expected = os.path.join(self.tmpdir.name, "expected.json")
+        challenge.saveToFile(expected)
+        with ChallengeWriter(self.filename) as writer:
+            for i in range(3):
+                writer.addTask(_task(i))
+        with open(expected, encoding="UTF-8") as f1, open(self.filename, encoding="UTF-8") as f2:
+            self.assertEqual(f1.read(), f2.read())
+
+    def test_records_are_rs_prefixed_lines(self):
+        with ChallengeWriter(self.filename) as writer:
+            writer.addTask(_task(1))
+        with open(self.filename, encoding="UTF-8") as f:
+            lines = f.read().split("\n")[:-1]
+        self.assertEqual(len(lines), 1)
+        self.assertTrue(lines[0].startswith("\x1e"))
+        self.assertEqual(json.loads(lines[0][1:])["features"][0]["properties"]["@id"], "node/1")
+
+    def test_tasks_beyond_cap_are_dropped(self):
+        with ChallengeWriter(self.filename, max_tasks=2) as writer:
+            results = [writer.addTask(_task(i)) for i in range(4)]
+        self.assertEqual(results, [True, True, False, False])
+        self.assertEqual(writer.taskCount, 2)
+        self.assertEqual(writer.droppedCount, 2)
+
+    @patch("shared.challenge_builder.MAX_CHALLENGE_TASKS", 3)
+    def test_in_memory_cap_matches_writer_cap(self):
+        challenge = Challenge()
+        for i in range(5):
+            challenge.addTask(_task(i))
+        challenge.cap()
+        with ChallengeWriter(self.filename, max_tasks=3) as writer:
+            for i in range(5):
+                writer.addTask(_task(i))
+        self.assertEqual(len(challenge.tasks), writer.taskCount)
+
+    def test_failed_run_keeps_previous_output(self):
+        with open(self.filename, "w", encoding="UTF-8") as f:
+            f.write("previous")
+        with self.assertRaises(RuntimeError):
+            with ChallengeWriter(self.filename) as writer:
+                writer.addTask(_task(1))
+                raise RuntimeError("boom")
+        with open(self.filename, encoding="UTF-8") as f:
+            self.assertEqual(f.read(), "previous")
+        self.assertFalse(os.path.exists(self.filename + ".tmp"))
+
+    def test_append_mode_resumes_after_crash(self):
+        writer = ChallengeWriter(self.filename, append=True)
+        writer.addTask(_task(1))
+        writer.addTask(_task(2))
+        writer.abort()
+        with open(self.filename, "a", encoding="UTF-8") as f:
+            f.write('\x1e{"type": "FeatureCo')
+        resumed = ChallengeWriter(self.filename, max_tasks=3, append=True)
+        self.assertEqual(resumed.existingIds, {"node/1", "node/2"})
+        self.assertEqual(resumed.taskCount, 2)
+        self.assertTrue(resumed.addTask(_task(3)))
+        self.assertFalse(resumed.addTask(_task(4)))
+        resumed.close()
+        with open(self.filename, encoding="UTF-8") as f:
+            records = [json.loads(line[1:]) for line in f.read().split("\n")[:-1]]
+        self.assertEqual([r["features"][0]["properties"]["@id"] for r in records], ["node/1", "node/2", "node/3"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch, Mock
+
+from shared.challenge_builder import HttpClient, filterElementsByUser
+from shared.history_store import HistoryStore
+
+
+def _mock_history_response(versions):
+    response = Mock()
+    response.status_code = 200
+    response.json.return_value = {"elements": versions}
+    return response
+
+
+VERSIONS = [
+    {"type": "node", "id": 1, "version": 1, "user": "alice", "lat": 0, "lon": 0, "tags": {"a": "1"}},
+    {"type": "node", "id": 1, "version": 2, "user": "bob", "lat": 0, "lon": 0, "tags": {"a": "2"}},
+]
+
+
+class HistoryStoreTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = HistoryStore(os.path.join(self.tmpdir.name, "history.sqlite"), http=HttpClient(min_interval=0, retries=0))
+
+    def tearDown(self):
+        self.store.close()
+        self.tmpdir.cleanup()
+
+    @patch("shared.challenge_builder.requests.Session.get")
+    def test_history_is_fetched_once(self, mock_get):
+        mock_get.return_value = _mock_history_response(VERSIONS)
+        first = self.store.get_history("node", 1, 2)
+        second = self.store.get_history("node", 1, 2)
+        self.assertEqual(first, second)
+        self.assertEqual([v["user"] for v in first], ["alice", "bob"])
+        self.assertNotIn("lat", first[0])
+        self.assertEqual(mock_get.call_count, 1)
+
+    @patch("shared.challenge_builder.requests.Session.get")
+    def test_stored_history_lookup_does_not_download(self, mock_get):
+        self.assertIsNone(self.store.get_stored_history("node", 1, 2))
+        mock_get.return_value = _mock_history_response(VERSIONS)
+        self.store.get_history("node", 1, 2)
+        self.assertEqual(len(self.store.get_stored_history("node", 1, 2)), 2)
+        self.assertIsNone(self.store.get_stored_history("node", 1, 3))
+        self.assertEqual(mock_get.call_count, 1)
+
+    @patch("shared.challenge_builder.requests.Session.get")
+    def test_newer_current_version_invalidates(self, mock_get):
+        mock_get.return_value = _mock_history_response(VERSIONS[:1])
+        self.store.get_history("node", 1, 1)
+        mock_get.return_value = _mock_history_response(VERSIONS)
+        self.assertEqual(len(self.store.get_history("node", 1, 2)), 2)
+        self.assertEqual(mock_get.call_count, 2)
+
+    @patch("shared.challenge_builder.requests.Session.get")
+    def test_unversioned_lookup_respects_ttl(self, mock_get):
+        mock_get.return_value = _mock_history_response(VERSIONS)
+        self.store.get_history("node", 1)
+        self.store.get_history("node", 1)
+        self.assertEqual(mock_get.call_count, 1)
+        self.store.unversioned_ttl = -1
+        self.store.get_history("node", 1)
+        self.assertEqual(mock_get.call_count, 2)
+
+    @patch("shared.challenge_builder.requests.Session.get")
+    def test_failed_fetch_is_not_stored(self, mock_get):
+        mock_get.return_value = Mock(status_code=500)
+        self.assertIsNone(self.store.get_history("node", 1, 2))
+        mock_get.return_value = _mock_history_response(VERSIONS)
+        self.assertIsNotNone(self.store.get_history("node", 1, 2))
+
+    @patch("shared.challenge_builder.requests.Session.get")
+    def test_filter_elements_by_user_uses_store(self, mock_get):
+        mock_get.return_value = _mock_history_response(VERSIONS)
+        elements = [{"type": "node", "id": 1, "version": 2}]
+        self.assertEqual(filterElementsByUser(elements, "bob", store=self.store), elements)
+        self.assertEqual(filterElementsByUser(elements, "carol", store=self.store), [])
+        self.assertEqual(mock_get.call_count, 1)
+
+    @patch("shared.challenge_builder.requests.Session.get")
+    def test_filter_keeps_input_order(self, mock_get):
+        def history(url, **kwargs):
+            osm_id = int(url.split("/")[-2])
+            user = "bob" if osm_id % 2 else "alice"
+            return _mock_history_response([{"type": "node", "id": osm_id, "version": 1, "user": user}])
+
+        mock_get.side_effect = history
+        elements = [("node", i) for i in range(1, 21)]
+        result = filterElementsByUser(elements, "bob", store=self.store, max_workers=4)
+        self.assertEqual(result, [("node", i) for i in range(1, 21, 2)])
+
+    @patch("shared.challenge_builder.requests.Session.get")
+    def test_changeset_prefilter_skips_histories(self, mock_get):
+        def api(url, **kwargs):
+            response = Mock(status_code=200)
+            if url.endswith("changesets.json"):
+                changesets = [] if "time" in kwargs.get("params", {}) else [{"id": 7, "created_at": "2020-01-01T00:00:00Z"}]
+                response.json.return_value = {"changesets": changesets}
+            else:
+                response.content = b'<osmChange><modify><node id="2"/></modify><create><way id="3"/></create></osmChange>'
+            return response
+
+        mock_get.side_effect = api
+        elements = [{"type": "node", "id": 1}, {"type": "node", "id": 2}, {"type": "way", "id": 3}]
+        result = filterElementsByUser(elements, "bob", store=self.store, use_changesets=True)
+        self.assertEqual(result, elements[1:])
+        self.assertFalse(any("history" in call.args[0] for call in mock_get.call_args_list))
+
+
+if __name__ == "__main__":
+    unittest.main()
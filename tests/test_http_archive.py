@@ -0,0 +1,102 @@
+import os
+import json
+import multiprocessing
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import requests
+
+from shared import http_archive
+from shared.challenge_builder import HttpClient
+from shared.osm_history import fetch_tag_setter
+from shared.standin_server import StandinServer
+
+
+class HttpArchiveTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        fixtures = os.path.join(self.tmpdir.name, "fixtures")
+        os.makedirs(os.path.join(fixtures, "osm", "node", "1"))
+        with open(os.path.join(fixtures, "osm", "node", "1.json"), "w") as f:
+            json.dump({"elements": [{"type": "node", "id": 1}]}, f)
+        with open(os.path.join(fixtures, "osm", "node", "1", "history.xml"), "w") as f:
+            f.write('<osm><node id="1" version="1" user="alice"><tag k="a" v="b"/></node></osm>')
+        self.server = StandinServer(fixtures, port=0).start()
+        self.archive = os.path.join(self.tmpdir.name, "archive.bin")
+        self.http = HttpClient(min_interval=0, retries=0)
+
+    def tearDown(self):
+        http_archive.disable()
+        self.server.stop()
+        self.tmpdir.cleanup()
+
+    def test_recorded_run_is_replayed_without_network(self):
+        url = self.server.base_url + "/api/0.6/node/1.json"
+        interpreter = self.server.base_url + "/api/interpreter"
+        http_archive.enable("record", self.archive)
+        recorded = self.http.get(url).json()
+        self.assertEqual(requests.post(interpreter, data={"data": "x"}).status_code, 400)
+        http_archive.disable()
+        requests_before = self.server.request_count
+
+        http_archive.enable("replay", self.archive)
+        self.assertEqual(self.http.get(url).json(), recorded)
+        self.assertEqual(requests.post(interpreter, data={"data": "x"}).status_code, 400)
+        with self.assertRaises(http_archive.NotInArchive):
+            self.http.get(url.replace("1.json", "2.json"))
+        self.assertEqual(self.server.request_count, requests_before)
+
+    def test_streamed_bodies_survive_recording(self):
+        http_archive.enable("record", self.archive)
+        with patch("shared.challenge_builder.OSM_API_URL", self.server.base_url + "/api/0.6"):
+            self.assertEqual(fetch_tag_setter("node", 1, "a", "b", http=self.http).user, "alice")
+            http_archive.disable()
+            http_archive.enable("replay", self.archive)
+            self.assertEqual(fetch_tag_setter("node", 1, "a", "b", http=self.http).user, "alice")
+
+    def test_streamed_body_is_recorded_as_it_is_read(self):
+        url = self.server.base_url + "/api/0.6/node/1/history"
+        http_archive.enable("record", self.archive)
+        response = self.http.get(url, stream=True)
+        self.assertFalse(response._content_consumed)
+        self.assertFalse(os.path.exists(self.archive))
+        body = b"".join(response.iter_content(chunk_size=7))
+        self.assertIn(b"alice", body)
+        http_archive.disable()
+        http_archive.enable("replay", self.archive)
+        self.assertEqual(self.http.get(url).content, body)
+
+    def test_body_limit_applies_to_the_bytes_read(self):
+        url = self.server.base_url + "/api/0.6/node/1/history"
+        http_archive.enable("record", self.archive)
+        with patch.object(http_archive, "MAX_RECORDED_BODY", 10):
+            self.assertIn(b"alice", self.http.get(url, stream=True).content)
+        self.assertFalse(os.path.exists(self.archive))
+
+    def test_worker_processes_record_to_their_own_archive(self):
+        url = self.server.base_url + "/api/0.6/node/1.json"
+        http_archive.enable("record", self.archive)
+        worker = multiprocessing.get_context("fork").Process(target=self.http.get, args=(url,))
+        worker.start()
+        worker.join()
+        http_archive.disable()
+        self.assertFalse(os.path.exists(self.archive))
+        self.assertTrue(os.path.exists(f"{self.archive}.{worker.pid}"))
+        requests_before = self.server.request_count
+        http_archive.enable("replay", self.archive)
+        self.assertEqual(self.http.get(url).json()["elements"][0]["id"], 1)
+        self.assertEqual(self.server.request_count, requests_before)
+
+    def test_torn_recording_is_readable(self):
+        http_archive.enable("record", self.archive)
+        self.http.get(self.server.base_url + "/api/0.6/node/1.json")
+        http_archive.disable()
+        with open(self.archive, "ab") as f:
+            f.write(b'{"key": "GET x", "size": 1000}\nabc')
+        archive = http_archive.HttpArchive(self.archive, "replay")
+        self.assertEqual(len(archive._index), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
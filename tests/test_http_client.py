@@ -0,0 +1,83 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch, Mock
+
+import requests
+
+from shared.challenge_builder import HttpClient, RateLimiter
+
+
+class RateLimiterTests(unittest.TestCase):
+    def test_requests_to_same_host_are_spaced(self):
+        limiter = RateLimiter(min_interval=0.05)
+        start = time.monotonic()
+        for _ in range(3):
+            limiter.wait("api.openstreetmap.org")
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+
+    def test_hosts_are_limited_independently(self):
+        limiter = RateLimiter(min_interval=1.0)
+        start = time.monotonic()
+        limiter.wait("a.example")
+        limiter.wait("b.example")
+        self.assertLess(time.monotonic() - start, 0.5)
+
+
+class HttpClientTests(unittest.TestCase):
+    def test_map_keeps_order_and_bounds_concurrency(self):
+        client = HttpClient(max_concurrency=3, min_interval=0)
+        lock = threading.Lock()
+        state = {"running": 0, "peak": 0}
+
+        def work(item):
+            with lock:
+                state["running"] += 1
+                state["peak"] = max(state["peak"], state["running"])
+            time.sleep(0.01)
+            with lock:
+                state["running"] -= 1
+            return item * 2
+
+        self.assertEqual(client.map(work, range(20)), [i * 2 for i in range(20)])
+        self.assertLessEqual(state["peak"], 3)
+
+    @patch("shared.challenge_builder.requests.Session.get")
+    def test_get_uses_pooled_session_with_default_timeout(self, mock_get):
+        mock_get.return_value = Mock(status_code=200)
+        client = HttpClient(min_interval=0, timeout=12)
+        client.get("https://api.openstreetmap.org/api/0.6/node/1.json")
+        mock_get.assert_called_once_with("https://api.openstreetmap.org/api/0.6/node/1.json", timeout=12)
+
+    @patch("shared.challenge_builder.requests.Session.get")
+    def test_get_retries_server_errors_with_backoff(self, mock_get):
+        mock_get.side_effect = [Mock(status_code=503), Mock(status_code=200)]
+        client = HttpClient(min_interval=0, backoff=0.01)
+        self.assertEqual(client.get("https://api.openstreetmap.org/").status_code, 200)
+        self.assertEqual(mock_get.call_count, 2)
+
+    @patch("shared.challenge_builder.time.sleep")
+    @patch("shared.challenge_builder.requests.Session.get")
+    def test_get_waits_as_long_as_retry_after_asks(self, mock_get, mock_sleep):
+        mock_get.side_effect = [
+            Mock(status_code=429, headers={"Retry-After": "7"}),
+            Mock(status_code=503, headers={"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}),
+            Mock(status_code=503, headers={}),
+            Mock(status_code=200),
+        ]
+        client = HttpClient(min_interval=0, backoff=0.5)
+        self.assertEqual(client.get("https://api.openstreetmap.org/").status_code, 200)
+        # A date in the past means no wait; without the header the exponential backoff applies
+        self.assertEqual([c.args[0] for c in mock_sleep.call_args_list], [7.0, 0.0, 2.0])
+
+    @patch("shared.challenge_builder.requests.Session.get")
+    def test_get_gives_up_after_retries(self, mock_get):
+        mock_get.side_effect = requests.ConnectionError()
+        client = HttpClient(min_interval=0, retries=2, backoff=0.01)
+        with self.assertRaises(requests.ConnectionError):
+            client.get("https://api.openstreetmap.org/")
+        self.assertEqual(mock_get.call_count, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import os
+import sys
+import json
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "shared"))
+sys.path.insert(0, os.path.join(REPO_ROOT, "challenges", "imgur404"))
+
+import imgurChecker  # noqa: E402
+
+
+class FakeHttp:
+    """Answers oEmbed requests from a dict of imgur ID -> status code and records the requested IDs."""
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.requested = []
+
+    def get(self, url):
+        imgur_id = url.rsplit("/", 1)[1]
+        self.requested.append(imgur_id)
+        return Mock(status_code=self.statuses[imgur_id], text="")
+
+    def map(self, func, items):
+        return [func(item) for item in items]
+
+
+class ImgurAvailabilityCheckerTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache_file = os.path.join(self.tmpdir.name, "imgur_status.json")
+        self.http = FakeHttp({"alive": 200, "dead": 403, "broken": 500})
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _checker(self, **kwargs):
+        return imgurChecker.ImgurAvailabilityChecker(self.cache_file, http=self.http, **kwargs)
+
+    def test_results_are_cached_and_persisted(self):
+        checker = self._checker()
+        self.assertFalse(checker.is_dead("alive"))
+        self.assertTrue(checker.is_dead("dead"))
+        self.assertTrue(checker.is_dead("dead"))
+        self.assertEqual(self.http.requested, ["alive", "dead"])
+        checker.save()
+        with open(self.cache_file, encoding="utf-8") as f:
+            self.assertEqual({k: v["dead"] for k, v in json.load(f).items()}, {"alive": False, "dead": True})
+        self.assertTrue(self._checker().is_dead("dead"))
+        self.assertEqual(len(self.http.requested), 2)
+
+    def test_expired_results_are_checked_again(self):
+        checker = self._checker(alive_ttl=60, dead_ttl=3600)
+        checker.is_dead("alive")
+        checker.is_dead("dead")
+        with patch.object(imgurChecker.time, "time", return_value=checker.cache["alive"]["checked"] + 120):
+            self.assertIsNone(checker.cached_status("alive"))
+            self.assertTrue(checker.cached_status("dead"))
+
+    def test_prefetch_checks_uncached_ids_and_skips_failures(self):
+        checker = self._checker()
+        checker.is_dead("alive")
+        with self.assertLogs("imgur404.imgurChecker", "WARNING") as logs:
+            checker.prefetch(["alive", "dead", "broken", "dead"])
+        self.assertEqual(len(logs.records), 1)
+        self.assertEqual(self.http.requested, ["alive", "broken", "dead"])
+        self.assertIsNone(checker.cached_status("broken"))
+        self.assertTrue(os.path.exists(self.cache_file))
+        with self.assertRaises(ValueError):
+            checker.is_dead("broken")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import os
+import json
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+
+from shared import instrumentation
+from shared.challenge_builder import ChallengeWriter, GeoFeature, Overpass, OverpassCache, Task
+
+
+class InstrumentationTests(unittest.TestCase):
+    def setUp(self):
+        instrumentation.reset()
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+        instrumentation.reset()
+
+    def test_stage_as_context_manager_and_decorator(self):
+        @instrumentation.stage("work")
+        def work():
+            return 42
+
+        self.assertEqual(work(), 42)
+        with instrumentation.stage("work"):
+            pass
+        stats = instrumentation.report()["stages"]["work"]
+        self.assertEqual(stats["calls"], 2)
+        self.assertGreaterEqual(stats["seconds"], stats["max_seconds"])
+
+    def test_stage_is_recorded_when_the_block_raises(self):
+        with self.assertRaises(KeyError):
+            with instrumentation.stage("failing"):
+                raise KeyError("x")
+        self.assertEqual(instrumentation.report()["stages"]["failing"]["calls"], 1)
+
+    def test_counters(self):
+        instrumentation.count("tasks_skipped")
+        instrumentation.count("tasks_skipped", 2)
+        self.assertEqual(instrumentation.counter("tasks_skipped"), 3)
+        self.assertEqual(instrumentation.counter("unknown"), 0)
+
+    def test_write_report(self):
+        instrumentation.count("http_requests")
+        path = os.path.join(self.tmpdir.name, "report.json")
+        instrumentation.write_report(path)
+        with open(path, encoding="utf-8") as f:
+            report = json.load(f)
+        self.assertEqual(report["counters"], {"http_requests": 1})
+        self.assertIn("wall_seconds", report)
+
+    def test_challenge_writer_counts_tasks(self):
+        path = os.path.join(self.tmpdir.name, "challenge.json")
+        with ChallengeWriter(path, max_tasks=1) as writer:
+            for i in range(2):
+                writer.addTask(Task(GeoFeature.withId("node", i, [1.0, 2.0], {})))
+        report = instrumentation.report()
+        self.assertEqual(report["counters"]["tasks_emitted"], 1)
+        self.assertEqual(report["counters"]["tasks_dropped"], 1)
+        self.assertEqual(report["stages"]["save_challenge"]["calls"], 1)
+
+    def test_overpass_cache_hits_and_requests(self):
+        response = Mock(status_code=200, content=b'{"elements": []}')
+        response.json.return_value = {"elements": []}
+        op = Overpass(cache=OverpassCache(self.tmpdir.name), endpoints=["https://overpass.example/api/interpreter"])
+        with patch("shared.challenge_builder.requests.Session.get", return_value=response):
+            op.getElementsFromQuery("node(1);out;")
+            op.getElementsFromQuery("node(1);out;")
+        report = instrumentation.report()
+        self.assertEqual(report["counters"]["overpass_requests"], 1)
+        self.assertEqual(report["counters"]["overpass_cache_misses"], 1)
+        self.assertEqual(report["counters"]["overpass_cache_hits"], 1)
+        self.assertEqual(report["stages"]["overpass"]["calls"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
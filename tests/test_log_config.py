@@ -0,0 +1,77 @@
+import io
+import os
+import sys
+import tempfile
+import subprocess
+import logging
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import patch
+
+import requests
+
+from shared import http_archive, instrumentation, log_config
+from shared.challenge_builder import GeoFeature
+
+
+class LogConfigTests(unittest.TestCase):
+    def setUp(self):
+        root = logging.getLogger()
+        self._saved = (root.level, list(root.handlers))
+        root.handlers = []
+        instrumentation.reset()
+        self.stream = io.StringIO()
+
+    def tearDown(self):
+        root = logging.getLogger()
+        root.setLevel(self._saved[0])
+        root.handlers = self._saved[1]
+        instrumentation.reset()
+
+    def test_records_are_counted_per_level(self):
+        with patch.dict(os.environ, {"TAGFIXES_LOG_LEVEL": ""}):
+            log_config.setup_logging(stream=self.stream)
+        logger = logging.getLogger("tests.log_config")
+        logger.debug("hidden %s", "detail")
+        logger.info("shown")
+        logger.warning("careful")
+        logger.warning("careful again")
+        self.assertNotIn("hidden", self.stream.getvalue())
+        self.assertIn("INFO tests.log_config: shown", self.stream.getvalue())
+        self.assertEqual(instrumentation.report()["counters"], {"log_info": 1, "log_warning": 2})
+
+    def test_level_from_environment_and_repeated_setup(self):
+        with patch.dict(os.environ, {"TAGFIXES_LOG_LEVEL": "debug"}):
+            self.assertEqual(log_config.setup_logging(stream=self.stream), logging.DEBUG)
+            log_config.setup_logging(stream=self.stream)
+        logging.getLogger("tests.log_config").debug("detail")
+        self.assertEqual(self.stream.getvalue().count("detail"), 1)
+        with patch.dict(os.environ, {"TAGFIXES_LOG_LEVEL": "chatty"}), self.assertRaises(ValueError):
+            log_config.setup_logging()
+
+    def test_features_are_not_printed(self):
+        stdout = io.StringIO()
+        with redirect_stdout(stdout):
+            GeoFeature.withId("node", 1, [1.0, 2.0], {})
+        self.assertEqual(stdout.getvalue(), "")
+
+
+    def test_run_options_are_enabled_by_setup_not_by_import(self):
+        repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            env = dict(os.environ, TAGFIXES_HTTP_MODE="record",
+                       TAGFIXES_HTTP_ARCHIVE=os.path.join(tmpdir, "archive.bin"))
+            imported = subprocess.run(
+                [sys.executable, "-c", "from shared import challenge_builder, http_archive; print(http_archive._archive)"],
+                cwd=repo_root, env=env, capture_output=True, text=True, check=True)
+            self.assertEqual(imported.stdout.strip(), "None")
+            try:
+                with patch.dict(os.environ, env):
+                    log_config.setup_logging(stream=self.stream)
+                self.assertEqual(http_archive._archive.mode, "record")
+                self.assertIs(requests.Session.send, http_archive._archived_send)
+            finally:
+                http_archive.disable()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,7 +2,7 @@ import unittest
 from unittest.mock import patch, Mock
 import xml.etree.ElementTree as ET
 
-from shared.challenge_builder import OscBuilder
+from shared.challenge_builder import HttpClient, OscBuilder
 
 
 def _mock_response(element):
@@ -12,6 +12,19 @@ def _mock_response(element):
     return response
 
 
+def _mock_multi_fetch(elements_by_id, missing=()):
+    def get(url, params=None, **kwargs):
+        response = Mock()
+        ids = [int(i) for i in next(iter(params.values())).split(",")]
+        if any(i in missing for i in ids):
+            response.status_code = 404
+            return response
+        response.status_code = 200
+        response.json.return_value = {"elements": [elements_by_id[i] for i in ids]}
+        return response
+    return get
+
+
 class OscBuilderTests(unittest.TestCase):
     def test_empty_builder_outputs_minimal_xml(self):
         builder = OscBuilder(generator="testgen")
@@ -22,7 +35,7 @@ class OscBuilderTests(unittest.TestCase):
         self.assertEqual(root.attrib["generator"], "testgen")
         self.assertEqual(len(list(root)), 0)
 
-    @patch("shared.challenge_builder.requests.get")
+    @patch("shared.challenge_builder.requests.Session.get")
     def test_remove_object_generates_delete_node(self, mock_get):
         mock_get.return_value = _mock_response({
             "type": "node",
@@ -43,7 +56,7 @@ class OscBuilderTests(unittest.TestCase):
         tags = node.findall("tag")
         self.assertEqual(tags[0].attrib, {"k": "amenity", "v": "cafe"})
 
-    @patch("shared.challenge_builder.requests.get")
+    @patch("shared.challenge_builder.requests.Session.get")
     def test_remove_node_from_way_rewrites_members(self, mock_get):
         mock_get.return_value = _mock_response({
             "type": "way",
@@ -59,7 +72,7 @@ class OscBuilderTests(unittest.TestCase):
         nd_refs = [nd.attrib["ref"] for nd in modify_way.findall("nd")]
         self.assertEqual(nd_refs, ["1", "3"])
 
-    @patch("shared.challenge_builder.requests.get")
+    @patch("shared.challenge_builder.requests.Session.get")
     def test_add_object_to_relation_inserts_at_position(self, mock_get):
         mock_get.return_value = _mock_response({
             "type": "relation",
@@ -81,7 +94,7 @@ class OscBuilderTests(unittest.TestCase):
             [("node", "1", "stop"), ("node", "99", "platform"), ("way", "2", "route")]
         )
 
-    @patch("shared.challenge_builder.requests.get")
+    @patch("shared.challenge_builder.requests.Session.get")
     def test_add_object_to_relation_negative_index(self, mock_get):
         mock_get.return_value = _mock_response({
             "type": "relation",
@@ -102,6 +115,45 @@ class OscBuilderTests(unittest.TestCase):
             [("node", "1", ""), ("node", "2", ""), ("way", "5", "outer")]
         )
 
+    @patch("shared.challenge_builder.requests.Session.get")
+    def test_prefetch_serves_operations_from_memory(self, mock_get):
+        relations = {
+            i: {"type": "relation", "id": i, "version": 1, "members": [{"type": "node", "ref": 1, "role": ""}], "tags": {}}
+            for i in (5, 6)
+        }
+        mock_get.side_effect = _mock_multi_fetch(relations)
+        builder = OscBuilder()
+        builder.prefetch("relation", [5, 6, 5])
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertTrue(mock_get.call_args[0][0].endswith("/relations.json"))
+        self.assertEqual(mock_get.call_args[1]["params"], {"relations": "5,6"})
+        builder.addObjectToRelation(5, "node", 2).removeObjectFromRelation(5, "node", 1).addObjectToRelation(6, "way", 3)
+        self.assertEqual(mock_get.call_count, 1)
+        modified = ET.fromstring(builder.to_string()).find("modify").findall("relation")
+        # Operations on the same relation must not leak into each other through the cache
+        self.assertEqual([m.attrib["ref"] for m in modified[0].findall("member")], ["1", "2"])
+        self.assertEqual([m.attrib["ref"] for m in modified[1].findall("member")], [])
+
+    @patch("shared.challenge_builder.requests.Session.get")
+    def test_prefetch_isolates_missing_ids(self, mock_get):
+        nodes = {i: {"type": "node", "id": i, "version": 1, "lat": 0.0, "lon": 0.0} for i in (1, 2, 3, 4)}
+        mock_get.side_effect = _mock_multi_fetch(nodes, missing={3})
+        builder = OscBuilder()
+        builder.prefetch("node", [1, 2, 3, 4])
+        calls = mock_get.call_count
+        builder.removeObject("node", 1).removeObject("node", 2).removeObject("node", 4)
+        self.assertEqual(mock_get.call_count, calls)
+        deleted = ET.fromstring(builder.to_string()).find("delete").findall("node")
+        self.assertEqual([n.attrib["id"] for n in deleted], ["1", "2", "4"])
+
+    @patch("shared.challenge_builder.requests.Session.get")
+    def test_prefetch_does_not_split_chunks_on_overload(self, mock_get):
+        mock_get.return_value = Mock(status_code=503)
+        builder = OscBuilder(http=HttpClient(retries=0))
+        with self.assertRaises(ValueError):
+            builder.prefetch("node", [1, 2, 3, 4])
+        self.assertEqual(mock_get.call_count, 1)
+
     def test_create_node_uses_negative_id_and_tags(self):
         builder = OscBuilder()
         node_id = builder.createNode(10.0, 20.0, {"amenity": "bench"})
@@ -0,0 +1,61 @@
+import io
+import unittest
+from unittest.mock import patch, Mock
+
+from shared.osm_history import iter_history_versions, find_tag_introduction, fetch_tag_setter
+
+HISTORY_XML = b"""<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+ <node id="1" version="1" user="alice" timestamp="2015-01-01T00:00:00Z" lat="0" lon="0">
+  <tag k="amenity" v="bench"/>
+ </node>
+ <node id="1" version="2" user="bob" timestamp="2018-01-01T00:00:00Z" lat="0" lon="0">
+  <tag k="amenity" v="bench"/>
+  <tag k="image" v="https://i.imgur.com/abc.jpg"/>
+ </node>
+ <node id="1" version="3" user="carol" timestamp="2020-01-01T00:00:00Z" lat="0" lon="0">
+  <tag k="amenity" v="bench"/>
+  <tag k="image" v="https://i.imgur.com/abc.jpg"/>
+ </node>
+</osm>
+"""
+
+
+class OsmHistoryTests(unittest.TestCase):
+    def test_versions_are_parsed_in_order(self):
+        versions = list(iter_history_versions(io.BytesIO(HISTORY_XML)))
+        self.assertEqual([v["version"] for v in versions], [1, 2, 3])
+        self.assertEqual(versions[1]["user"], "bob")
+        self.assertEqual(versions[1]["tags"]["image"], "https://i.imgur.com/abc.jpg")
+        self.assertEqual(versions[0]["tags"], {"amenity": "bench"})
+
+    def test_introducing_version_is_found(self):
+        setter = find_tag_introduction(iter_history_versions(io.BytesIO(HISTORY_XML)), "image", "https://i.imgur.com/abc.jpg")
+        self.assertEqual((setter.user, setter.version, setter.timestamp), ("bob", 2, "2018-01-01T00:00:00Z"))
+        self.assertIsNone(find_tag_introduction(iter_history_versions(io.BytesIO(HISTORY_XML)), "image", "other"))
+
+    def test_parsing_stops_at_introducing_version(self):
+        seen = []
+
+        def versions():
+            for version in iter_history_versions(io.BytesIO(HISTORY_XML)):
+                seen.append(version["version"])
+                yield version
+
+        find_tag_introduction(versions(), "image", "https://i.imgur.com/abc.jpg")
+        self.assertEqual(seen, [1, 2])
+
+    @patch("shared.challenge_builder.requests.Session.get")
+    def test_fetch_streams_the_history(self, mock_get):
+        response = Mock()
+        response.status_code = 200
+        response.raw = io.BytesIO(HISTORY_XML)
+        mock_get.return_value = response
+        setter = fetch_tag_setter("node", 1, "image", "https://i.imgur.com/abc.jpg")
+        self.assertEqual(setter.user, "bob")
+        self.assertTrue(mock_get.call_args.kwargs["stream"])
+        response.close.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
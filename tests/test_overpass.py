@@ -0,0 +1,255 @@
+import os
+import json
+import tempfile
+import time
+import unittest
+from unittest.mock import patch, Mock
+
+from shared import challenge_builder
+from shared.challenge_builder import HttpClient, Overpass, OverpassCache, _iter_json_array
+
+
+def _mock_overpass_response(elements):
+    response = Mock()
+    response.status_code = 200
+    response.content = json.dumps({"elements": elements}).encode("utf-8")
+    response.json.return_value = {"elements": elements}
+    return response
+
+
+class OverpassCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache_dir = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_key_ignores_indentation_and_blank_lines(self):
+        cache = OverpassCache(self.cache_dir)
+        self.assertEqual(
+            cache.key("\n  [out:json];\n\n  node(1);\n  out;\n"),
+            cache.key("[out:json];\nnode(1);\nout;")
+        )
+        self.assertNotEqual(cache.key("node(1);out;"), cache.key("node(2);out;"))
+
+    @patch("shared.challenge_builder.requests.Session.get")
+    def test_second_query_is_served_from_cache(self, mock_get):
+        mock_get.return_value = _mock_overpass_response([{"type": "node", "id": 1}])
+        overpass = Overpass(cache=OverpassCache(self.cache_dir))
+        first = overpass.getElementsFromQuery("node(1);out;")
+        second = overpass.getElementsFromQuery("  node(1);out;  ")
+        self.assertEqual(first, second)
+        self.assertEqual(mock_get.call_count, 1)
+
+    @patch("shared.challenge_builder.requests.Session.get")
+    def test_refresh_only_fetches_and_rewrites(self, mock_get):
+        cache = OverpassCache(self.cache_dir)
+        cache.put("node(1);out;", b'{"elements": [{"type": "node", "id": 1}]}')
+        mock_get.return_value = _mock_overpass_response([{"type": "node", "id": 2}])
+        overpass = Overpass(cache=OverpassCache(self.cache_dir, refresh_only=True))
+        self.assertEqual(overpass.getElementsFromQuery("node(1);out;"), [{"type": "node", "id": 2}])
+        self.assertEqual(json.loads(cache.get("node(1);out;"))["elements"], [{"type": "node", "id": 2}])
+
+    def test_expired_entries_are_misses(self):
+        cache = OverpassCache(self.cache_dir, ttl=60)
+        cache.put("node(1);out;", b'{"elements": []}')
+        path = os.path.join(self.cache_dir, cache.key("node(1);out;") + ".json")
+        old = time.time() - 120
+        os.utime(path, (old, old))
+        self.assertIsNone(cache.get("node(1);out;"))
+        self.assertFalse(os.path.exists(path))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = OverpassCache(self.cache_dir, max_bytes=25)
+        cache.put("a", b"x" * 10)
+        cache.put("b", b"x" * 10)
+        now = time.time()
+        os.utime(os.path.join(self.cache_dir, cache.key("a") + ".json"), (now - 10, now))
+        os.utime(os.path.join(self.cache_dir, cache.key("b") + ".json"), (now - 20, now))
+        cache.put("c", b"x" * 10)
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("c"))
+
+
+def _overpass(endpoints, **kwargs):
+    # Without HttpClient retries, so every response reaches the failover
+    return Overpass(endpoints=endpoints, http=HttpClient(min_interval=0, retries=0), **kwargs)
+
+
+class OverpassRetryTests(unittest.TestCase):
+    @patch("shared.challenge_builder.time.sleep")
+    @patch("shared.challenge_builder.requests.Session.get")
+    def test_fails_over_to_next_endpoint(self, mock_get, mock_sleep):
+        mock_get.side_effect = [Mock(status_code=504, text="busy"), _mock_overpass_response([{"type": "node", "id": 1}])]
+        overpass = _overpass(["https://a.example/api/interpreter", "https://b.example/api/interpreter"])
+        self.assertEqual(overpass.getElementsFromQuery("node(1);out;"), [{"type": "node", "id": 1}])
+        self.assertEqual(mock_get.call_args_list[1].args[0], "https://b.example/api/interpreter")
+        mock_sleep.assert_not_called()
+
+    @patch("shared.challenge_builder.time.sleep")
+    @patch("shared.challenge_builder.requests.Session.get")
+    def test_mirror_specific_errors_fail_over(self, mock_get, mock_sleep):
+        mock_get.side_effect = [Mock(status_code=403, text="forbidden"), Mock(status_code=404, text="not found"),
+                                _mock_overpass_response([])]
+        overpass = _overpass(["https://a.example/api/interpreter", "https://b.example/api/interpreter",
+                                       "https://c.example/api/interpreter"])
+        self.assertEqual(overpass.getElementsFromQuery("node(1);out;"), [])
+        self.assertEqual(mock_get.call_count, 3)
+
+    @patch("shared.challenge_builder.time.sleep")
+    @patch("shared.challenge_builder.requests.Session.get")
+    def test_waits_as_long_as_status_asks(self, mock_get, mock_sleep):
+        status = Mock(status_code=200, text="Rate limit: 2\n0 slots available now.\n"
+                                             "Slot available after: 2024-01-01T00:00:10Z, in 9 seconds.\n"
+                                             "Slot available after: 2024-01-01T00:00:30Z, in 29 seconds.\n")
+        mock_get.side_effect = [Mock(status_code=429, text="Too many requests"), status,
+                                _mock_overpass_response([])]
+        overpass = _overpass(["https://a.example/api/interpreter"])
+        self.assertEqual(overpass.getElementsFromQuery("node(1);out;"), [])
+        self.assertEqual(mock_get.call_args_list[1].args[0], "https://a.example/api/status")
+        mock_sleep.assert_called_once_with(10)
+
+    @patch("shared.challenge_builder.time.sleep")
+    @patch("shared.challenge_builder.requests.Session.get")
+    def test_bad_query_is_not_retried(self, mock_get, mock_sleep):
+        mock_get.return_value = Mock(status_code=400, text="parse error")
+        overpass = _overpass(["https://a.example/api/interpreter", "https://b.example/api/interpreter"])
+        with self.assertRaises(ValueError):
+            overpass.getElementsFromQuery("node(1;out;")
+        self.assertEqual(mock_get.call_count, 1)
+
+    @patch("shared.challenge_builder.time.sleep")
+    @patch("shared.challenge_builder.requests.Session.get")
+    def test_gives_up_after_max_attempts(self, mock_get, mock_sleep):
+        mock_get.return_value = Mock(status_code=503, text="busy")
+        overpass = _overpass(["https://a.example/api/interpreter"], max_attempts=3)
+        with self.assertRaises(ValueError):
+            overpass.getElementsFromQuery("node(1);out;")
+        self.assertEqual(mock_get.call_count, 3)
+        self.assertEqual(mock_sleep.call_count, 2)
+
+    @patch("shared.challenge_builder.requests.Session.get")
+    def test_partial_result_after_runtime_error_is_rejected(self, mock_get):
+        response = _mock_overpass_response([{"type": "node", "id": 1}])
+        response.json.return_value["remark"] = "runtime error: Query timed out in \"query\" at line 3 after 251 seconds."
+        mock_get.return_value = response
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = OverpassCache(cache_dir)
+            with self.assertRaises(ValueError):
+                Overpass(cache=cache, endpoints=["https://a.example/api/interpreter"]).getElementsFromQuery("node(1);out;")
+            self.assertIsNone(cache.get("node(1);out;"))
+
+    @patch("shared.challenge_builder.requests.Session.post")
+    def test_long_queries_are_posted(self, mock_post):
+        mock_post.return_value = _mock_overpass_response([])
+        query = "node(1);" * 500 + "out;"
+        _overpass(["https://a.example/api/interpreter"]).getElementsFromQuery(query)
+        mock_post.assert_called_once()
+        self.assertEqual(mock_post.call_args.kwargs["data"], {"data": query})
+
+
+    @patch("shared.challenge_builder.time.sleep")
+    @patch("shared.challenge_builder.requests.Session.get")
+    def test_busy_endpoint_is_retried_by_the_http_client(self, mock_get, mock_sleep):
+        busy = Mock(status_code=503, text="busy", headers={"Retry-After": "7"})
+        mock_get.side_effect = [busy, _mock_overpass_response([])]
+        http = HttpClient(min_interval=0, retries=1)
+        overpass = Overpass(endpoints=["https://a.example/api/interpreter", "https://b.example/api/interpreter"],
+                            http=http)
+        self.assertEqual(overpass.getElementsFromQuery("node(1);out;"), [])
+        self.assertEqual([c.args[0] for c in mock_get.call_args_list], ["https://a.example/api/interpreter"] * 2)
+        mock_sleep.assert_called_once_with(7.0)
+
+    def test_explicit_endpoints_win_over_the_base_url(self):
+        with patch.object(challenge_builder, "BASE_URL", "http://127.0.0.1:8765"):
+            with patch.dict(os.environ, {"OVERPASS_ENDPOINTS": "https://x.example/api/interpreter"}):
+                self.assertEqual(challenge_builder._overpass_endpoints(), ["https://x.example/api/interpreter"])
+            with patch.dict(os.environ, {"OVERPASS_ENDPOINTS": ""}):
+                self.assertEqual(challenge_builder._overpass_endpoints(), ["http://127.0.0.1:8765/api/interpreter"])
+
+def _chunked(body, size):
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+class StreamingTests(unittest.TestCase):
+    ELEMENTS = [
+        {"type": "node", "id": 1, "tags": {"name": "Straße ✓"}},
+        {"type": "way", "id": 2, "geometry": [{"lat": i / 7, "lon": i / 3} for i in range(2000)]},
+        {"type": "relation", "id": 3, "tags": {"note": "a \"quoted\" ] bracket"}},
+    ]
+
+    def _body(self):
+        return json.dumps({
+            "version": 0.6,
+            "osm3s": {"copyright": "The data included in this document is from www.openstreetmap.org."},
+            "elements": self.ELEMENTS,
+        }, ensure_ascii=False, indent=1).encode("utf-8")
+
+    def test_items_are_decoded_from_tiny_chunks(self):
+        for size in (1, 7, 4096):
+            self.assertEqual(list(_iter_json_array(_chunked(self._body(), size), "elements")), self.ELEMENTS)
+
+    def test_empty_and_truncated_arrays(self):
+        self.assertEqual(list(_iter_json_array([b'{"elements": []}'], "elements")), [])
+        with self.assertRaises(ValueError):
+            list(_iter_json_array([self._body()[:-200]], "elements"))
+        with self.assertRaises(ValueError):
+            list(_iter_json_array([b"<html>error</html>"], "elements"))
+
+    @patch("shared.challenge_builder.requests.Session.get")
+    def test_iter_elements_streams_and_caches(self, mock_get):
+        response = Mock(status_code=200)
+        response.iter_content.return_value = iter(_chunked(self._body(), 1000))
+        mock_get.return_value = response
+        with tempfile.TemporaryDirectory() as cache_dir:
+            overpass = Overpass(cache=OverpassCache(cache_dir))
+            self.assertEqual(list(overpass.iterElementsFromQuery("way(2);out geom;")), self.ELEMENTS)
+            self.assertTrue(mock_get.call_args.kwargs["stream"])
+            self.assertEqual(list(overpass.iterElementsFromQuery("way(2);out geom;")), self.ELEMENTS)
+            self.assertEqual(mock_get.call_count, 1)
+
+    @patch("shared.challenge_builder.requests.Session.get")
+    def test_stream_is_cached_when_the_array_ends_before_the_last_chunk(self, mock_get):
+        body = self._body()[:-1] + b', "remark": "all good"}'
+        for size in (1000, len(body) - 5):
+            mock_get.reset_mock()
+            response = Mock(status_code=200)
+            response.iter_content.return_value = iter(_chunked(body, size))
+            mock_get.return_value = response
+            with tempfile.TemporaryDirectory() as cache_dir:
+                overpass = Overpass(cache=OverpassCache(cache_dir))
+                for _ in range(2):
+                    self.assertEqual(list(overpass.iterElementsFromQuery("way(2);out geom;")), self.ELEMENTS)
+                self.assertEqual(mock_get.call_count, 1)
+
+    @patch("shared.challenge_builder.requests.Session.get")
+    def test_streamed_runtime_error_is_raised_and_not_cached(self, mock_get):
+        body = self._body()[:-1] + b', "remark": "runtime error: Query timed out"}'
+        response = Mock(status_code=200)
+        response.iter_content.return_value = iter(_chunked(body, 1000))
+        mock_get.return_value = response
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = OverpassCache(cache_dir)
+            with self.assertRaisesRegex(ValueError, "timed out"):
+                list(Overpass(cache=cache).iterElementsFromQuery("way(2);out geom;"))
+            self.assertIsNone(cache.get("way(2);out geom;"))
+
+    @patch("shared.challenge_builder.requests.Session.get")
+    def test_abandoned_stream_is_not_cached(self, mock_get):
+        response = Mock(status_code=200)
+        response.iter_content.return_value = iter(_chunked(self._body(), 1000))
+        mock_get.return_value = response
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = OverpassCache(cache_dir)
+            elements = Overpass(cache=cache).iterElementsFromQuery("way(2);out geom;")
+            next(elements)
+            elements.close()
+            self.assertIsNone(cache.get("way(2);out geom;"))
+            self.assertEqual(os.listdir(cache_dir), [])
+            response.close.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,213 @@
+import os
+import sys
+import tempfile
+import unittest
+from collections import deque
+from concurrent.futures import Future
+from contextlib import redirect_stdout
+from io import StringIO
+from types import SimpleNamespace
+from unittest.mock import patch
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "shared"))
+sys.path.insert(0, os.path.join(REPO_ROOT, "challenges", "parking_converter"))
+
+import parking_converter  # noqa: E402
+from challenge_builder import ChallengeWriter  # noqa: E402
+
+
+def convert(tags):
+    with redirect_stdout(StringIO()):
+        return list(parking_converter.convert_base_parking_tags(tags).items())
+
+
+class ConvertBaseParkingTagsTests(unittest.TestCase):
+    # The tag changes are compared as ordered lists: their order ends up in the challenge file
+
+    def test_orientation_and_position(self):
+        self.assertEqual(convert({"parking:lane:right": "parallel", "parking:lane:right:parallel": "on_street"}), [
+            ("parking:right:orientation", "parallel"), ("parking:lane:right", None),
+            ("parking:right", "lane"), ("parking:lane:right:parallel", None),
+        ])
+
+    def test_lay_by_is_rewritten_in_the_input_tags(self):
+        tags = {"parking:lane:both": "diagonal", "parking:lane:both:diagonal": "lay_by"}
+        self.assertEqual(convert(tags), [
+            ("parking:both:orientation", "diagonal"), ("parking:lane:both", None),
+            ("parking:both", "street_side"), ("parking:lane:both:diagonal", None),
+        ])
+        self.assertEqual(tags["parking:lane:both:diagonal"], "street_side")
+
+    def test_marked_differs_by_side(self):
+        self.assertEqual(convert({"parking:lane:left": "marked"}), [
+            ("parking:left:markings", "yes"), ("parking:left", "yes"), ("parking:lane:left", None),
+        ])
+        # The base tag is only added afterwards, for the markings sub tag
+        self.assertEqual(convert({"parking:lane:right": "marked"}), [
+            ("parking:right:markings", "yes"), ("parking:lane:right", None), ("parking:right", "yes"),
+        ])
+
+    def test_position_of_other_orientation_is_left_alone(self):
+        self.assertEqual(convert({"parking:lane:right": "parallel", "parking:lane:right:diagonal": "on_kerb"}), [
+            ("parking:right:orientation", "parallel"), ("parking:lane:right", None), ("parking:right", "yes"),
+        ])
+
+    def test_equal_sides_are_combined(self):
+        self.assertEqual(convert({"parking:lane:right": "no_stopping", "parking:lane:left": "no_stopping"}), [
+            ("parking:right", None), ("parking:right:restriction", None), ("parking:lane:right", None),
+            ("parking:left", None), ("parking:left:restriction", None), ("parking:lane:left", None),
+            ("parking:both", "no"), ("parking:both:restriction", "no_stopping"),
+        ])
+
+    def test_conditions_run_in_table_order(self):
+        tags = {"parking:condition:left": "ticket", "parking:condition:right": "free", "parking:lane:both": "parallel"}
+        self.assertEqual(convert(tags), [
+            ("parking:both:orientation", "parallel"), ("parking:lane:both", None), ("parking:both", "yes"),
+            ("parking:right:fee", "no"), ("parking:condition:right", None),
+            ("parking:left:fee", "yes"), ("parking:left:authentication:ticket", "yes"), ("parking:condition:left", None),
+        ])
+
+    def test_disc_needs_maxstay_and_time_interval(self):
+        tags = {
+            "parking:lane:both": "parallel", "parking:condition:both": "disc",
+            "parking:condition:both:maxstay": "2 h", "parking:condition:both:time_interval": "Mo-Fr 08:00-18:00",
+        }
+        self.assertIn(("parking:both:maxstay:conditional", "2 h @ Mo-Fr 08:00-18:00"), convert(tags))
+        del tags["parking:condition:both:time_interval"]
+        self.assertNotIn("parking:condition:both", dict(convert(tags)))
+
+    def test_condition_capacity_wins(self):
+        tags = {"parking:lane:right": "separate", "parking:lane:right:capacity": "4", "parking:condition:right:capacity": "6"}
+        self.assertEqual(convert(tags), [
+            ("parking:right", "separate"), ("parking:lane:right", None), ("parking:right:capacity", "6"),
+            ("parking:lane:right:capacity", None), ("parking:condition:right:capacity", None),
+        ])
+
+    def test_unknown_values_are_not_converted(self):
+        self.assertEqual(convert({"parking:lane:both": "fire_lane", "highway": "residential"}), [])
+
+
+class ConversionCacheTests(unittest.TestCase):
+    def setUp(self):
+        parking_converter.convert_parking_signature.cache_clear()
+
+    def test_signature_ignores_other_tags(self):
+        a = {"highway": "residential", "name": "A", "parking:lane:both": "parallel"}
+        b = {"highway": "service", "parking:lane:both": "parallel"}
+        self.assertEqual(parking_converter.parking_signature(a), parking_converter.parking_signature(b))
+
+    def test_ways_with_the_same_parking_tags_share_the_conversion(self):
+        tags = {"parking:lane:both": "no", "parking:lane:right:capacity": "3", "parking:lane:left:surface": "paved"}
+        with redirect_stdout(StringIO()):
+            first = parking_converter.convert_parking_signature(parking_converter.parking_signature(tags))
+            second = parking_converter.convert_parking_signature(parking_converter.parking_signature(dict(tags, name="B")))
+        self.assertIs(first, second)
+        tag_changes, breakdown_text, offending = first
+        self.assertEqual(tag_changes, dict(convert(dict(tags))))
+        self.assertIn("parking:lane:both=no =>", breakdown_text)
+        self.assertEqual(offending, {"parking:lane:left:surface": "paved"})
+        self.assertEqual(parking_converter.conversion_cache_hit_rate(), 0.5)
+
+    def test_tag_order_does_not_matter(self):
+        tags = {"parking:lane:both": "parallel", "parking:lane:left:surface": "paved", "parking:lane:right:width": "2"}
+        reordered = dict(reversed(list(tags.items())))
+        self.assertEqual(parking_converter.parking_signature(tags), parking_converter.parking_signature(reordered))
+        with redirect_stdout(StringIO()):
+            _, instruction = parking_converter.convert_element(_way(1, tags))
+            _, reordered_instruction = parking_converter.convert_element(_way(2, reordered))
+        self.assertEqual(parking_converter.conversion_cache_hit_rate(), 0.5)
+        # The offending tags are listed in the order of each way
+        self.assertLess(instruction.index("surface"), instruction.index("width"))
+        self.assertLess(reordered_instruction.index("width"), reordered_instruction.index("surface"))
+
+
+def _way(osm_id, tags):
+    return {"type": "way", "id": osm_id, "tags": tags, "geometry": [{"lat": 52.0, "lon": 13.0}, {"lat": 52.001, "lon": 13.001}]}
+
+
+class ParallelModeTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _write(self, name, write):
+        path = os.path.join(self.tmpdir.name, name)
+        with redirect_stdout(StringIO()), ChallengeWriter(path) as challenge:
+            write(challenge)
+        with open(path, encoding="UTF-8") as f:
+            return f.read()
+
+    def test_parallel_output_matches_serial_output(self):
+        values = ["parallel", "diagonal", "no_stopping", "separate", "marked", "fire_lane"]
+        ways = [_way(i, {"highway": "residential", "parking:lane:right": values[i % len(values)],
+                         "parking:lane:left": values[i // len(values) % len(values)]}) for i in range(120)]
+
+        def serial(challenge):
+            for way in ways:
+                task = parking_converter.build_task(way)
+                if task is not None:
+                    challenge.addTask(task)
+
+        expected = self._write("serial.json", serial)
+        self.assertTrue(expected)
+        self.assertEqual(self._write("parallel.json", lambda c: parking_converter.write_tasks(ways, c, 2)), expected)
+        self.assertEqual(self._write("in_process.json", lambda c: parking_converter.write_tasks(ways, c, 1)), expected)
+
+    def test_records_are_written_in_order_around_ai_results(self):
+        ai_result = Future()
+        pending = deque(["a\n", ai_result, "b\n", None])
+        path = os.path.join(self.tmpdir.name, "ordered.json")
+        with ChallengeWriter(path) as challenge:
+            parking_converter._write_finished(pending, challenge, max_pending=10)
+            self.assertEqual(challenge.taskCount, 1)
+            ai_result.set_result(None)
+            parking_converter._write_finished(pending, challenge)
+        with open(path, encoding="UTF-8") as f:
+            self.assertEqual(f.read(), "a\nb\n")
+
+
+
+class AiAvailableTests(unittest.TestCase):
+    def test_openai_is_required(self):
+        helper = SimpleNamespace(OpenAI=None)
+        with patch.object(parking_converter, "aihelper", helper):
+            self.assertFalse(parking_converter.ai_available())
+            helper.OpenAI = object
+            self.assertTrue(parking_converter.ai_available())
+        with patch.object(parking_converter, "aihelper", None):
+            self.assertFalse(parking_converter.ai_available())
+
+class IterElementsTests(unittest.TestCase):
+    def _iter_elements(self, ways, process_limit):
+        read = []
+
+        def stream(query):
+            for way in ways:
+                read.append(way["id"])
+                yield way
+
+        with patch.object(parking_converter.mrcb, "Overpass") as overpass, \
+                patch.object(parking_converter.mrcb, "OverpassCache"), \
+                patch.object(parking_converter, "PROCESS_LIMIT", process_limit), \
+                patch.object(parking_converter.random, "shuffle", side_effect=lambda items: items.reverse()):
+            overpass.return_value.iterElementsFromQuery.side_effect = stream
+            elements = [way["id"] for way in parking_converter.iter_elements()]
+        return elements, read
+
+    def test_all_ways_are_shuffled_and_the_stream_is_read_to_the_end(self):
+        ways = [_way(i, {}) for i in range(10)]
+        elements, read = self._iter_elements(ways, None)
+        self.assertEqual(elements, list(range(9, -1, -1)))
+        self.assertEqual(read, list(range(10)))
+
+    def test_process_limit_samples_from_the_whole_stream(self):
+        ways = [_way(i, {}) for i in range(10)]
+        elements, read = self._iter_elements(ways, 3)
+        self.assertEqual(len(elements), 3)
+        self.assertEqual(read, list(range(10)))
+
+if __name__ == "__main__":
+    unittest.main()
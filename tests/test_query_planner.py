@@ -0,0 +1,80 @@
+import unittest
+from unittest.mock import Mock
+
+from shared.query_planner import (
+    AREA_PLACEHOLDER, Tile, area_tiles, bbox_tiles, german_state_tiles, run_tiled_query
+)
+
+TEMPLATE = f"""
+[out:json][timeout:250];
+nwr["note"]{AREA_PLACEHOLDER};
+out geom;
+"""
+
+
+class TileTests(unittest.TestCase):
+    def test_area_tile_defines_area_after_settings(self):
+        query = area_tiles({"Berlin": 3600062422})[0].render(TEMPLATE)
+        self.assertIn("[out:json][timeout:250];\narea(id:3600062422)->.tileArea;", query)
+        self.assertIn('nwr["note"](area.tileArea);', query)
+
+    def test_bbox_grid_covers_bbox(self):
+        tiles = bbox_tiles((0.0, 0.0, 2.0, 4.0), rows=2, cols=2)
+        self.assertEqual(len(tiles), 4)
+        self.assertEqual(tiles[0].area_filter, "(0.000000,0.000000,1.000000,2.000000)")
+        self.assertEqual(tiles[-1].area_filter, "(1.000000,2.000000,2.000000,4.000000)")
+        self.assertNotIn("area(", tiles[0].render(TEMPLATE))
+
+    def test_template_without_placeholder_is_rejected(self):
+        with self.assertRaises(ValueError):
+            Tile("x", "(area.tileArea)").render("node(1);out;")
+
+    def test_all_states_are_tiles(self):
+        self.assertEqual(len(german_state_tiles()), 16)
+
+
+class RunTiledQueryTests(unittest.TestCase):
+    def test_results_are_merged_and_deduplicated_in_tile_order(self):
+        overpass = Mock()
+        answers = {
+            "(1)": [{"type": "node", "id": 1}, {"type": "way", "id": 5}],
+            "(2)": [{"type": "way", "id": 5}, {"type": "node", "id": 2}],
+        }
+        overpass.getElementsFromQuery.side_effect = lambda q: answers["(1)" if "(1)" in q else "(2)"]
+        tiles = [Tile("a", "(1)"), Tile("b", "(2)")]
+        elements = run_tiled_query(TEMPLATE, tiles, overpass, max_parallel=2)
+        self.assertEqual([(e["type"], e["id"]) for e in elements], [("node", 1), ("way", 5), ("node", 2)])
+
+    def test_failed_tile_is_retried_alone(self):
+        overpass = Mock()
+        calls = []
+
+        def answer(query):
+            calls.append(query)
+            if "(2)" in query and calls.count(query) == 1:
+                raise ValueError("timeout")
+            return [{"type": "node", "id": 1 if "(1)" in query else 2}]
+
+        overpass.getElementsFromQuery.side_effect = answer
+        elements = run_tiled_query(TEMPLATE, [Tile("a", "(1)"), Tile("b", "(2)")], overpass, max_parallel=1)
+        self.assertEqual([e["id"] for e in elements], [1, 2])
+        self.assertEqual(sum("(1)" in q for q in calls), 1)
+        self.assertEqual(sum("(2)" in q for q in calls), 2)
+
+    def test_tile_failing_every_round_raises(self):
+        overpass = Mock()
+        overpass.getElementsFromQuery.side_effect = ValueError("timeout")
+        with self.assertRaises(ValueError):
+            run_tiled_query(TEMPLATE, [Tile("a", "(1)")], overpass, max_parallel=1, attempts=2)
+        self.assertEqual(overpass.getElementsFromQuery.call_count, 2)
+
+    def test_parallelism_follows_server_rate_limit(self):
+        overpass = Mock()
+        overpass.rateLimit.return_value = 3
+        overpass.getElementsFromQuery.return_value = []
+        run_tiled_query(TEMPLATE, [Tile("a", "(1)")], overpass)
+        overpass.rateLimit.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import json
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from shared.challenge_builder import HttpClient, Overpass, OverpassCache, OscBuilder
+from shared.history_store import HistoryStore
+from shared.osm_history import fetch_tag_setter
+from shared.standin_server import StandinServer
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+class StandinServerTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        root = self.tmpdir.name
+        query = "[out:json];node(1);out;"
+        _write(os.path.join(root, "overpass", OverpassCache(root).key(query) + ".json"),
+               json.dumps({"elements": [{"type": "node", "id": 1}]}))
+        for osm_id in (1, 2):
+            _write(os.path.join(root, "osm", "node", f"{osm_id}.json"),
+                   json.dumps({"elements": [{"type": "node", "id": osm_id, "lat": 0, "lon": 0, "version": 1, "tags": {}}]}))
+        _write(os.path.join(root, "osm", "node", "1", "history.json"),
+               json.dumps({"elements": [{"type": "node", "id": 1, "version": 1, "user": "alice"}]}))
+        _write(os.path.join(root, "osm", "node", "1", "history.xml"),
+               '<osm><node id="1" version="1" user="alice" timestamp="2020-01-01T00:00:00Z"><tag k="a" v="b"/></node></osm>')
+        self.server = StandinServer(root, port=0).start()
+        self.api = self.server.base_url + "/api/0.6"
+        self.http = HttpClient(min_interval=0, retries=0)
+
+    def tearDown(self):
+        self.server.stop()
+        self.tmpdir.cleanup()
+
+    def test_overpass_get_and_post(self):
+        overpass = Overpass(endpoints=[self.server.base_url + "/api/interpreter"])
+        self.assertEqual(overpass.getElementsFromQuery("[out:json];node(1);out;"), [{"type": "node", "id": 1}])
+        with patch("shared.challenge_builder.OVERPASS_POST_THRESHOLD", 0):
+            self.assertEqual(overpass.getElementsFromQuery("[out:json];node(1);out;"), [{"type": "node", "id": 1}])
+        with self.assertRaises(ValueError):
+            overpass.getElementsFromQuery("node(2);out;")
+
+    def test_osm_api_elements_multi_fetch_and_histories(self):
+        with patch("shared.challenge_builder.OSM_API_URL", self.api):
+            builder = OscBuilder(http=self.http)
+            builder.prefetch("node", [1, 2, 3])
+            self.assertEqual(builder._fetch_current_element("node", 2)["id"], 2)
+            store = HistoryStore(os.path.join(self.tmpdir.name, "h.sqlite"), http=self.http)
+            self.assertEqual(store.get_history("node", 1)[0]["user"], "alice")
+            store.close()
+            self.assertEqual(fetch_tag_setter("node", 1, "a", "b", http=self.http).user, "alice")
+
+    def test_injected_errors_are_retried(self):
+        self.server.error_rate = 1.0
+        response = HttpClient(min_interval=0, retries=1, backoff=0.01).get(self.api + "/node/1.json")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.server.request_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
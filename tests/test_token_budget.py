@@ -0,0 +1,81 @@
+import os
+import sys
+import unittest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "challenges", "parking_converter"))
+
+from token_budget import TokenBudgetScheduler  # noqa: E402
+
+
+class TokenBudgetSchedulerTests(unittest.TestCase):
+    def test_reservations_keep_concurrent_requests_within_the_budget(self):
+        scheduler = TokenBudgetScheduler(["mini", "large"], {"mini": 10000, "large": 3000}, tokens_per_request=4000)
+        first, second = scheduler.reserve(), scheduler.reserve()
+        self.assertEqual((first.model, second.model), ("mini", "mini"))
+        # A third request would not fit next to the two in flight
+        self.assertIsNone(scheduler.reserve(["mini"]))
+        scheduler.settle(first, 1000)
+        scheduler.release(second)
+        self.assertEqual(scheduler.spent("mini"), 1000)
+        # The largest real usage is reserved from now on
+        self.assertEqual(scheduler.reserve().tokens, 1000)
+
+    def test_falls_back_to_the_next_model(self):
+        scheduler = TokenBudgetScheduler(["mini", "large"], {"mini": 5000, "large": 5000}, tokens_per_request=2000)
+        scheduler.settle(scheduler.reserve(), 4000)
+        self.assertEqual(scheduler.reserve().model, "large")
+        scheduler.exhaust("large")
+        self.assertIsNone(scheduler.reserve())
+        self.assertFalse(scheduler.available)
+
+    def test_external_quota_is_checked_on_first_use_and_after_recheck_tokens(self):
+        checks = []
+        quota = {"mini": True}
+
+        def has_quota(model):
+            checks.append(model)
+            return quota[model]
+
+        scheduler = TokenBudgetScheduler(["mini"], has_quota=has_quota, recheck_tokens=5000)
+        for _ in range(3):
+            scheduler.settle(scheduler.reserve(), 2000)
+        self.assertEqual(checks, ["mini"])
+        quota["mini"] = False
+        self.assertIsNone(scheduler.reserve())
+        self.assertEqual(checks, ["mini", "mini"])
+        self.assertFalse(scheduler.available)
+
+
+    def test_requests_in_flight_count_towards_the_recheck(self):
+        checks = []
+        scheduler = TokenBudgetScheduler(["mini"], has_quota=lambda model: checks.append(model) or True,
+                                         recheck_tokens=5000, tokens_per_request=2000)
+        self.assertIsNotNone(scheduler.reserve())
+        self.assertEqual(len(checks), 1)
+        # Nothing was settled yet, but the third parallel request crosses the recheck interval
+        for _ in range(3):
+            scheduler.reserve()
+        self.assertEqual(len(checks), 2)
+
+    def test_budget_is_lowered_to_the_remaining_quota_on_first_use(self):
+        asked = []
+        remaining = {"mini": 3000, "large": None}
+
+        def remaining_quota(model):
+            asked.append(model)
+            return remaining[model]
+
+        scheduler = TokenBudgetScheduler(["mini", "large"], {"mini": 10000, "large": 10000},
+                                         remaining_quota=remaining_quota, tokens_per_request=2000)
+        first = scheduler.reserve()
+        self.assertEqual(first.model, "mini")
+        # Only 1000 tokens of the remaining quota are left next to the request in flight
+        self.assertEqual(scheduler.reserve().model, "large")
+        scheduler.settle(first, 2000)
+        self.assertIsNone(scheduler.reserve(["mini"]))
+        self.assertEqual(scheduler.budgets, {"mini": 3000, "large": 10000})
+        self.assertEqual(asked, ["mini", "large"])
+
+if __name__ == "__main__":
+    unittest.main()
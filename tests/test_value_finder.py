@@ -0,0 +1,232 @@
+import os
+import sys
+import json
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import requests
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "shared"))
+sys.path.insert(0, os.path.join(REPO_ROOT, "challenges", "imgur404"))
+
+import valueFinder as vf  # noqa: E402
+
+
+class MatchSinkTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.matches_file = os.path.join(self.tmpdir.name, "matches.jsonl")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_matches_are_buffered_and_appended(self):
+        sink = vf.MatchSink(self.matches_file, buffer_size=2)
+        sink.write({"type": "node", "id": 1})
+        self.assertFalse(os.path.exists(self.matches_file))
+        sink.write({"type": "node", "id": 2, "tags": {"name": "Ä"}})
+        sink.write({"type": "way", "id": 3})
+        sink.close()
+        with open(self.matches_file, encoding="utf-8") as f:
+            self.assertEqual([json.loads(line)["id"] for line in f], [1, 2, 3])
+
+    def test_iter_matches_filters_by_label(self):
+        sink = vf.MatchSink(self.matches_file)
+        sink.write({"type": "node", "id": 1, "matched_patterns": ["imgur"]})
+        sink.write({"type": "node", "id": 2, "matched_patterns": ["flickr"]})
+        # Matches written before patterns were labelled belong to every label
+        sink.write({"type": "node", "id": 3})
+        sink.close()
+        self.assertEqual([e["id"] for e in vf.iter_matches(self.matches_file)], [1, 2, 3])
+        self.assertEqual([e["id"] for e in vf.iter_matches(self.matches_file, label="imgur")], [1, 3])
+        self.assertEqual(list(vf.iter_matches(os.path.join(self.tmpdir.name, "missing.jsonl"))), [])
+
+    def test_export_legacy_matches(self):
+        sink = vf.MatchSink(self.matches_file)
+        for i in range(3):
+            sink.write({"type": "node", "id": i})
+        sink.close()
+        legacy_file = os.path.join(self.tmpdir.name, "matches.json")
+        vf.export_legacy_matches(self.matches_file, legacy_file)
+        with open(legacy_file, encoding="utf-8") as f:
+            self.assertEqual([e["id"] for e in json.load(f)], [0, 1, 2])
+
+
+class PatternMatcherTests(unittest.TestCase):
+    def test_literal_and_exact_patterns(self):
+        matcher = vf.PatternMatcher([
+            vf.TagPattern(label="imgur", pattern="i.imgur.com"),
+            vf.TagPattern(label="fixme", pattern="fixme", match_type=vf.MatchType.EXACT, keys=["note"]),
+        ])
+        self.assertEqual(matcher.match("image", "https://i.imgur.com/abc.jpg"), ["imgur"])
+        # "." is literal unless the pattern is a regex
+        self.assertEqual(matcher.match("image", "https://iXimgur.com/abc.jpg"), [])
+        self.assertEqual(matcher.match("note", "fixme"), ["fixme"])
+        self.assertEqual(matcher.match("note", "fixme later"), [])
+        self.assertEqual(matcher.match("description", "fixme"), [])
+
+    def test_several_labels_can_hit_one_value(self):
+        matcher = vf.PatternMatcher([
+            vf.TagPattern(label="imgur", pattern="imgur.com"),
+            vf.TagPattern(label="image", pattern=r"\.(jpe?g|png)$", regex=True),
+            vf.TagPattern(label="flickr", pattern="flickr.com"),
+        ])
+        self.assertEqual(matcher.match("image", "https://i.imgur.com/abc.jpg"), ["imgur", "image"])
+        self.assertEqual(matcher.match("image", "https://example.org/abc.png"), ["image"])
+
+    def test_backreferences_and_inline_flags_keep_working(self):
+        matcher = vf.PatternMatcher([
+            vf.TagPattern(label="literal", pattern="abc"),
+            vf.TagPattern(label="doubled", pattern=r"(\w)\1", regex=True),
+            vf.TagPattern(label="shouting", pattern="(?i)IMGUR", regex=True, match_type=vf.MatchType.EXACT),
+        ])
+        self.assertEqual(matcher.match("name", "xyyz"), ["doubled"])
+        self.assertEqual(matcher.match("name", "abcd"), ["literal"])
+        self.assertEqual(matcher.match("name", "imgur"), ["shouting"])
+        self.assertEqual(matcher.match("name", "abcc"), ["literal", "doubled"])
+
+    def test_invalid_regex_names_the_pattern(self):
+        with self.assertRaisesRegex(ValueError, "'broken'"):
+            vf.PatternMatcher([vf.TagPattern(label="broken", pattern="a(?i)b", regex=True)])
+
+
+def _way(*locations):
+    # Stands in for an osmium way applied with locations=True; None is a node outside the extract
+    return SimpleNamespace(nodes=[
+        SimpleNamespace(location=SimpleNamespace(valid=lambda ok=loc is not None: ok,
+                                                 lat=loc[0] if loc else 0.0, lon=loc[1] if loc else 0.0))
+        for loc in locations
+    ])
+
+
+class LocalCenterTests(unittest.TestCase):
+    def test_bbox_center(self):
+        bbox = vf.BBox()
+        self.assertTrue(bbox.is_empty())
+        self.assertIsNone(bbox.center())
+        bbox.add(52.0, 13.0)
+        bbox.add(53.0, 14.0)
+        self.assertEqual(bbox.center(), vf.Center(lat=52.5, lon=13.5))
+
+    def test_extend_ignores_empty_boxes(self):
+        bbox = vf.BBox()
+        bbox.extend(vf.BBox())
+        self.assertTrue(bbox.is_empty())
+        other = vf.BBox()
+        other.add(1.0, 2.0)
+        bbox.extend(other)
+        self.assertEqual(bbox.center(), vf.Center(lat=1.0, lon=2.0))
+
+    def test_way_bbox_skips_invalid_locations(self):
+        bbox = vf.way_bbox(_way((50.0, 8.0), None, (52.0, 10.0)))
+        self.assertEqual((bbox.min_lat, bbox.max_lat, bbox.min_lon, bbox.max_lon), (50.0, 52.0, 8.0, 10.0))
+        self.assertIsNone(vf.way_bbox(_way(None)).center())
+
+    def test_location_index_depends_on_expected_nodes_and_workers(self):
+        with tempfile.NamedTemporaryFile(suffix=".osm.pbf") as pbf:
+            pbf.write(b"x" * 80)
+            pbf.flush()
+            # 10 nodes of 16 bytes per scan
+            with patch.object(vf, "LOCATION_INDEX_MEMORY_LIMIT", 320):
+                self.assertEqual(vf.location_index_for(pbf.name, workers=2), "sparse_mem_array")
+                self.assertEqual(vf.location_index_for(pbf.name, workers=3), "sparse_file_array")
+
+    def test_file_backed_index_is_new_and_removed_after_the_pass(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            pbf_file = os.path.join(tmpdir, "a.osm.pbf")
+            with open(pbf_file, "wb") as f:
+                f.write(b"x" * 80)
+            with patch.object(vf, "LOCATION_INDEX_MEMORY_LIMIT", 0):
+                with vf.location_index(pbf_file) as first:
+                    index_type, index_file = first.split(",")
+                    self.assertEqual(index_type, "sparse_file_array")
+                    self.assertEqual(os.path.getsize(index_file), 0)
+                    with vf.location_index(pbf_file) as second:
+                        self.assertNotEqual(second, first)
+                self.assertEqual(os.listdir(tmpdir), ["a.osm.pbf"])
+                with self.assertRaises(RuntimeError), vf.location_index(pbf_file):
+                    raise RuntimeError("scan failed")
+                self.assertEqual(os.listdir(tmpdir), ["a.osm.pbf"])
+            with vf.location_index(pbf_file) as idx:
+                self.assertEqual(idx, "sparse_mem_array")
+
+    def test_extract_is_removed_with_leftover_indexes(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            pbf_file = os.path.join(tmpdir, "a.osm.pbf")
+            for path in (pbf_file, pbf_file + ".x1y2.locations", os.path.join(tmpdir, "b.osm.pbf")):
+                open(path, "wb").close()
+            vf.remove_extract(pbf_file)
+            self.assertEqual(os.listdir(tmpdir), ["b.osm.pbf"])
+
+
+class ScanPipelineTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.matches_file = os.path.join(self.tmpdir.name, "matches.jsonl")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_merge_matches_appends_and_removes_the_part_file(self):
+        part_file = os.path.join(self.tmpdir.name, "a.osm.pbf.matches.jsonl")
+        for osm_id, path in ((1, self.matches_file), (2, part_file)):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"type": "node", "id": osm_id}) + "\n")
+        vf.merge_matches(part_file, self.matches_file)
+        self.assertFalse(os.path.exists(part_file))
+        self.assertEqual([e["id"] for e in vf.iter_matches(self.matches_file)], [1, 2])
+
+    def test_legacy_matches_are_migrated_once(self):
+        legacy_file = os.path.join(self.tmpdir.name, "matches.json")
+        with open(legacy_file, "w", encoding="utf-8") as f:
+            json.dump([{"type": "node", "id": 1}, {"type": "way", "id": 2}], f)
+        with self.assertLogs("imgur404.valueFinder", "INFO"):
+            self.assertTrue(vf.migrate_legacy_matches(legacy_file, self.matches_file))
+        self.assertFalse(vf.migrate_legacy_matches(legacy_file, self.matches_file))
+        self.assertEqual([e["id"] for e in vf.iter_matches(self.matches_file)], [1, 2])
+
+    def test_failed_download_is_skipped(self):
+        done = []
+        cwd = os.getcwd()
+        os.chdir(self.tmpdir.name)
+        try:
+            with patch.object(vf, "download_file", side_effect=requests.ConnectionError("offline")), \
+                    self.assertLogs("imgur404.valueFinder", "WARNING"), patch.object(vf, "tqdm"):
+                vf.run_scan_pipeline(["https://example.org/a.osm.pbf", "https://example.org/b.osm.pbf"],
+                                     on_extract_done=done.append)
+        finally:
+            os.chdir(cwd)
+        self.assertEqual(done, [])
+
+
+    def test_failed_scan_is_skipped(self):
+        def fake_download(url, local_filename):
+            with open(local_filename, "wb") as f:
+                f.write(b"pbf")
+
+        def fake_scan(pbf_file, search_sequence, matches_file, match_type, patterns):
+            if pbf_file.startswith("a."):
+                raise RuntimeError("broken extract")
+            with open(matches_file, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"type": "node", "id": 2}) + "\n")
+
+        done = []
+        cwd = os.getcwd()
+        os.chdir(self.tmpdir.name)
+        try:
+            with patch.object(vf, "download_file", fake_download), patch.object(vf, "scan_extract", fake_scan), \
+                    self.assertLogs("imgur404.valueFinder", "WARNING") as logs, patch.object(vf, "tqdm"):
+                vf.run_scan_pipeline(["https://example.org/a.osm.pbf", "https://example.org/b.osm.pbf"],
+                                     on_extract_done=done.append)
+            self.assertEqual(os.listdir("."), [vf.MATCHES_FILE])
+            self.assertEqual([e["id"] for e in vf.iter_matches(vf.MATCHES_FILE)], [2])
+        finally:
+            os.chdir(cwd)
+        self.assertEqual(done, ["https://example.org/b.osm.pbf"])
+        self.assertIn("broken extract", logs.output[0])
+
+if __name__ == "__main__":
+    unittest.main()